@@ -0,0 +1,97 @@
+# Benchmarks of the mutation and query builders, and of assembling batched documents.
+import datetime
+
+from benchmarks.suite import benchmark
+from trompace import StringConstant, _Neo4jDate
+from trompace.compression import available_encodings, compress
+from trompace.constants import ActionStatusType
+from trompace.mutations import application, audioobject, controlaction, definedterm, digitaldocument, entrypoint, \
+    mediaobject, musiccomposition, person, place, property, rating
+from trompace.mutations.templates import format_batch_mutation
+from trompace.queries import controlaction as query_controlaction, mediaobject as query_mediaobject, \
+    musiccomposition as query_musiccomposition, person as query_person, place as query_place
+from trompace.queries.templates import format_batch_query
+
+NODE = {"title": "Das Lied von der Erde", "contributor": "https://www.cpdl.org", "creator": "https://www.upf.edu",
+        "source": "https://www.cpdl.org/wiki/index.php/Das_Lied_von_der_Erde", "format_": "text/html",
+        "language": "en"}
+
+BUILDERS = {
+    "mutation_create_application": lambda: application.mutation_create_application(
+        application_name="Magic", contributor="UPF", creator="www.upf.edu", source="www.upf.org/magic",
+        subject="magic", language="en", description="Does magic", formatin="audio/wav"),
+    "mutation_create_audio_object": lambda: audioobject.mutation_create_audio_object(
+        **NODE, name="Erde", date=datetime.date(2020, 1, 15), encodingformat="audio/mpeg",
+        contenturl="https://example.com/erde.mp3"),
+    "mutation_create_controlaction": lambda: controlaction.mutation_create_controlaction(
+        "Analyse", ActionStatusType.PotentialActionStatus, "Analyse a file"),
+    "create_defined_term_set": lambda: definedterm.create_defined_term_set(
+        creator="https://www.upf.edu", name="Moods", additionaltype=["https://vocab.trompamusic.eu/vocab#TagCollection"]),
+    "create_defined_term": lambda: definedterm.create_defined_term(
+        creator="https://www.upf.edu", termcode="happy",
+        additionaltype=["https://vocab.trompamusic.eu/vocab#TagCollectionElement"]),
+    "mutation_create_digitaldocument": lambda: digitaldocument.mutation_create_digitaldocument(
+        **NODE, subject="Composition", description="The score"),
+    "mutation_create_entry_point": lambda: entrypoint.mutation_create_entry_point(
+        name="Magic", contributor="UPF", subject="magic", creator="www.upf.edu", source="www.upf.org/magic",
+        language="en", actionPlatform="Platform", contentType=["application/json"], encodingType=["text/html"],
+        formatin="audio/wav", description="Does magic"),
+    "mutation_create_media_object": lambda: mediaobject.mutation_create_media_object(
+        **NODE, name="Erde", encodingformat="audio/mpeg", contenturl="https://example.com/erde.mp3"),
+    "mutation_create_music_composition": lambda: musiccomposition.mutation_create_music_composition(
+        **NODE, name="Erde", position=1),
+    "mutation_create_person": lambda: person.mutation_create_person(
+        **NODE, name="Gustav Mahler", family_name="Mahler", given_name="Gustav", gender="male",
+        birth_date="1860-07-07", death_date="1911-05-18"),
+    "mutation_create_place": lambda: place.mutation_create_place(**NODE, name="Vienna"),
+    "mutation_create_property": lambda: property.mutation_create_property(
+        "Targetfile", "Magic input", [StringConstant("DigitalDocument"), StringConstant("MediaObject")],
+        "A file"),
+    "mutation_create_propertyvaluespecification": lambda: property.mutation_create_propertyvaluespecification(
+        "Output name", "", 100, 0, False, "outputName", "String", True, "How to name the output"),
+    "create_rating": lambda: rating.create_rating(creator="https://www.upf.edu", ratingvalue=4, bestrating=5,
+                                                  worstrating=1, additionaltype=["https://schema.org/Rating"]),
+    "query_controlaction": lambda: query_controlaction.query_controlaction("ff562d2e-2265-4f61-b340-561c92e797e9"),
+    "query_controlaction_lease": lambda: query_controlaction.query_controlaction_lease(
+        "ff562d2e-2265-4f61-b340-561c92e797e9"),
+    "query_mediaobject": lambda: query_mediaobject.query_mediaobject(
+        creator="https://www.upf.edu", encodingformat="audio/mpeg", source="https://example.com"),
+    "query_musiccomposition": lambda: query_musiccomposition.query_musiccomposition(
+        title="Erde", contributor="https://www.cpdl.org", position=1),
+    "query_person": lambda: query_person.query_person(identifier="ff562d2e-2265-4f61-b340-561c92e797e9"),
+    "query_place": lambda: query_place.query_place(title="Vienna", source="https://example.com"),
+}
+
+for _name, _builder in BUILDERS.items():
+    benchmark("builders." + _name)(_builder)
+
+
+@benchmark("builders.neo4jdate")
+def neo4jdate():
+    _Neo4jDate(datetime.date(2020, 1, 15))
+    _Neo4jDate("2020-01-15")
+    _Neo4jDate(2020)
+
+
+BATCH_SIZE = 100
+MUTATIONS = [person.mutation_delete_person("ff562d2e-2265-4f61-b340-{:012d}".format(i)) for i in range(BATCH_SIZE)]
+QUERIES = [query_person.query_person(identifier="ff562d2e-2265-4f61-b340-{:012d}".format(i))
+           for i in range(BATCH_SIZE)]
+
+
+@benchmark("batch.format_batch_mutation", unit=BATCH_SIZE)
+def batch_mutation():
+    format_batch_mutation(MUTATIONS)
+
+
+@benchmark("batch.format_batch_query", unit=BATCH_SIZE)
+def batch_query():
+    format_batch_query(QUERIES)
+
+
+BATCH_BODY = format_batch_mutation(MUTATIONS).encode()
+
+for _encoding in available_encodings():
+    def _compress_batch(encoding=_encoding):
+        compress(BATCH_BODY, encoding)
+    benchmark("batch.compress_" + _encoding, unit=BATCH_SIZE)(_compress_batch)
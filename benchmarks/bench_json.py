@@ -0,0 +1,40 @@
+# Encoding of request bodies and decoding of large batch responses with each installed JSON library.
+import contextlib
+import json
+
+from benchmarks.suite import benchmark
+from trompace import jsoncodec
+from trompace.mutations import person
+from trompace.mutations.templates import format_batch_mutation
+
+BATCH_SIZE = 100
+PEOPLE = 20
+
+# The response of a batch of 100 queries, with 20 people each
+RESPONSE = json.dumps({"data": {f"query{i}": [
+    {"identifier": f"ff562d2e-2265-4f61-b340-{i:06d}{j:06d}", "name": "Gustav Mahler", "title": "Gustav Mahler",
+     "contributor": "https://musicbrainz.org", "creator": "https://www.upf.edu", "birthDate": "1860-07-07",
+     "source": f"https://musicbrainz.org/artist/{i}-{j}", "format": "text/html", "language": "en"}
+    for j in range(PEOPLE)] for i in range(BATCH_SIZE)}}).encode()
+REQUEST = {"query": format_batch_mutation([person.mutation_delete_person(f"ff562d2e-2265-4f61-b340-{i:012d}")
+                                           for i in range(BATCH_SIZE)])}
+
+
+def _codec(codec):
+    """Use a JSON library while a benchmark runs"""
+    @contextlib.contextmanager
+    def setup():
+        previous = jsoncodec.name
+        jsoncodec.use_codec(codec)
+        try:
+            yield
+        finally:
+            jsoncodec.use_codec(previous)
+    return setup
+
+
+for _codec_name in jsoncodec.available_codecs():
+    benchmark(f"json.{_codec_name}.loads_batch_response", setup=_codec(_codec_name),
+              unit=BATCH_SIZE)(lambda _: jsoncodec.loads(RESPONSE))
+    benchmark(f"json.{_codec_name}.dumps_batch_request", setup=_codec(_codec_name),
+              unit=BATCH_SIZE)(lambda _: jsoncodec.dumps(REQUEST))
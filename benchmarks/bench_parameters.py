@@ -0,0 +1,139 @@
+# Micro-benchmark of make_parameters on the arguments of the queries and mutations in tests/data.
+# Run from the root of the repository with: python -m benchmarks.bench_parameters
+import argparse
+import datetime
+import glob
+import json
+import os
+import timeit
+
+from graphql import parse, GraphQLError
+from graphql.language import ast
+
+from benchmarks.suite import benchmark
+from trompace import StringConstant, _Neo4jDate, format_parameters, make_parameters
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "data")
+
+
+def reference_make_parameters(**kwargs):
+    """make_parameters as it was before the single-pass serializer, for comparison"""
+    encoder = json.JSONEncoder()
+    parts = []
+    for k, v in kwargs.items():
+        if isinstance(v, StringConstant):
+            value = v.value
+        elif isinstance(v, datetime.datetime):
+            value = f"{{formatted: {encoder.encode(v.isoformat())}}}"
+        elif isinstance(v, list):
+            items = []
+            for item in v:
+                if isinstance(item, StringConstant):
+                    items.append(item.value)
+                elif isinstance(item, dict):
+                    items.append("{" + reference_make_parameters(**item) + "}")
+                else:
+                    items.append(encoder.encode(item))
+            value = "[{}]".format(", ".join(items))
+        elif isinstance(v, dict):
+            value = "{" + reference_make_parameters(**v) + "}"
+        else:
+            value = encoder.encode(v)
+        parts.append("{}: {}".format(k, value))
+    return "\n        ".join(parts)
+
+
+def _value(node):
+    """Convert a graphql value to the python value that the builders pass to make_parameters"""
+    if isinstance(node, ast.StringValueNode):
+        return node.value
+    if isinstance(node, ast.IntValueNode):
+        return int(node.value)
+    if isinstance(node, ast.FloatValueNode):
+        return float(node.value)
+    if isinstance(node, ast.BooleanValueNode):
+        return node.value
+    if isinstance(node, ast.NullValueNode):
+        return None
+    if isinstance(node, ast.EnumValueNode):
+        return StringConstant(node.value)
+    if isinstance(node, ast.ListValueNode):
+        return [_value(v) for v in node.values]
+    fields = {field.name.value: _value(field.value) for field in node.fields}
+    if set(fields) == {"formatted"}:
+        return datetime.datetime.fromisoformat(fields["formatted"])
+    if set(fields) <= {"year", "month", "day"}:
+        return _Neo4jDate([fields[k] for k in ["year", "month", "day"] if k in fields])
+    return fields
+
+
+def argument_sets():
+    """The arguments of every field in tests/data that has arguments"""
+    sets = []
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, "**", "*.txt"), recursive=True)):
+        with open(path) as f:
+            try:
+                document = parse(f.read())
+            except GraphQLError:
+                continue
+        for definition in document.definitions:
+            for field in definition.selection_set.selections:
+                if getattr(field, "arguments", None):
+                    sets.append({arg.name.value: _value(arg.value) for arg in field.arguments})
+    return sets
+
+
+def large_argument_set(size):
+    """A RequestControlAction-like input with ``size`` nested property objects"""
+    return {"controlAction": {
+        "potentialActionIdentifier": "ca-1",
+        "entryPointIdentifier": "ep-1",
+        "propertyObject": [{"potentialActionPropertyIdentifier": "pro-{}".format(i), "nodeIdentifier": "doc-{}".format(i),
+                            "nodeType": StringConstant("DigitalDocument")} for i in range(size)],
+        "propertyValueObject": [{"potentialActionPropertyValueSpecificationIdentifier": "pvs-1",
+                                 "value": "some \"quoted\" value", "valuePattern": StringConstant("String")}],
+    }}
+
+
+DATA_SETS = argument_sets()
+LARGE_SET = large_argument_set(1000)
+
+
+@benchmark("parameters.tests_data", unit=len(DATA_SETS))
+def parameters_tests_data():
+    for args in DATA_SETS:
+        make_parameters(**args)
+
+
+@benchmark("parameters.large_nested")
+def parameters_large_nested():
+    make_parameters(**LARGE_SET)
+
+
+@benchmark("parameters.large_nested_compact")
+def parameters_large_nested_compact():
+    format_parameters(LARGE_SET, compact=True)
+
+
+def bench(name, func, sets, number):
+    seconds = timeit.timeit(lambda: [func(args) for args in sets], number=number)
+    per_call = seconds / (number * len(sets)) * 1e6
+    print("{:<28} {:>10.2f} us/call".format(name, per_call))
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark make_parameters")
+    parser.add_argument("--number", type=int, default=200, help="number of times to encode each set")
+    args = parser.parse_args()
+
+    for label, sets in [("tests/data", argument_sets()), ("large nested input", [large_argument_set(100)])]:
+        print("{} ({} argument sets)".format(label, len(sets)))
+        reference = bench("reference", lambda a: reference_make_parameters(**a), sets, args.number)
+        current = bench("make_parameters", lambda a: make_parameters(**a), sets, args.number)
+        compact = bench("format_parameters compact", lambda a: format_parameters(a, compact=True), sets, args.number)
+        print("speed-up: {:.2f}x, compact {:.2f}x\n".format(reference / current, reference / compact))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# Time to start a new interpreter and import the modules that the command line scripts use.
+import subprocess
+import sys
+
+from benchmarks.suite import benchmark
+
+MODULES = {"connection": "trompace.connection",
+           "entrypoint_subs": "trompace.application.entrypoint_subs",
+           "client_get_control": "trompace.client.client_get_control"}
+
+
+def _benchmark_import(name, module):
+    @benchmark("startup." + name)
+    def startup():
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+
+
+for _name, _module in MODULES.items():
+    _benchmark_import(_name, _module)
+
+
+@benchmark("startup.python")
+def startup_python():
+    """The time to start the interpreter, to compare the other startup benchmarks with"""
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
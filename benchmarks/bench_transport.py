@@ -0,0 +1,138 @@
+# End-to-end requests per second against a local mock CE, with the sync and async transports, from sync code
+# with a BackgroundClient and a thread pool, and with
+# HTTP/1.1 and HTTP/2 if httpx and hypercorn are installed.
+import asyncio
+import contextlib
+
+import aiohttp
+
+from benchmarks.suite import benchmark
+from tests.mockce import MockCE, mock_ce_config, run_mock_ce
+from trompace.background import BackgroundClient
+from trompace.bulk import RequestTemplate, submit_requests
+from trompace.config import HTTP2_NO, HTTP2_PRIOR_KNOWLEDGE
+from trompace.connection import CEClient, submit_many, submit_query, submit_query_async
+from trompace.queries.person import query_person
+
+REQUESTS = 50
+CONCURRENCY = 10
+QUERY = query_person(identifier="ff562d2e-2265-4f61-b340-561c92e797e9")
+
+
+@contextlib.contextmanager
+def mock_ce():
+    """Run a mock CE with one Person node in a background thread, and point the config at it"""
+    with run_mock_ce() as ce, mock_ce_config(ce):
+        ce.add_node("Person", {"name": "Gustav Mahler"}, identifier="ff562d2e-2265-4f61-b340-561c92e797e9")
+        yield ce
+
+
+@benchmark("transport.sync", setup=mock_ce, unit=REQUESTS)
+def transport_sync(ce):
+    for _ in range(REQUESTS):
+        submit_query(QUERY)
+
+
+async def _submit_all():
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    async with aiohttp.ClientSession() as session:
+        async def submit():
+            async with semaphore:
+                await submit_query_async(QUERY, session=session)
+        await asyncio.gather(*[submit() for _ in range(REQUESTS)])
+
+
+@benchmark("transport.async", setup=mock_ce, unit=REQUESTS)
+def transport_async(ce):
+    asyncio.run(_submit_all())
+
+
+@benchmark("transport.thread_pool", setup=mock_ce, unit=REQUESTS)
+def transport_thread_pool(ce):
+    submit_many([QUERY] * REQUESTS, max_workers=CONCURRENCY)
+
+
+@contextlib.contextmanager
+def background_client():
+    with mock_ce(), BackgroundClient(concurrency=CONCURRENCY) as background:
+        yield background
+
+
+@benchmark("transport.background", setup=background_client, unit=REQUESTS)
+def transport_background(background):
+    background.submit_many([QUERY] * REQUESTS)
+
+
+BULK_REQUESTS = 200
+
+
+@contextlib.contextmanager
+def mock_ce_entrypoint():
+    """Run a mock CE with an entry point whose requested jobs complete immediately"""
+    with run_mock_ce(MockCE(job_duration=0)) as ce, mock_ce_config(ce):
+        ce.add_node("ControlAction", {"name": "Analyse"}, identifier="ca-1")
+        ce.add_node("Property", {"title": "Targetfile"}, identifier="pro-1")
+        ce.add_node("DigitalDocument", {"source": "https://example.com/a.wav"}, identifier="doc-1")
+        yield RequestTemplate("ep-1", "ca-1", {"Targetfile": {"identifier": "pro-1", "nodeType": "DigitalDocument"}},
+                              {})
+
+
+async def _submit_bulk(template):
+    inputs = ({"Targetfile": "doc-1"} for _ in range(BULK_REQUESTS))
+    async for _ in submit_requests(template, inputs, poll_interval=0.01):
+        pass
+
+
+@benchmark("transport.bulk_requests", setup=mock_ce_entrypoint, unit=BULK_REQUESTS)
+def transport_bulk_requests(template):
+    asyncio.run(_submit_bulk(template))
+
+
+try:
+    import httpx  # noqa: F401
+    import hypercorn  # noqa: F401
+except ImportError:
+    httpx = None
+
+
+def _hypercorn_client(http2):
+    @contextlib.contextmanager
+    def setup():
+        """Run a mock CE with hypercorn, which serves both HTTP/1.1 and HTTP/2, and make a client of it"""
+        with run_mock_ce_http2() as ce:
+            ce.add_node("Person", {"name": "Gustav Mahler"}, identifier="ff562d2e-2265-4f61-b340-561c92e797e9")
+            client = CEClient.from_host(ce.url, http2=http2)
+            yield client
+            client.close()
+    return setup
+
+
+async def _submit_all_with_client(client):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    async with client.new_session() as session:
+        async def submit():
+            async with semaphore:
+                await client.submit_query_async(QUERY, session=session)
+        await asyncio.gather(*[submit() for _ in range(REQUESTS)])
+
+
+if httpx is not None:
+    from tests.mockce import run_mock_ce_http2
+
+    @benchmark("transport.hypercorn.async_http11", setup=_hypercorn_client(HTTP2_NO), unit=REQUESTS)
+    def transport_hypercorn_http11(client):
+        asyncio.run(_submit_all_with_client(client))
+
+    @benchmark("transport.hypercorn.async_http2", setup=_hypercorn_client(HTTP2_PRIOR_KNOWLEDGE), unit=REQUESTS)
+    def transport_hypercorn_http2(client):
+        asyncio.run(_submit_all_with_client(client))
+
+    @benchmark("transport.hypercorn.sync_http11", setup=_hypercorn_client(HTTP2_NO), unit=REQUESTS)
+    def transport_hypercorn_sync_http11(client):
+        for _ in range(REQUESTS):
+            client.submit_query(QUERY)
+
+    @benchmark("transport.hypercorn.sync_http2", setup=_hypercorn_client(HTTP2_PRIOR_KNOWLEDGE), unit=REQUESTS)
+    def transport_hypercorn_sync_http2(client):
+        for _ in range(REQUESTS):
+            client.submit_query(QUERY)
@@ -0,0 +1,100 @@
+# Run the benchmarks and compare the results with a stored baseline.
+# Run from the root of the repository with: python -m benchmarks.run
+import argparse
+import fnmatch
+import glob
+import importlib
+import json
+import os
+import platform
+import sys
+
+from benchmarks.suite import BENCHMARKS
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+
+def load_benchmarks():
+    for path in sorted(glob.glob(os.path.join(BENCHMARK_DIR, "bench_*.py"))):
+        importlib.import_module("benchmarks." + os.path.splitext(os.path.basename(path))[0])
+
+
+def run(patterns, repeat, min_time):
+    """Run the benchmarks with a name matching one of the patterns.
+    Returns a dict of benchmark name to seconds per call"""
+    results = {}
+    for name, bench in sorted(BENCHMARKS.items()):
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        seconds = bench.run(repeat=repeat, min_time=min_time)
+        results[name] = seconds
+        print("{:<55} {:>12.2f} us {:>12.0f} ops/s".format(name, seconds * 1e6, bench.unit / seconds))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of each result from the baseline.
+    Returns the names of the benchmarks that are more than ``tolerance`` times slower"""
+    regressions = []
+    print("\n{:<55} {:>12} {:>12} {:>8}".format("benchmark", "baseline us", "current us", "ratio"))
+    for name, seconds in sorted(results.items()):
+        if name not in baseline:
+            print("{:<55} {:>12} {:>12.2f}".format(name, "-", seconds * 1e6))
+            continue
+        ratio = seconds / baseline[name]
+        marker = ""
+        if ratio > tolerance:
+            regressions.append(name)
+            marker = " REGRESSION"
+        print("{:<55} {:>12.2f} {:>12.2f} {:>7.2f}x{}".format(name, baseline[name] * 1e6, seconds * 1e6, ratio,
+                                                              marker))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the trompace-client benchmarks")
+    parser.add_argument("patterns", nargs="*", help="only run benchmarks matching these glob patterns")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timing runs per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timing run")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="fail if a benchmark is this many times slower than the baseline")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    load_benchmarks()
+    results = run(args.patterns, args.repeat, args.min_time)
+    document = {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+        baseline.update(results)
+        document["results"] = baseline
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("\nSaved baseline to {}".format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline at {}, run with --save-baseline to create one".format(args.baseline))
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n{} benchmarks are slower than the baseline: {}".format(len(regressions), ", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# A small benchmark registry and timer used by the benchmark modules and run.py.
+import contextlib
+import timeit
+
+BENCHMARKS = {}
+
+
+class Benchmark:
+    """A function that does one unit of work, timed by calling it repeatedly.
+    If ``setup`` is set, it is a context manager factory, and the value it yields is passed to the function.
+    ``unit`` is the number of operations done by one call, to report operations per second."""
+
+    def __init__(self, name, func, setup=None, unit=1):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.unit = unit
+
+    def run(self, repeat=5, min_time=0.2):
+        """Time the benchmark. Returns the fastest time per call in seconds, over ``repeat`` runs of at
+        least ``min_time`` seconds each"""
+        setup = self.setup() if self.setup else contextlib.nullcontext()
+        with setup as arg:
+            func = (lambda: self.func(arg)) if self.setup else self.func
+            timer = timeit.Timer(func)
+            number, _ = timer.autorange()
+            number = max(number, int(number * min_time / 0.2))
+            times = timer.repeat(repeat=repeat, number=number)
+        return min(times) / number
+
+
+def benchmark(name, setup=None, unit=1):
+    """Register a function as a benchmark, see Benchmark"""
+    def _decorator(func):
+        if name in BENCHMARKS:
+            raise ValueError("duplicate benchmark name {}".format(name))
+        BENCHMARKS[name] = Benchmark(name, func, setup, unit)
+        return func
+    return _decorator
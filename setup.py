@@ -7,6 +7,7 @@ setup(
     name="trompace-client",
     author="Music Technology Group, Universitat Pompeu Fabra",
     install_requires=['requests', 'asyncio', 'aiohttp', 'websockets', 'aiofiles', 'PyJWT>=2.0.0'],
+    extras_require={'tracing': ['opentelemetry-api'], 'http2': ['httpx[http2]'], 'json': ['orjson']},
     description="A python library to read from and write to the Trompa CE",
     long_description=long_description,
     long_description_content_type="text/markdown",
@@ -0,0 +1,523 @@
+# A lightweight, in-memory stand-in for the Contributor Environment, for tests and load testing.
+#
+# It implements the part of the CE API that this client uses: Create/Update/Delete mutations for every type,
+# Add/Merge/Remove link mutations, RequestControlAction, queries of nodes by type with filters, nested
+# selections and inline fragments, the /jwt endpoint, and ControlActionRequest/ControlActionMutation
+# subscriptions over the graphql-ws protocol.
+#
+# Run a server with: python -m tests.mockce --port 4000
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import jwt
+from aiohttp import web, WSMsgType
+from graphql import parse, GraphQLError
+from graphql.language import ast
+
+from trompace.compression import decompress
+
+JWT_SECRET = "mock-contributor-environment-secret"
+
+# Link fields that hold a single node instead of a list of nodes
+SINGLE_LINK_FIELDS = {"nodeValue"}
+
+LINK_PREFIXES = ("Add", "Merge", "Remove")
+
+
+class MockCEError(Exception):
+    pass
+
+
+def _value(node, variables):
+    """Convert a graphql value to a python value. Enum values become strings"""
+    if isinstance(node, ast.VariableNode):
+        return variables.get(node.name.value)
+    if isinstance(node, ast.IntValueNode):
+        return int(node.value)
+    if isinstance(node, ast.FloatValueNode):
+        return float(node.value)
+    if isinstance(node, ast.NullValueNode):
+        return None
+    if isinstance(node, ast.ListValueNode):
+        return [_value(v, variables) for v in node.values]
+    if isinstance(node, ast.ObjectValueNode):
+        return {field.name.value: _value(field.value, variables) for field in node.fields}
+    return node.value
+
+
+def _arguments(field, variables):
+    return {arg.name.value: _value(arg.value, variables) for arg in field.arguments or []}
+
+
+def _lower_first(name):
+    return name[0].lower() + name[1:]
+
+
+class Throttle:
+    """Allow ``rate`` requests per second, with bursts of up to ``rate`` requests"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class MockCE:
+    """An in-memory graph of nodes that answers the queries and mutations of the client.
+
+    Nodes are dicts with an ``identifier``, a ``__typename``, their scalar fields, and their links to other
+    nodes, stored as lists of identifiers. Failures can be injected to test how clients deal with a slow or
+    unreliable CE:
+
+    Arguments:
+        latency: seconds to wait before answering each request, or a (min, max) tuple for a random latency
+        error_rate: the fraction of requests that fail with a GraphQL error
+        http_error_rate: the fraction of requests that fail with an HTTP 500 error
+        max_requests_per_second: if set, requests above this rate fail with an HTTP 429 error
+        require_auth: if True, mutations need a token from the /jwt endpoint
+        job_duration: if set, jobs created with RequestControlAction are completed after this many seconds
+        seed: the seed of the random numbers used to inject failures, for reproducible runs
+        compress_responses: if True, compress responses with an encoding from the Accept-Encoding of the request,
+           and send them with chunked transfer encoding
+        max_request_bytes: if set, requests with a larger body fail with an HTTP 413 error
+
+    The Content-Encoding of the body of each request, or None, is added to ``request_encodings``.
+    """
+
+    def __init__(self, latency=0, error_rate=0.0, http_error_rate=0.0, max_requests_per_second=None,
+                 require_auth=False, job_duration=None, seed=None, compress_responses=False, max_request_bytes=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.throttle = Throttle(max_requests_per_second) if max_requests_per_second else None
+        self.require_auth = require_auth
+        self.job_duration = job_duration
+        self.random = random.Random(seed)
+        self.compress_responses = compress_responses
+        self.max_request_bytes = max_request_bytes
+
+        self.nodes = {}
+        self.requests = 0
+        self.http_versions = []
+        self.request_encodings = []
+        self.mutations = 0
+        self.throttled = 0
+        self._subscriptions = {}
+
+    # Graph
+
+    def add_node(self, typename, fields=None, identifier=None):
+        """Add a node to the graph. Returns the node"""
+        node = dict(fields or {})
+        node["identifier"] = identifier or node.get("identifier") or str(uuid.uuid4())
+        node["__typename"] = typename
+        self.nodes[node["identifier"]] = node
+        return node
+
+    def link(self, from_id, field, to_id):
+        node = self._get(from_id)
+        self._get(to_id)
+        if field in SINGLE_LINK_FIELDS:
+            node[field] = to_id
+        else:
+            links = node.setdefault(field, [])
+            if not isinstance(links, list):
+                raise MockCEError(f"{field} of {from_id} is not a link")
+            if to_id not in links:
+                links.append(to_id)
+
+    def _get(self, identifier):
+        if identifier not in self.nodes:
+            raise MockCEError(f"node with identifier {identifier} not found")
+        return self.nodes[identifier]
+
+    def _select(self, node, selection_set):
+        """Project a node on a selection set, following links to other nodes"""
+        if selection_set is None:
+            return node
+        result = {}
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.InlineFragmentNode):
+                if selection.type_condition.name.value == node.get("__typename"):
+                    result.update(self._select(node, selection.selection_set))
+                continue
+            name = selection.name.value
+            alias = selection.alias.value if selection.alias else name
+            value = node.get(name)
+            if selection.selection_set is not None and name in node and not isinstance(value, dict):
+                if name in SINGLE_LINK_FIELDS:
+                    value = self._select(self.nodes[value], selection.selection_set) if value in self.nodes else None
+                else:
+                    value = [self._select(self.nodes[v], selection.selection_set) for v in value or []
+                             if v in self.nodes]
+            elif isinstance(value, dict):
+                value = self._select(value, selection.selection_set)
+            elif selection.selection_set is not None and value is None:
+                value = None if name in SINGLE_LINK_FIELDS else []
+            result[alias] = value
+        return result
+
+    # Operations
+
+    def _query(self, field, variables):
+        typename = field.name.value
+        filters = _arguments(field, variables)
+        found = [node for node in self.nodes.values() if node["__typename"] == typename
+                 and all(node.get(k) == v for k, v in filters.items())]
+        return [self._select(node, field.selection_set) for node in found]
+
+    def _mutate(self, field, variables):
+        name = field.name.value
+        args = _arguments(field, variables)
+        if name == "RequestControlAction":
+            return self._select(self._request_controlaction(args["controlAction"]), field.selection_set)
+        if name.startswith("Create"):
+            node = self.add_node(name[len("Create"):], args)
+            return self._select(node, field.selection_set)
+        if name.startswith("Update"):
+            node = self._get(args.pop("identifier"))
+            node.update(args)
+            if node["__typename"] == "ControlAction":
+                self._publish("ControlActionMutation", node, identifier=node["identifier"])
+            return self._select(node, field.selection_set)
+        if name.startswith("Delete"):
+            node = self.nodes.pop(self._get(args["identifier"])["identifier"])
+            return self._select(node, field.selection_set)
+        if name.startswith(LINK_PREFIXES):
+            return self._link_mutation(name, args, field.selection_set)
+        raise MockCEError(f"unknown mutation {name}")
+
+    def _link_field(self, name, from_node):
+        """The name of the field that a link mutation changes, e.g. MergePersonBirthPlace -> birthPlace,
+        AddThingInterfacePotentialAction -> potentialAction"""
+        rest = name[len(next(p for p in LINK_PREFIXES if name.startswith(p))):]
+        words = re.findall(r"[A-Z][a-z0-9]*", rest)
+        for i in range(1, len(words)):
+            prefix = "".join(words[:i])
+            if prefix == from_node["__typename"] or prefix.endswith("Interface"):
+                return _lower_first("".join(words[i:]))
+        raise MockCEError(f"{name} can't link a {from_node['__typename']}")
+
+    def _link_mutation(self, name, args, selection_set):
+        from_id = args["from"]["identifier"]
+        to_id = args["to"]["identifier"]
+        from_node = self._get(from_id)
+        to_node = self._get(to_id)
+        field = self._link_field(name, from_node)
+        if name.startswith("Remove"):
+            links = from_node.get(field)
+            if isinstance(links, list) and to_id in links:
+                links.remove(to_id)
+            elif links == to_id:
+                del from_node[field]
+        else:
+            self.link(from_id, field, to_id)
+        return self._select({"from": from_node, "to": to_node}, selection_set)
+
+    def _request_controlaction(self, request):
+        potential = self._get(request["potentialActionIdentifier"])
+        job = self.add_node("ControlAction", {"name": potential.get("name"), "description": potential.get("description"),
+                                              "actionStatus": "PotentialActionStatus", "object": []})
+        for obj in request.get("propertyObject") or []:
+            prop = self._get(obj["potentialActionPropertyIdentifier"])
+            value = self.add_node("PropertyValue", {"name": prop.get("title"), "title": prop.get("title")})
+            self.link(value["identifier"], "nodeValue", obj["nodeIdentifier"])
+            job["object"].append(value["identifier"])
+        for obj in request.get("propertyValueObject") or []:
+            pvs = self._get(obj["potentialActionPropertyValueSpecificationIdentifier"])
+            value = self.add_node("PropertyValue", {"name": pvs.get("valueName"), "title": pvs.get("title"),
+                                                    "value": obj.get("value"), "valuePattern": obj.get("valuePattern")})
+            job["object"].append(value["identifier"])
+        self._publish("ControlActionRequest", job, entryPointIdentifier=request["entryPointIdentifier"])
+        if self.job_duration is not None:
+            asyncio.get_event_loop().call_later(self.job_duration, self._complete_job, job["identifier"])
+        return job
+
+    def _complete_job(self, identifier):
+        job = self.nodes.get(identifier)
+        if job and job["actionStatus"] not in ("CompletedActionStatus", "FailedActionStatus"):
+            job["actionStatus"] = "CompletedActionStatus"
+            self._publish("ControlActionMutation", job, identifier=identifier)
+
+    def execute(self, query, variables=None, authorised=True):
+        """Execute a query or mutation. Returns the response document"""
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            return {"errors": [{"message": e.message}]}
+        data = {}
+        errors = []
+        for definition in document.definitions:
+            operation = definition.operation.value
+            for field in definition.selection_set.selections:
+                alias = field.alias.value if field.alias else field.name.value
+                try:
+                    if operation == "mutation":
+                        if self.require_auth and not authorised:
+                            raise MockCEError("Not Authorised!")
+                        self.mutations += 1
+                        data[alias] = self._mutate(field, variables or {})
+                    elif operation == "query":
+                        data[alias] = self._query(field, variables or {})
+                    else:
+                        raise MockCEError(f"{operation} is not supported over HTTP")
+                except (MockCEError, KeyError) as e:
+                    data[alias] = None
+                    errors.append({"message": str(e), "path": [alias]})
+        response = {"data": data}
+        if errors:
+            response["errors"] = errors
+        return response
+
+    # Subscriptions
+
+    def _publish(self, name, node, **filters):
+        for (ws, sub_id), (field, sub_filters) in list(self._subscriptions.items()):
+            if field.name.value != name or any(sub_filters.get(k) != v for k, v in filters.items()):
+                continue
+            alias = field.alias.value if field.alias else name
+            payload = {"data": {alias: self._select(node, field.selection_set)}}
+            message = {"type": "data", "id": sub_id, "payload": payload}
+            asyncio.ensure_future(ws.send_str(json.dumps(message)))
+
+    # HTTP
+
+    def _authorised(self, header):
+        if not header.startswith("Bearer "):
+            return False
+        try:
+            jwt.decode(header[len("Bearer "):], JWT_SECRET, algorithms=["HS256"])
+            return True
+        except jwt.InvalidTokenError:
+            return False
+
+    async def _delay(self):
+        latency = self.latency
+        if isinstance(latency, tuple):
+            latency = self.random.uniform(*latency)
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def handle_graphql(self, request):
+        if request.method == "GET" and request.headers.get("Upgrade", "").lower() == "websocket":
+            return await self.handle_websocket(request)
+        self.requests += 1
+        self.request_encodings.append(request.headers.get("Content-Encoding"))
+        if self.throttle and not self.throttle.allow():
+            self.throttled += 1
+            return web.json_response({"errors": [{"message": "Too many requests"}]}, status=429,
+                                     headers={"Retry-After": "1"})
+        await self._delay()
+        if self.max_request_bytes and (request.content_length or 0) > self.max_request_bytes:
+            return web.Response(status=413, text="Payload Too Large")
+        if self.http_error_rate and self.random.random() < self.http_error_rate:
+            return web.Response(status=500, text="Internal Server Error")
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.json_response({"data": None, "errors": [{"message": "Injected error"}]})
+        # aiohttp decompresses the body of the request if it has a Content-Encoding
+        body = await request.json()
+        response = web.json_response(self.execute(body.get("query", ""), body.get("variables"),
+                                                  self._authorised(request.headers.get("Authorization", ""))))
+        if self.compress_responses:
+            # Like a CE behind a proxy that compresses responses on the fly, without a Content-Length
+            response.enable_compression()
+            response.enable_chunked_encoding()
+        return response
+
+    async def handle_jwt(self, request):
+        body = await request.json()
+        if not body.get("id") or not body.get("apiKey"):
+            return web.json_response({"success": False, "error": "missing id or apiKey"})
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=12)
+        token = jwt.encode({"id": body["id"], "scopes": body.get("scopes", []), "exp": expires}, JWT_SECRET,
+                           algorithm="HS256")
+        return web.json_response({"success": True, "jwt": token})
+
+    async def handle_websocket(self, request):
+        ws = web.WebSocketResponse(protocols=["graphql-ws"])
+        await ws.prepare(request)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                message = json.loads(msg.data)
+                if message.get("type") == "connection_init":
+                    await ws.send_str(json.dumps({"type": "connection_ack"}, separators=(",", ":")))
+                elif message.get("type") == "start":
+                    document = parse(message["payload"]["query"])
+                    field = document.definitions[0].selection_set.selections[0]
+                    self._subscriptions[(ws, message["id"])] = (field, _arguments(field, {}))
+                elif message.get("type") == "stop":
+                    self._subscriptions.pop((ws, message["id"]), None)
+                elif message.get("type") == "connection_terminate":
+                    break
+        finally:
+            for key in [key for key in self._subscriptions if key[0] is ws]:
+                del self._subscriptions[key]
+        return ws
+
+    async def asgi(self, scope, receive, send):
+        """Answer GraphQL requests as an ASGI application, to serve the mock CE over HTTP/2 with hypercorn.
+        The HTTP version of each request is added to ``http_versions``"""
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        self.requests += 1
+        self.http_versions.append(scope["http_version"])
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await self._delay()
+        headers = {name.decode().lower(): value.decode() for name, value in scope["headers"]}
+        self.request_encodings.append(headers.get("content-encoding"))
+        if "content-encoding" in headers:
+            body = decompress(body, headers["content-encoding"])
+        body = json.loads(body)
+        response = self.execute(body.get("query", ""), body.get("variables"),
+                                self._authorised(headers.get("authorization", "")))
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps(response).encode()})
+
+    def make_app(self):
+        app = web.Application()
+        for path in ["/", "/graphql"]:
+            app.router.add_route("*", path, self.handle_graphql)
+        app.router.add_post("/jwt", self.handle_jwt)
+        return app
+
+
+@contextlib.contextmanager
+def run_mock_ce(mock_ce=None, host="127.0.0.1", port=0):
+    """Run a MockCE in a background thread. Yields the MockCE, with ``url`` and ``websocket_url`` attributes"""
+    mock_ce = mock_ce or MockCE()
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(mock_ce.make_app(), access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, host, port)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    mock_ce.url = "http://{}:{}/".format(host, port)
+    mock_ce.websocket_url = "ws://{}:{}/graphql".format(host, port)
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield mock_ce
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+@contextlib.contextmanager
+def run_mock_ce_http2(mock_ce=None, host="127.0.0.1"):
+    """Run a MockCE with hypercorn in a background thread. It serves HTTP/1.1, and HTTP/2 without TLS to
+    clients that use HTTP/2 with prior knowledge. Needs the hypercorn package.
+    Yields the MockCE, with a ``url`` attribute"""
+    import socket
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    mock_ce = mock_ce or MockCE()
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        port = sock.getsockname()[1]
+    config = Config()
+    config.bind = ["{}:{}".format(host, port)]
+    config.accesslog = None
+    config.errorlog = None
+    # Hypercorn closes a connection after 1000 requests by default, which would end benchmark runs
+    config.keep_alive_max_requests = 10 ** 9
+    mock_ce.url = "http://{}:{}/".format(host, port)
+
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    shutdown = None
+
+    async def run():
+        nonlocal shutdown
+        shutdown = asyncio.Event()
+        server = asyncio.ensure_future(serve(mock_ce.asgi, config, shutdown_trigger=shutdown.wait))
+        # Wait until the port accepts connections
+        while not server.done():
+            try:
+                _, writer = await asyncio.open_connection(host, port)
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.01)
+        started.set()
+        await server
+
+    thread = threading.Thread(target=loop.run_until_complete, args=(run(),), daemon=True)
+    thread.start()
+    started.wait()
+    try:
+        yield mock_ce
+    finally:
+        loop.call_soon_threadsafe(shutdown.set)
+        thread.join()
+        loop.close()
+
+
+@contextlib.contextmanager
+def mock_ce_config(mock_ce):
+    """Point the global client config at a running MockCE"""
+    from trompace.config import config
+    saved = config.host, config.websocket_host, config.server_auth_required
+    config.host = mock_ce.url
+    config.websocket_host = mock_ce.websocket_url
+    config.server_auth_required = mock_ce.require_auth
+    try:
+        yield config
+    finally:
+        config.host, config.websocket_host, config.server_auth_required = saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Contributor Environment")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--latency", type=float, default=0, help="seconds to wait before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests with a GraphQL error")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="fraction of requests with an HTTP 500")
+    parser.add_argument("--max-requests-per-second", type=float, help="throttle requests above this rate")
+    parser.add_argument("--require-auth", action="store_true", help="require a token from /jwt for mutations")
+    parser.add_argument("--job-duration", type=float, help="complete requested jobs after this many seconds")
+    parser.add_argument("--seed", type=int, help="seed for injected failures")
+    parser.add_argument("--compress-responses", action="store_true", help="compress responses with gzip or deflate")
+    parser.add_argument("--max-request-bytes", type=int, help="reject larger requests with an HTTP 413")
+    args = parser.parse_args()
+    mock_ce = MockCE(latency=args.latency, error_rate=args.error_rate, http_error_rate=args.http_error_rate,
+                     max_requests_per_second=args.max_requests_per_second, require_auth=args.require_auth,
+                     job_duration=args.job_duration, seed=args.seed, compress_responses=args.compress_responses,
+                     max_request_bytes=args.max_request_bytes)
+    web.run_app(mock_ce.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
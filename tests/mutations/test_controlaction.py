@@ -1,4 +1,5 @@
 # Tests for mutations pertaining to control action objects.
+import datetime
 import os
 
 import pytest
@@ -55,6 +56,13 @@ class TestControlAction(CeTestCase):
                                                          error="Failed to do a thing")
         self.assert_queries_equal(ca, expected)
 
+        # The end of the job replaces the expiry of the lease in endTime
+        end_time = datetime.datetime(2020, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        ca = controlaction.mutation_modify_controlaction("93982f65-005d-4d69-9731-6079d2489598",
+                                                         ActionStatusType.FailedActionStatus,
+                                                         error="Failed to do a thing", end_time=end_time)
+        assert 'endTime: {formatted: "2020-05-01T12:00:00+00:00"}' in ca
+
     def test_update_controlaction_invalid_status(self):
         """An invalid status for the ControlAction raises an Exception"""
         with pytest.raises(trompace.exceptions.InvalidActionStatusException):
@@ -75,3 +83,11 @@ class TestControlAction(CeTestCase):
         created_match = controlaction.mutation_add_propertyvaluespecification_potentialaction("ff562d2e-2265-4f61-b340-561c92e797e9",
                                                                               "59ce8093-5e0e-4d59-bfa6-805edb11e396")
         self.assert_queries_equal(created_match, expected)
+
+    def test_claim_controlaction(self):
+        expected = self.read_file(os.path.join(self.data_dir, "claim_controlaction.txt"))
+
+        start_time = datetime.datetime(2020, 5, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc)
+        claim = controlaction.mutation_claim_controlaction("93982f65-005d-4d69-9731-6079d2489598", start_time,
+                                                           start_time + datetime.timedelta(seconds=60))
+        self.assert_queries_equal(claim, expected)
@@ -1,7 +1,14 @@
+import datetime
+import decimal
+import uuid
 import unittest
 
 from datetime import date
-from trompace import make_parameters, StringConstant, _Neo4jDate
+
+from graphql import parse, value_from_ast_untyped
+
+from trompace import make_parameters, format_parameters, StringConstant, ListConstant, _Neo4jDate
+from trompace.constants import ActionStatusType
 
 
 class TestMakeParameters(unittest.TestCase):
@@ -41,6 +48,16 @@ class TestMakeParameters(unittest.TestCase):
         expected = '''name: "My thing"\n        items: ["val1", "val2"]'''
         assert expected == made_params
 
+    def test_list_constant(self):
+        params = {"items": ListConstant(["one", "two"])}
+        assert make_parameters(**params) == "items: [one, two]"
+
+    def test_compact(self):
+        """In compact mode, parameters are only separated by a space"""
+        params = {"name": "My thing", "object": {"language": StringConstant("en"), "items": [1, 2]}}
+        made_params = format_parameters(params, compact=True)
+        assert made_params == 'name: "My thing" object: {language: en items: [1, 2]}'
+
     def test_Neo4jDate(self):
         """Neo4jDate values should output a date format with dateparts year, month and day encapsulated in {}"""
         params = {"date": _Neo4jDate(date(2020, 1, 15))}
@@ -78,3 +95,69 @@ class TestMakeParameters(unittest.TestCase):
         made_params = make_parameters(**params)
         expected = '''date: { year: 2020 month: 1 day: 15 }'''
         assert expected == made_params, "Year, month, day and more values did not output a date"
+
+
+def parse_arguments(params):
+    """Parse parameters made by make_parameters with graphql-core, and return them as python values"""
+    document = parse("mutation {{ Test({}) {{ identifier }} }}".format(params))
+    field = document.definitions[0].selection_set.selections[0]
+    return {argument.name.value: value_from_ast_untyped(argument.value) for argument in field.arguments}
+
+
+class TestNestedParameters(unittest.TestCase):
+    """Parameters made by make_parameters are parsed back to the same values by graphql-core"""
+
+    def test_nested_objects(self):
+        params = {
+            "controlAction": {
+                "potentialActionIdentifier": "ca-1",
+                "propertyObject": [{"nodeIdentifier": "doc-1", "nodeType": StringConstant("DigitalDocument")},
+                                   {"nodeIdentifier": "doc-2", "nodeType": StringConstant("MediaObject")}],
+                "propertyValueObject": [{"value": "out", "valuePattern": StringConstant("String")}]
+            }
+        }
+        expected = {
+            "controlAction": {
+                "potentialActionIdentifier": "ca-1",
+                "propertyObject": [{"nodeIdentifier": "doc-1", "nodeType": "DigitalDocument"},
+                                   {"nodeIdentifier": "doc-2", "nodeType": "MediaObject"}],
+                "propertyValueObject": [{"value": "out", "valuePattern": "String"}]
+            }
+        }
+        assert parse_arguments(make_parameters(**params)) == expected
+
+    def test_nested_lists(self):
+        params = {"matrix": [[1, 2], [3, [4.5, None]]], "flags": [True, False]}
+        assert parse_arguments(make_parameters(**params)) == params
+
+    def test_escaped_strings(self):
+        """Backslashes, quotes, newlines and braces in values are kept as they are"""
+        values = ['C:\\music\\track.mp3', 'a "quoted" {value}', "line\nbreak", "unicode \u00e9\u266b"]
+        params = {"values": values, "nested": {"value": values[1]}}
+        assert parse_arguments(make_parameters(**params)) == params
+
+    def test_enum(self):
+        params = {"actionStatus": ActionStatusType.CompletedActionStatus,
+                  "statuses": [ActionStatusType.ActiveActionStatus]}
+        assert make_parameters(**params) == "actionStatus: CompletedActionStatus\n        " \
+                                            "statuses: [ActiveActionStatus]"
+        assert parse_arguments(make_parameters(**params)) == {"actionStatus": "CompletedActionStatus",
+                                                              "statuses": ["ActiveActionStatus"]}
+
+    def test_datetime_in_object(self):
+        when = datetime.datetime(2020, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        params = {"lease": {"endTime": when}}
+        assert parse_arguments(make_parameters(**params)) == \
+            {"lease": {"endTime": {"formatted": "2020-05-01T12:00:00+00:00"}}}
+
+    def test_numbers(self):
+        params = {"position": 1.5, "count": 3, "big": 10 ** 20}
+        assert make_parameters(**params) == "position: 1.5\n        count: 3\n        big: 100000000000000000000"
+        with self.assertRaises(ValueError):
+            make_parameters(position=float("nan"))
+
+    def test_unsupported_types(self):
+        """Values that GraphQL has no literal for are rejected, whatever JSON library is installed"""
+        for value in [date(2020, 1, 15), uuid.UUID(int=1), decimal.Decimal("1.5"), {1, 2}, object()]:
+            with self.assertRaises(TypeError):
+                make_parameters(value=value)
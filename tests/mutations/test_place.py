@@ -29,7 +29,7 @@ class TestPlace(CeTestCase):
         assert expected == mutation
 
     def test_mutation_delete_place(self):
-        expected = """mutation {
+        expected = """mutation DeletePlace {
   DeletePlace(
 identifier: "placeid"
 ) {
@@ -40,7 +40,7 @@ identifier
         assert mutation == expected
 
     def test_mutation_merge_person_birthplace(self):
-        expected = """mutation {
+        expected = """mutation MergePersonBirthPlace {
   MergePersonBirthPlace(
     from: {identifier: "personid"}
     to: {identifier: "placeid"}
@@ -57,7 +57,7 @@ identifier
         assert mutation == expected
 
     def test_mutation_remove_person_birthplace(self):
-        expected = """mutation {
+        expected = """mutation RemovePersonBirthPlace {
   RemovePersonBirthPlace(
     from: {identifier: "personid"}
     to: {identifier: "placeid"}
@@ -74,7 +74,7 @@ identifier
         assert mutation == expected
 
     def test_mutation_merge_person_deathplace(self):
-        expected = """mutation {
+        expected = """mutation MergePersonDeathPlace {
   MergePersonDeathPlace(
     from: {identifier: "personid"}
     to: {identifier: "placeid"}
@@ -91,7 +91,7 @@ identifier
         assert mutation == expected
 
     def test_mutation_remove_person_deathplace(self):
-        expected = """mutation {
+        expected = """mutation RemovePersonDeathPlace {
   RemovePersonDeathPlace(
     from: {identifier: "personid"}
     to: {identifier: "placeid"}
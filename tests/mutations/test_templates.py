@@ -0,0 +1,42 @@
+# Tests for the mutation templates.
+import os
+
+import pytest
+
+from tests import CeTestCase
+from trompace.mutations import person
+from trompace.mutations.templates import format_batch_mutation
+
+
+class TestBatchMutation(CeTestCase):
+
+    def setUp(self) -> None:
+        super()
+        self.data_dir = os.path.join(self.test_directory, "data", "batch")
+
+    def test_batch_mutation(self):
+        expected = self.read_file(os.path.join(self.data_dir, "batch_mutation.txt"))
+
+        mutations = [person.mutation_delete_person("ff562d2e-2265-4f61-b340-561c92e797e9"),
+                     person.mutation_delete_person("59ce8093-5e0e-4d59-bfa6-805edb11e396")]
+        self.assert_queries_equal(format_batch_mutation(mutations, ["first", "second"]), expected)
+
+    def test_batch_mutation_default_aliases(self):
+        mutations = [person.mutation_delete_person("ff562d2e-2265-4f61-b340-561c92e797e9")]
+        assert "m0: DeletePerson(" in format_batch_mutation(mutations)
+
+    def test_batch_mutation_name(self):
+        mutations = [person.mutation_delete_person("ff562d2e-2265-4f61-b340-561c92e797e9"),
+                     person.mutation_update_person("59ce8093-5e0e-4d59-bfa6-805edb11e396", name="Mahler"),
+                     person.mutation_delete_person("59ce8093-5e0e-4d59-bfa6-805edb11e396")]
+        assert format_batch_mutation(mutations).startswith("mutation DeletePerson_UpdatePerson_bulk {")
+        assert format_batch_mutation(mutations, name="Cleanup").startswith("mutation Cleanup {")
+        # Documents without an operation name are named after their field
+        unnamed = ["mutation { DeletePerson(identifier: \"a\") { identifier } }",
+                   "mutation { UpdatePerson(identifier: \"a\") { identifier } }"]
+        assert format_batch_mutation(unnamed + mutations).startswith("mutation DeletePerson_UpdatePerson_bulk {")
+
+    def test_batch_mutation_aliases(self):
+        mutations = [person.mutation_delete_person("ff562d2e-2265-4f61-b340-561c92e797e9")]
+        with pytest.raises(ValueError):
+            format_batch_mutation(mutations, ["first", "second"])
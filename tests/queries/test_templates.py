@@ -0,0 +1,20 @@
+# Tests for the query templates.
+import os
+
+from tests import CeTestCase
+from trompace.queries import person
+from trompace.queries.templates import format_batch_query
+
+
+class TestBatchQuery(CeTestCase):
+
+    def setUp(self) -> None:
+        super()
+        self.data_dir = os.path.join(self.test_directory, "data", "batch")
+
+    def test_batch_query(self):
+        expected = self.read_file(os.path.join(self.data_dir, "batch_query.txt"))
+
+        queries = [person.query_person(identifier="ff562d2e-2265-4f61-b340-561c92e797e9"),
+                   person.query_person(identifier="59ce8093-5e0e-4d59-bfa6-805edb11e396")]
+        self.assert_queries_equal(format_batch_query(queries, ["first", "second"]), expected)
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+from tests.mockce import MockCE, run_mock_ce
+from trompace.background import BackgroundClient
+from trompace.connection import CEClient
+from trompace.exceptions import QueryException
+from trompace.queries.person import query_person
+from trompace.ratelimit import RateLimiter
+
+
+class TestBackgroundClient(unittest.TestCase):
+
+    def test_submit_many(self):
+        """Queries are sent concurrently, and the results are in the order of the queries"""
+        with run_mock_ce(MockCE(latency=0.05)) as ce:
+            for i in range(20):
+                ce.add_node("Person", {"name": f"Person {i}"}, identifier=f"p-{i}")
+            with BackgroundClient(CEClient.from_host(ce.url), concurrency=10) as background:
+                future = background.submit(query_person(identifier="p-0"))
+                start = time.monotonic()
+                results = background.submit_many([query_person(identifier=f"p-{i}") for i in range(20)])
+                elapsed = time.monotonic() - start
+
+                assert future.result()["data"]["Person"][0]["name"] == "Person 0"
+                assert [r["data"]["Person"][0]["name"] for r in results] == [f"Person {i}" for i in range(20)]
+                # 2 rounds of 10 concurrent requests, instead of 20 requests one after the other
+                assert elapsed < 0.5
+
+    def test_errors(self):
+        with run_mock_ce() as ce, BackgroundClient(CEClient.from_host(ce.url)) as background:
+            queries = [query_person(), "query {"]
+            with self.assertRaises(QueryException):
+                background.submit_many(queries)
+            ok, error = background.submit_many(queries, return_exceptions=True)
+            assert ok == {"data": {"Person": []}}
+            assert isinstance(error, QueryException)
+
+    def test_rate_limit(self):
+        """The rate limit of the client applies to the concurrent requests"""
+        with run_mock_ce() as ce:
+            client = CEClient.from_host(ce.url)
+            client.config.max_requests_per_second = 50
+            with BackgroundClient(client, concurrency=10) as background:
+                start = time.monotonic()
+                background.submit_many([query_person()] * 11)
+                assert time.monotonic() - start >= 0.19
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_rate(self):
+        limiter = RateLimiter(100, burst=5)
+        start = time.monotonic()
+        for _ in range(15):
+            limiter.acquire()
+        # The first 5 requests are a burst, and the next 10 are spaced out by 10ms
+        assert 0.09 <= time.monotonic() - start < 0.2
+        with self.assertRaises(ValueError):
+            RateLimiter(0)
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from tests.mockce import MockCE, mock_ce_config, run_mock_ce
+from trompace.batch import BatchSizer, DeadLetterFile, submit_batch, submit_mutations
+from trompace.bulk import BulkStats, RequestTemplate, submit_requests
+from trompace.exceptions import QueryException
+from trompace.journal import MutationJournal
+from trompace.metrics import MetricsCollector
+from trompace.mutations import person
+
+
+def create_person(i):
+    return person.mutation_create_person(title=f"Person {i}", contributor="https://www.cpdl.org",
+                                         creator="https://www.upf.edu", source=f"https://example.com/{i}",
+                                         language="en", format_="text/html", name=f"Person {i}")
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.dead_letter = DeadLetterFile(os.path.join(tmp, "dead-letter.jsonl"))
+
+    def test_errors_by_alias(self):
+        """Only the mutation with an error is sent again, and the others are not run twice"""
+        mutations = [create_person(0), person.mutation_delete_person("missing"), create_person(2)]
+        stats = BulkStats()
+        with run_mock_ce() as ce, mock_ce_config(ce):
+            results = asyncio.run(submit_batch(mutations, dead_letter=self.dead_letter, stats=stats))
+            assert len(ce.nodes) == 2
+
+        assert [r.succeeded for r in results] == [True, False, True]
+        assert results[0].data["identifier"] in ce.nodes
+        assert results[1].attempts == 2 and results[1].errors[0]["path"] == ["m1"]
+        assert stats.requests == 2
+        [dead] = self.dead_letter.read()
+        assert dead["mutation"] == mutations[1] and dead["attempts"] == 2
+
+    def test_split(self):
+        """A batch that is rejected as a whole is split until the invalid mutation is found"""
+        mutations = [create_person(0), create_person(1), "mutation { CreatePerson(name: ) { identifier } }",
+                     create_person(3)]
+        with run_mock_ce() as ce, mock_ce_config(ce):
+            results = asyncio.run(submit_batch(mutations, dead_letter=self.dead_letter))
+            assert len(ce.nodes) == 3
+
+        assert [r.succeeded for r in results] == [True, True, False, True]
+        assert [r.attempts for r in results] == [1, 1, 2, 1]
+        assert "Syntax Error" in results[2].errors[0]["message"]
+        assert len(self.dead_letter.read()) == 1
+
+    def test_bulk_requests(self):
+        """An input whose request the CE rejects fails without stopping the others"""
+        with run_mock_ce(MockCE(job_duration=0)) as ce, mock_ce_config(ce):
+            ce.add_node("ControlAction", {"name": "Analyse"}, identifier="ca-1")
+            ce.add_node("Property", {"title": "Targetfile"}, identifier="pro-1")
+            ce.add_node("DigitalDocument", {"source": "https://example.com/a.wav"}, identifier="doc-1")
+            template = RequestTemplate("ep-1", "ca-1",
+                                       {"Targetfile": {"identifier": "pro-1", "nodeType": "DigitalDocument"}}, {})
+            inputs = [{"Targetfile": "doc-1"}, {"Targetfile": "missing"}, {"Targetfile": "doc-1"}]
+            stats = BulkStats()
+
+            async def collect():
+                return [r async for r in submit_requests(template, inputs, poll_interval=0.01, stats=stats,
+                                                         dead_letter=self.dead_letter)]
+
+            results = asyncio.run(collect())
+        assert sorted(r.succeeded for r in results) == [False, True, True]
+        assert stats.completed == 2 and stats.rejected == 1
+        assert len(self.dead_letter.read()) == 1
+
+    def test_rejected_by_alias(self):
+        """If the CE runs nothing and some errors say which mutation caused them, the other mutations are sent
+        again without them"""
+        queries = []
+
+        async def submit(query, auth_required=False, session=None):
+            queries.append(query)
+            aliases = re.findall(r"(m\d+): CreatePerson", query)
+            if "m1" in aliases:
+                raise QueryException([{"message": "invalid", "path": ["m1"]}], None)
+            return {"data": {alias: {"identifier": alias} for alias in aliases}}
+
+        results = asyncio.run(submit_batch([create_person(i) for i in range(3)], submit=submit))
+        assert [r.succeeded for r in results] == [True, False, True]
+        assert [r.attempts for r in results] == [1, 2, 1]
+        assert results[2].data == {"identifier": "m2"}
+        assert len(queries) == 3
+
+    def test_transport_error_after_split(self):
+        """If the connection fails while the second half of a split batch is sent, the mutations of the first
+        half are journaled, so that they aren't sent again"""
+        queries = []
+
+        async def submit(query, auth_required=False, session=None):
+            queries.append(query)
+            aliases = re.findall(r"(m\d+): CreatePerson", query)
+            if len(queries) == 3:
+                raise ConnectionError("connection reset")
+            if len(aliases) > 2:
+                raise QueryException([{"message": "too large"}], None, 413)
+            return {"data": {alias: {"identifier": alias} for alias in aliases}}
+
+        mutations = [create_person(i) for i in range(4)]
+        with MutationJournal(tempfile.mkdtemp(dir=os.path.dirname(self.dead_letter.path))) as journal:
+
+            async def collect():
+                return [r async for r in submit_mutations(mutations, submit=submit, journal=journal)]
+
+            with self.assertRaises(ConnectionError):
+                asyncio.run(collect())
+            assert journal.completed(0, mutations[0])["data"] == {"identifier": "m0"}
+            assert journal.completed(1, mutations[1])["data"] == {"identifier": "m1"}
+            assert journal.pending() == {2: mutations[2], 3: mutations[3]}
+
+    def test_query_exception(self):
+        e = QueryException([{"message": "first"}, {"message": "second"}], {"m0": None})
+        assert "1. first" in str(e) and "2. second" in str(e)
+        assert e.data == {"m0": None}
+
+
+class TestBatchSizer(unittest.TestCase):
+
+    def test_sizes(self):
+        sizer = BatchSizer(target_latency=1.0, initial_size=40, max_size=100)
+        # Fast full batches grow by 25%, up to max_size
+        sizer.record("CreatePerson", 40, 0.1)
+        assert sizer.size("CreatePerson") == 50
+        for _ in range(10):
+            sizer.record("CreatePerson", sizer.size("CreatePerson"), 0.1)
+        assert sizer.size("CreatePerson") == 100
+        # A batch that isn't full doesn't change the size
+        sizer.record("CreatePerson", 10, 0.1)
+        assert sizer.size("CreatePerson") == 100
+        # A slow batch shrinks it in proportion
+        sizer.record("CreatePerson", 100, 4.0)
+        assert sizer.size("CreatePerson") == 25
+        sizer.shrink("CreatePerson", 25)
+        assert sizer.size("CreatePerson") == 12
+        # Each operation has its own size
+        assert sizer.size("CreateMediaObject") == 40
+        assert sizer.sizes() == {"CreatePerson": 12}
+
+    def test_payload_too_large(self):
+        """Batches that are rejected as too large are split, and the next batches are smaller"""
+        sizer = BatchSizer(initial_size=20)
+        collector = MetricsCollector()
+        collector.add_batch_sizer(sizer)
+        mutations = [create_person(i) for i in range(30)] + [person.mutation_delete_person("missing")]
+        with run_mock_ce(MockCE(max_request_bytes=len(create_person(0)) * 8)) as ce, mock_ce_config(ce):
+
+            async def collect():
+                return [r async for r in submit_mutations(mutations, sizer)]
+
+            results = asyncio.run(collect())
+            assert len(ce.nodes) == 30
+
+        assert [r.index for r in results] == list(range(31))
+        assert all(r.succeeded for r in results[:30]) and not results[30].succeeded
+        assert sizer.size("CreatePerson") < 8
+        assert f'trompace_client_batch_size{{operation="CreatePerson"}} {sizer.size("CreatePerson")}' in \
+            collector.to_prometheus()
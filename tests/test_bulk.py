@@ -0,0 +1,120 @@
+import asyncio
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from graphql import parse
+
+from trompace import bulk
+from trompace.bulk import BulkStats, RequestTemplate, submit_requests
+from trompace.journal import MutationJournal
+
+TEMPLATE = RequestTemplate(
+    "ep-1", "ca-1",
+    {"Targetfile": {"identifier": "pro-1", "nodeType": "DigitalDocument"}},
+    {"outputName": {"identifier": "pvs-1", "valuePattern": "String", "defaultValue": "", "required": True},
+     "format": {"identifier": "pvs-2", "valuePattern": "String", "defaultValue": "json", "required": False}})
+
+
+class FakeCE:
+    """Create a job for each RequestControlAction, which finishes after it has been polled ``polls`` times.
+    With lagging_replica, queries that aren't sent to the primary don't find the jobs"""
+
+    def __init__(self, polls=2, lagging_replica=False):
+        self.polls = polls
+        self.lagging_replica = lagging_replica
+        self.jobs = {}
+        self.mutations = []
+
+    async def submit_query_async(self, query, auth_required=False, session=None, primary=False):
+        parse(query)
+        data = {}
+        if query.startswith("mutation"):
+            self.mutations.append(query)
+            for alias in re.findall(r"(r\d+): RequestControlAction", query):
+                identifier = "job-{}".format(len(self.jobs))
+                self.jobs[identifier] = 0
+                data[alias] = {"identifier": identifier}
+        else:
+            for alias, identifier in re.findall(r'(s\d+): ControlAction\(identifier: "(.*?)"\)', query):
+                if self.lagging_replica and not primary:
+                    data[alias] = []
+                    continue
+                self.jobs[identifier] += 1
+                status = "CompletedActionStatus" if self.jobs[identifier] >= self.polls else "ActiveActionStatus"
+                data[alias] = [{"identifier": identifier, "actionStatus": status, "error": None, "result": []}]
+        return {"data": data}
+
+
+class TestBulk(unittest.TestCase):
+
+    def _submit(self, ce, inputs, **kwargs):
+        async def collect():
+            return [result async for result in submit_requests(TEMPLATE, inputs, poll_interval=0, **kwargs)]
+
+        with mock.patch.object(bulk, "submit_query_async", ce.submit_query_async):
+            return asyncio.run(collect())
+
+    def test_mutation(self):
+        mutation = TEMPLATE.mutation({"Targetfile": "doc-1", "outputName": "out"})
+        parse(mutation)
+        assert 'nodeIdentifier: "doc-1"' in mutation
+        assert "nodeType: DigitalDocument" in mutation
+        assert 'value: "json"' in mutation
+
+    def test_submit_requests(self):
+        ce = FakeCE()
+        stats = BulkStats()
+        inputs = ({"Targetfile": "doc-{}".format(i), "outputName": "out"} for i in range(25))
+        results = self._submit(ce, inputs, batch_size=10, stats=stats)
+
+        assert len(results) == 25
+        assert all(result.succeeded for result in results)
+        assert sorted(result.inputs["Targetfile"] for result in results) == \
+            sorted("doc-{}".format(i) for i in range(25))
+        # 25 requests are sent in 3 mutations
+        assert len(ce.mutations) == 3
+        assert stats.submitted == 25 and stats.completed == 25
+        assert stats.latency(95) is not None
+
+    def test_lagging_replica(self):
+        """The jobs are polled on the primary, so a replica that doesn't have them yet doesn't fail them"""
+        ce = FakeCE(lagging_replica=True)
+        results = self._submit(ce, [{"Targetfile": "doc-1", "outputName": "out"}])
+        assert [result.status for result in results] == ["CompletedActionStatus"]
+
+    def test_max_pending(self):
+        ce = FakeCE()
+        inputs = [{"Targetfile": "doc-{}".format(i), "outputName": "out"} for i in range(6)]
+        results = self._submit(ce, inputs, batch_size=10, max_pending=4)
+        assert len(results) == 6
+        assert [len(re.findall(": RequestControlAction", m)) for m in ce.mutations] == [4, 2]
+
+    def test_missing_value(self):
+        ce = FakeCE()
+        stats = BulkStats()
+        results = self._submit(ce, [{"Targetfile": "doc-1"}, {"Targetfile": "doc-2", "outputName": "out"}],
+                               stats=stats)
+        assert len(results) == 2
+        rejected = [result for result in results if result.identifier is None]
+        assert len(rejected) == 1 and not rejected[0].succeeded
+        assert stats.rejected == 1 and stats.completed == 1
+
+    def test_journal(self):
+        """Inputs that were requested before a restart are not requested again, but their jobs are still polled"""
+        ce = FakeCE()
+        # The same inputs twice are two jobs
+        inputs = [{"Targetfile": "doc-{}".format(i % 6), "outputName": "out"} for i in range(8)]
+        with tempfile.TemporaryDirectory() as directory:
+            with MutationJournal(directory) as journal:
+                self._submit(ce, inputs[:5], journal=journal)
+            with MutationJournal(directory) as journal:
+                stats = BulkStats()
+                results = self._submit(ce, inputs, journal=journal, stats=stats)
+                assert journal.counts() == {"succeeded": 8, "failed": 0, "pending": 0}
+
+        assert len(results) == 8 and all(result.succeeded for result in results)
+        assert len({result.identifier for result in results}) == 8
+        assert stats.submitted == 8
+        assert [len(re.findall(": RequestControlAction", m)) for m in ce.mutations] == [5, 3]
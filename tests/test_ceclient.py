@@ -0,0 +1,74 @@
+import concurrent.futures
+import time
+import unittest
+
+from tests.mockce import MockCE, mock_ce_config, run_mock_ce
+from trompace import connection
+from trompace.config import config
+from trompace.connection import CEClient
+from trompace.exceptions import QueryException
+from trompace.mutations import person
+from trompace.queries.person import query_person
+
+
+class TestCEClient(unittest.TestCase):
+
+    def test_two_ces(self):
+        """Clients of different CEs don't share settings, and don't change the global config"""
+        global_host = config.host
+        with run_mock_ce() as staging_ce, run_mock_ce(MockCE(require_auth=True)) as production_ce:
+            staging_ce.add_node("Person", {"name": "Gustav Mahler"}, identifier="p-1")
+            staging = CEClient.from_host(staging_ce.url, client_id="copier")
+            production = CEClient.from_host(production_ce.url, auth_required=True, jwt_id="copier",
+                                            jwt_key="secret", jwt_scopes=["*"])
+            self.addCleanup(staging.close)
+            self.addCleanup(production.close)
+
+            found = staging.submit_query(query_person(identifier="p-1"))["data"]["Person"]
+            assert [p["name"] for p in found] == ["Gustav Mahler"]
+            assert production.submit_query(query_person(identifier="p-1"))["data"]["Person"] == []
+
+            mutation = person.mutation_create_person(title="Mahler", contributor="https://www.cpdl.org",
+                                                     creator="https://www.upf.edu", source="https://example.com",
+                                                     language="en", format_="text/html", name="Gustav Mahler")
+            # Only the production CE needs a token
+            staging.submit_query(mutation, auth_required=True)
+            with self.assertRaises(QueryException):
+                production.submit_query(mutation)
+            production.submit_query(mutation, auth_required=True)
+
+            assert production.config.jwt_token_encoded is not None
+            assert staging.config.jwt_token_encoded is None
+        assert config.host == global_host
+
+    def test_threads(self):
+        with run_mock_ce() as ce:
+            client = CEClient.from_host(ce.url)
+            with concurrent.futures.ThreadPoolExecutor(4) as executor:
+                results = list(executor.map(lambda _: client.submit_query(query_person()), range(20)))
+            assert len(results) == 20 and ce.requests == 20
+
+    def test_submit_many(self):
+        """Queries are sent from several threads, and the results are in the order of the queries"""
+        with run_mock_ce(MockCE(latency=0.05)) as ce:
+            for i in range(20):
+                ce.add_node("Person", {"name": f"Person {i}"}, identifier=f"p-{i}")
+            client = CEClient.from_host(ce.url)
+            queries = [query_person(identifier=f"p-{i}") for i in range(20)]
+            start = time.monotonic()
+            results = client.submit_many(queries, max_workers=10)
+            assert time.monotonic() - start < 0.5
+            assert [r["data"]["Person"][0]["name"] for r in results] == [f"Person {i}" for i in range(20)]
+
+            completed = dict(client.submit_many_as_completed(queries[:5], max_workers=5))
+            assert completed[3]["data"]["Person"][0]["name"] == "Person 3"
+            assert sorted(completed) == [0, 1, 2, 3, 4]
+
+    def test_submit_many_errors(self):
+        with run_mock_ce() as ce, mock_ce_config(ce):
+            queries = [query_person(), "query {", query_person()]
+            with self.assertRaises(QueryException):
+                connection.submit_many(queries)
+            results = connection.submit_many(queries, return_exceptions=True)
+            assert isinstance(results[1], QueryException)
+            assert results[0] == results[2] == {"data": {"Person": []}}
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from tests.mockce import MockCE, run_mock_ce
+from trompace import compression, connection
+from trompace.connection import CEClient, RequestHook
+from trompace.mutations import person
+from trompace.mutations.templates import format_batch_mutation
+from trompace.queries.person import query_person
+
+
+class SizeHook(RequestHook):
+
+    def __init__(self):
+        self.sizes = []
+
+    def after_response(self, context):
+        self.sizes.append((context.headers.get("Content-Encoding"), context.request_bytes, context.response_bytes))
+
+
+def batch_of_people(count):
+    return format_batch_mutation([
+        person.mutation_create_person(title=f"Person {i}", contributor="https://www.cpdl.org",
+                                      creator="https://www.upf.edu", source=f"https://example.com/{i}",
+                                      language="en", format_="text/html", name=f"Person {i}")
+        for i in range(count)])
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.hook = SizeHook()
+        connection.add_hook(self.hook)
+        self.addCleanup(connection.remove_hook, self.hook)
+
+    def test_compress(self):
+        body = batch_of_people(20).encode()
+        for encoding in compression.available_encodings():
+            compressed = compression.compress(body, encoding)
+            assert len(compressed) < len(body) / 5
+            assert compression.decompress(compressed, encoding) == body
+        with self.assertRaises(ValueError):
+            compression.compress(body, "br")
+
+    def test_requests(self):
+        """Only requests above the threshold are compressed, with the sync and async transports"""
+        with run_mock_ce() as ce:
+            client = CEClient.from_host(ce.url, compression=compression.GZIP)
+            self.addCleanup(client.close)
+            batch = batch_of_people(20)
+            client.submit_query(query_person())
+            client.submit_query(batch)
+            asyncio.run(client.submit_query_async(batch))
+
+            assert ce.request_encodings == [None, "gzip", "gzip"]
+            assert len(ce.nodes) == 40
+            _, (_, sync_size, _), (_, async_size, _) = self.hook.sizes
+            assert sync_size == async_size < len(batch) / 5
+
+    def test_compressed_responses(self):
+        """The size of compressed responses is the number of bytes received"""
+        with run_mock_ce(MockCE(compress_responses=True)) as ce:
+            for i in range(50):
+                ce.add_node("Person", {"name": "Gustav Mahler", "title": "Gustav Mahler"}, identifier=f"p-{i}")
+            client = CEClient.from_host(ce.url)
+            self.addCleanup(client.close)
+            people = client.submit_query(query_person())["data"]["Person"]
+            asyncio.run(client.submit_query_async(query_person()))
+
+            assert len(people) == 50
+            (_, _, sync_size), (_, _, async_size) = self.hook.sizes
+            assert sync_size == async_size < len(str(people)) / 5
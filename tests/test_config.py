@@ -61,3 +61,34 @@ class TestConfig:
         assert c.host == "http://localhost:4000/trompa/"
         assert c.websocket_host == "ws://localhost:4000/trompa/graphql"
 
+    def test_set_server_http2(self):
+        settings = {"server": {"host": "http://localhost:4000", "http2": "prior-knowledge"}}
+        c = config.TrompaConfig()
+        c.config = configparser.ConfigParser()
+        c.config.read_dict(settings)
+
+        c._set_server()
+        assert c.http2 == config.HTTP2_PRIOR_KNOWLEDGE
+
+        c.config["server"]["http2"] = "maybe"
+        with pytest.raises(ValueError):
+            c._set_server()
+
+    def test_set_server_compression(self):
+        settings = {"server": {"host": "http://localhost:4000", "compression": "gzip",
+                               "compression_threshold": "4096"}}
+        c = config.TrompaConfig()
+        c.config = configparser.ConfigParser()
+        c.config.read_dict(settings)
+
+        c._set_server()
+        assert c.compression == "gzip"
+        assert c.compression_threshold == 4096
+
+        c.config["server"]["compression"] = "no"
+        c._set_server()
+        assert c.compression is None
+
+        c.config["server"]["compression"] = "br"
+        with pytest.raises(ValueError):
+            c._set_server()
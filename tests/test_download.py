@@ -0,0 +1,104 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from trompace.application.download import DownloadCache, download_inputs
+from trompace.exceptions import InvalidInputException
+
+
+class TestDownloadInputs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work_dir = os.path.join(self.tmp.name, "work")
+        os.makedirs(self.work_dir)
+        self.cache = DownloadCache(os.path.join(self.tmp.name, "cache"))
+        self.requests = []
+        self.evict = False
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def _score(self, request):
+        self.requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            if self.evict:
+                # Another process removes the cached file while the request is made
+                shutil.rmtree(self.cache.objects_directory)
+            return web.Response(status=304)
+        return web.Response(body=b"<score/>" * 1000, content_type="application/xml", headers={"ETag": '"v1"'})
+
+    def _download(self, *runs, **kwargs):
+        """Download each of ``runs``, a mapping of property names to nodes, from the same server"""
+        async def run():
+            app = web.Application()
+            app.router.add_get("/files/score.xml", self._score)
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                results = []
+                for inputs in runs:
+                    for node in inputs.values():
+                        node["source"] = str(server.make_url(node["source"]))
+                    results.append(await download_inputs(inputs, self.work_dir, cache=self.cache, **kwargs))
+                return results[-1]
+            finally:
+                await server.close()
+        return asyncio.run(run())
+
+    def test_download(self):
+        node = {"source": "/files/score.xml", "format": "application/xml", "__typename": "DigitalDocument"}
+        paths = self._download({"Score": dict(node)})
+        with open(paths["Score"], "rb") as fp:
+            assert fp.read() == b"<score/>" * 1000
+
+    def test_cached(self):
+        """A second download of the same url is revalidated and served from the cache"""
+        node = {"source": "/files/score.xml", "format": "application/xml"}
+        paths = self._download({"Score": dict(node)}, {"Score": dict(node)})
+        assert self.requests == [None, '"v1"']
+        assert os.path.getsize(paths["Score"]) == 8000
+
+    def test_evicted(self):
+        """A file that isn't in the cache anymore when the server says it hasn't changed is downloaded again"""
+        node = {"source": "/files/score.xml", "format": "application/xml"}
+        self.evict = True
+        paths = self._download({"Score": dict(node)}, {"Score": dict(node)})
+        assert self.requests == [None, '"v1"', None]
+        assert os.path.getsize(paths["Score"]) == 8000
+
+    def test_same_basename(self):
+        node = {"source": "/files/score.xml"}
+        paths = self._download({"First": dict(node), "Second": dict(node)}, concurrency=2)
+        assert paths["First"] != paths["Second"]
+        assert os.path.basename(paths["Second"]) == "1_score.xml"
+
+    def test_wrong_format(self):
+        node = {"source": "/files/score.xml", "format": "audio/wav"}
+        with self.assertRaises(InvalidInputException):
+            self._download({"Score": node})
+
+    def test_wrong_node_type(self):
+        node = {"source": "/files/score.xml", "__typename": "DigitalDocument"}
+        with self.assertRaises(InvalidInputException):
+            self._download({"Score": node}, range_includes={"Score": ["AudioObject"]})
+
+    def test_max_size(self):
+        node = {"source": "/files/score.xml"}
+        with self.assertRaises(InvalidInputException):
+            self._download({"Score": node}, max_size=100)
+
+    def test_shared_cache_directory(self):
+        """Caches of the same directory don't lose each other's entries"""
+        other = DownloadCache(self.cache.directory)
+        for i, cache in enumerate([self.cache, other]):
+            path = os.path.join(self.work_dir, "file{}".format(i))
+            with open(path, "wb") as fp:
+                fp.write(b"file")
+            cache.add("https://example.com/{}".format(i), path, "{:064x}".format(i), 4, {})
+        assert set(DownloadCache(self.cache.directory).index) == {"https://example.com/0", "https://example.com/1"}
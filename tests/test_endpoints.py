@@ -0,0 +1,132 @@
+import asyncio
+import configparser
+import socket
+import threading
+import unittest
+
+import requests
+
+from tests.mockce import MockCE, run_mock_ce
+from trompace.config import TrompaConfig
+from trompace.connection import CEClient
+from trompace.endpoints import EndpointPool
+from trompace.exceptions import QueryException
+from trompace.mutations import person
+from trompace.queries.person import query_person
+
+# Nothing listens on port 1, so connections to it are refused
+DOWN = "http://127.0.0.1:1/"
+
+
+class TestEndpointPool(unittest.TestCase):
+
+    def test_candidates(self):
+        pool = EndpointPool("http://primary", ["http://replica1", "http://replica2"], ["http://standby"])
+        assert [e.url for e in pool.candidates(mutation=True)] == ["http://primary", "http://standby"]
+        assert [e.url for e in pool.candidates(mutation=False, primary=True)] == ["http://primary", "http://standby"]
+        pool.succeeded(pool.replicas[0], 0.5)
+        pool.succeeded(pool.replicas[1], 0.1)
+        assert [e.url for e in pool.candidates(mutation=False)] == \
+            ["http://replica2", "http://replica1", "http://primary", "http://standby"]
+
+        pool.failed(pool.replicas[1])
+        assert [e.url for e in pool.candidates(mutation=False)] == \
+            ["http://replica1", "http://primary", "http://standby", "http://replica2"]
+
+    def test_retry_after(self):
+        pool = EndpointPool("http://primary", retry_after=0)
+        pool.failed(pool.primary)
+        pool.candidates(mutation=True)
+        assert pool.primary.healthy
+
+    def test_config(self):
+        c = TrompaConfig()
+        c.config = configparser.ConfigParser()
+        c.config.read_dict({"server": {"host": "http://primary:4000",
+                                       "read_hosts": "http://replica1:4000, http://replica2:4000",
+                                       "failover_hosts": "http://standby:4000"}})
+        c._set_server()
+        assert c.read_hosts == ["http://replica1:4000", "http://replica2:4000"]
+        assert c.failover_hosts == ["http://standby:4000"]
+
+
+class TestFailover(unittest.TestCase):
+
+    def test_read_replica(self):
+        with run_mock_ce() as primary, run_mock_ce() as replica:
+            client = CEClient.from_host(primary.url)
+            client.config.read_hosts = [replica.url]
+            primary.add_node("Person", {"name": "Gustav Mahler"}, identifier="p-1")
+            client.submit_query(query_person())
+            client.submit_query(person.mutation_delete_person("p-1"))
+            assert (primary.requests, replica.requests) == (1, 1)
+
+    def test_read_from_primary(self):
+        """A query with primary set reads a node that a replica which lags behind the primary doesn't have yet"""
+        with run_mock_ce() as primary, run_mock_ce() as replica:
+            client = CEClient.from_host(primary.url)
+            client.config.read_hosts = [replica.url]
+            primary.add_node("Person", {"name": "Gustav Mahler"}, identifier="p-1")
+            assert client.submit_query(query_person(identifier="p-1"))["data"]["Person"] == []
+            assert len(client.submit_query(query_person(identifier="p-1"), primary=True)["data"]["Person"]) == 1
+            resp = asyncio.run(client.submit_query_async(query_person(identifier="p-1"), primary=True))
+            assert len(resp["data"]["Person"]) == 1
+            assert (primary.requests, replica.requests) == (2, 1)
+
+    def test_failover(self):
+        with run_mock_ce() as standby:
+            client = CEClient.from_host(DOWN)
+            client.config.failover_hosts = [standby.url]
+            client.submit_query(query_person())
+            asyncio.run(client.submit_query_async(query_person()))
+            assert standby.requests == 2
+            assert not client.endpoints.primary.healthy
+            assert client.check_health() == {DOWN: False, standby.url: True}
+
+    def test_failover_mutation(self):
+        """A mutation is sent to the next host if the connection is refused"""
+        with run_mock_ce() as standby:
+            client = CEClient.from_host(DOWN)
+            client.config.failover_hosts = [standby.url]
+            with self.assertRaises(QueryException):
+                client.submit_query(person.mutation_delete_person("missing"))
+            assert standby.requests == 1
+
+    def test_no_failover_after_disconnect(self):
+        """A mutation isn't sent to the next host if the connection closed after it was sent, because the CE
+        may have run it"""
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+
+        def disconnect():
+            connection, _ = server.accept()
+            connection.recv(65536)
+            connection.close()
+
+        threading.Thread(target=disconnect, daemon=True).start()
+        with run_mock_ce() as standby:
+            client = CEClient.from_host("http://127.0.0.1:{}/".format(server.getsockname()[1]))
+            client.config.failover_hosts = [standby.url]
+            with self.assertRaises(requests.ConnectionError):
+                client.submit_query(person.mutation_delete_person("missing"))
+            assert standby.requests == 0
+
+    def test_server_error(self):
+        with run_mock_ce(MockCE(http_error_rate=1.0)) as ce:
+            client = CEClient.from_host(ce.url)
+            with self.assertRaises(QueryException):
+                client.submit_query(query_person())
+            assert not client.endpoints.primary.healthy
+
+    def test_failover_token(self):
+        """The token is requested from the failover host if the primary host is down"""
+        with run_mock_ce(MockCE(require_auth=True)) as standby:
+            client = CEClient.from_host(DOWN, auth_required=True, jwt_id="me", jwt_key="secret", jwt_scopes=["*"])
+            client.config.failover_hosts = [standby.url]
+            mutation = person.mutation_create_person(title="Mahler", contributor="https://www.cpdl.org",
+                                                     creator="https://www.upf.edu", source="https://example.com",
+                                                     format_="text/html", language="en", name="Gustav Mahler")
+            asyncio.run(client.submit_query_async(mutation, auth_required=True))
+            assert len(standby.nodes) == 1
@@ -0,0 +1,44 @@
+import asyncio
+import unittest
+
+from trompace.compression import GZIP
+from trompace.config import HTTP2_PRIOR_KNOWLEDGE
+from trompace.connection import CEClient
+from trompace.queries.person import query_person
+
+try:
+    import httpx
+    import hypercorn
+    from tests.mockce import run_mock_ce_http2
+except ImportError:
+    httpx = None
+
+
+@unittest.skipIf(httpx is None, "needs httpx[http2] and hypercorn")
+class TestHttp2(unittest.TestCase):
+
+    def test_sync_and_async(self):
+        with run_mock_ce_http2() as ce:
+            ce.add_node("Person", {"name": "Gustav Mahler"}, identifier="p-1")
+            client = CEClient.from_host(ce.url, http2=HTTP2_PRIOR_KNOWLEDGE)
+            self.addCleanup(client.close)
+            assert client.submit_query(query_person(identifier="p-1"))["data"]["Person"][0]["name"] == \
+                "Gustav Mahler"
+
+            async def submit_all():
+                async with client.new_session() as session:
+                    assert isinstance(session, httpx.AsyncClient)
+                    return await asyncio.gather(*[client.submit_query_async(query_person(), session=session)
+                                                  for _ in range(10)])
+
+            assert len(asyncio.run(submit_all())) == 10
+            assert ce.http_versions == ["2"] * 11
+
+    def test_compression(self):
+        with run_mock_ce_http2() as ce:
+            client = CEClient.from_host(ce.url, http2=HTTP2_PRIOR_KNOWLEDGE, compression=GZIP)
+            client.config.compression_threshold = 0
+            self.addCleanup(client.close)
+            client.submit_query(query_person())
+            asyncio.run(client.submit_query_async(query_person()))
+            assert ce.request_encodings == ["gzip", "gzip"]
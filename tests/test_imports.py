@@ -0,0 +1,48 @@
+import subprocess
+import sys
+import unittest
+
+import trompace
+
+# Libraries that are only imported when a request is sent or a subscription is started
+HEAVY_MODULES = ["aiofiles", "aiohttp", "httpx", "jwt", "orjson", "requests", "ujson", "websockets"]
+# Maximum cumulative time in microseconds to import trompace.connection or trompace.client.client_send_request, as
+# reported by python -X importtime.
+# This is a loose limit that catches one of HEAVY_MODULES being imported at the top of a module again.
+IMPORT_TIME_BUDGET = 100000
+
+
+def import_time(module):
+    """The cumulative time in microseconds to import module in a new interpreter"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    # Lines are like "import time:       297 |     101084 | trompace.connection"
+    for line in result.stderr.splitlines():
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative)
+    raise ValueError(f"{module} not in the output of -X importtime")
+
+
+class TestImports(unittest.TestCase):
+
+    def test_no_heavy_imports(self):
+        modules = ["trompace.connection", "trompace.bulk", "trompace.metrics",
+                   "trompace.application.entrypoint_subs", "trompace.client.client_get_control",
+                   "trompace.client.client_send_request"]
+        code = "import sys\n" + "".join(f"import {module}\n" for module in modules) + \
+               f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, universal_newlines=True,
+                                check=True)
+        assert result.stdout.split() == []
+
+    def test_import_time(self):
+        assert import_time("trompace.connection") < IMPORT_TIME_BUDGET
+        assert import_time("trompace.client.client_send_request") < IMPORT_TIME_BUDGET
+
+    def test_lazy_attributes(self):
+        from trompace.connection import submit_query
+        assert trompace.submit_query is submit_query
+        assert trompace.connection.submit_query is submit_query
+        with self.assertRaises(AttributeError):
+            trompace.not_a_module
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from trompace.application import jobqueue
+from trompace.application.jobqueue import JobQueue, recover_jobs
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "jobs.sqlite")
+        self.queue = JobQueue(self.path, max_attempts=2)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def test_claim_in_order(self):
+        assert self.queue.add("job-1")
+        assert self.queue.add("job-2")
+        # A job that is delivered twice is only queued once
+        assert not self.queue.add("job-1")
+
+        assert self.queue.claim() == "job-1"
+        assert self.queue.claim() == "job-2"
+        assert self.queue.claim() is None
+        assert self.queue.jobs(jobqueue.JOB_RUNNING) == ["job-1", "job-2"]
+
+        self.queue.finish("job-1")
+        self.queue.fail("job-2", "command failed")
+        assert self.queue.state("job-1") == jobqueue.JOB_FINISHED
+        assert self.queue.state("job-2") == jobqueue.JOB_FAILED
+
+    def test_persistent(self):
+        self.queue.add("job-1")
+        self.queue.claim()
+        self.queue.close()
+
+        self.queue = JobQueue(self.path)
+        assert self.queue.jobs(jobqueue.JOB_RUNNING) == ["job-1"]
+
+    def test_release(self):
+        self.queue.add("job-1")
+        self.queue.claim()
+        assert self.queue.release("job-1")
+        assert self.queue.claim() == "job-1"
+        # Tried max_attempts times
+        assert not self.queue.release("job-1")
+        assert self.queue.state("job-1") == jobqueue.JOB_FAILED
+
+    def test_recover(self):
+        statuses = {"job-1": "CompletedActionStatus", "job-2": "ActiveActionStatus", "job-3": "ActiveActionStatus"}
+        for identifier in statuses:
+            self.queue.add(identifier)
+            self.queue.claim()
+        # job-3 has been interrupted before
+        self.queue.release("job-3")
+        self.queue.claim()
+
+        submitted = []
+
+        async def submit_query_async(query, auth_required=False):
+            submitted.append(query)
+            for identifier, status in statuses.items():
+                if identifier in query:
+                    return {"data": {"ControlAction": [{"identifier": identifier, "actionStatus": status}]}}
+
+        with mock.patch.object(jobqueue, "submit_query_async", submit_query_async):
+            asyncio.run(recover_jobs(self.queue))
+
+        assert self.queue.state("job-1") == jobqueue.JOB_FINISHED
+        assert self.queue.state("job-2") == jobqueue.JOB_ACCEPTED
+        assert self.queue.state("job-3") == jobqueue.JOB_FAILED
+        # job-3 is failed in the CE
+        assert "FailedActionStatus" in submitted[-1]
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests.mockce import mock_ce_config, run_mock_ce
+from trompace.batch import submit_mutations
+from trompace.journal import MutationJournal
+from trompace.mutations import person
+
+
+def create_person(i):
+    return person.mutation_create_person(title=f"Person {i}", contributor="https://www.cpdl.org",
+                                         creator="https://www.upf.edu", source=f"https://example.com/{i}",
+                                         format_="text/html", name=f"Person {i}")
+
+
+class TestMutationJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_outcomes(self):
+        with MutationJournal(self.directory) as journal:
+            journal.begin(enumerate(["mutation a", "mutation b", "mutation c", "mutation a"]))
+            journal.finish(0, "mutation a", {"identifier": "a-1"})
+            journal.finish(1, "mutation b", errors=[{"message": "failed"}], attempts=2)
+
+        journal = MutationJournal(self.directory)
+        assert journal.completed(0, "mutation a")["data"] == {"identifier": "a-1"}
+        # Failed, pending, and a mutation that isn't the one at its position
+        assert journal.completed(1, "mutation b") is None
+        assert journal.completed(2, "mutation c") is None
+        assert journal.completed(3, "mutation a") is None
+        assert journal.completed(0, "mutation d") is None
+        assert journal.pending() == {1: "mutation b", 2: "mutation c", 3: "mutation a"}
+        assert journal.counts() == {"succeeded": 1, "failed": 1, "pending": 2}
+
+    def test_torn_write(self):
+        """A sync that was cut off by a crash is ignored, and the earlier syncs are kept"""
+        with MutationJournal(self.directory) as journal:
+            journal.begin([(0, "mutation a")])
+            journal.begin([(1, "mutation b")])
+        [segment] = journal.segments()
+        with open(segment, "r+b") as fp:
+            fp.truncate(os.path.getsize(segment) - 5)
+
+        journal = MutationJournal(self.directory)
+        assert journal.pending() == {0: "mutation a"}
+        journal.begin([(1, "mutation c")])
+        journal.close()
+        assert len(journal.segments()) == 2
+        assert MutationJournal(self.directory).pending() == {0: "mutation a", 1: "mutation c"}
+
+    def test_rotation(self):
+        with MutationJournal(self.directory, segment_bytes=1) as journal:
+            for i in range(5):
+                journal.begin([(i, f"mutation {i}")])
+        assert len(journal.segments()) == 5
+        assert len(MutationJournal(self.directory).pending()) == 5
+
+    def test_resume(self):
+        """Mutations that succeeded in an earlier run aren't sent again, and failed and pending ones are"""
+        mutations = [create_person(i) for i in range(10)]
+        mutations[5] = mutations[0]
+        with MutationJournal(self.directory) as journal:
+            # The previous run stopped after sending the first 7 mutations, before it saw the results of the
+            # last 2, and one of them failed
+            journal.begin(enumerate(mutations[:7]))
+            for position, mutation in enumerate(mutations[:4]):
+                journal.finish(position, mutation, {"identifier": "existing"})
+            journal.finish(4, mutations[4], errors=[{"message": "failed"}], attempts=2)
+
+        with run_mock_ce() as ce, mock_ce_config(ce), MutationJournal(self.directory) as journal:
+
+            async def collect():
+                return [r async for r in submit_mutations(mutations, journal=journal)]
+
+            results = asyncio.run(collect())
+            assert len(ce.nodes) == 6
+
+        assert [r.index for r in results] == list(range(10))
+        assert [r.resumed for r in results] == [True] * 4 + [False] * 6
+        assert all(r.succeeded for r in results)
+        journal = MutationJournal(self.directory)
+        assert journal.pending() == {}
+        assert journal.completed(9, mutations[9])["data"]["identifier"] in ce.nodes
+
+    def test_replay(self):
+        """The mutations that haven't succeeded can be sent from the journal, keeping their positions"""
+        mutations = [create_person(i) for i in range(4)]
+        with MutationJournal(self.directory) as journal:
+            journal.begin(enumerate(mutations))
+            journal.finish(0, mutations[0], {"identifier": "existing"})
+
+        with run_mock_ce() as ce, mock_ce_config(ce), MutationJournal(self.directory) as journal:
+
+            async def collect():
+                return [r async for r in submit_mutations(journal.pending(), journal=journal)]
+
+            results = asyncio.run(collect())
+            assert len(ce.nodes) == 3
+        assert [r.index for r in results] == [1, 2, 3]
+        assert MutationJournal(self.directory).counts() == {"succeeded": 4, "failed": 0, "pending": 0}
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from trompace import jsoncodec
+
+
+class TestJsonCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(jsoncodec.use_codec, jsoncodec.name)
+
+    def test_codecs(self):
+        """Every installed library encodes to the same compact bytes and decodes bytes and strings"""
+        value = {"data": {"Person": [{"name": "Gustav Mahler \u266b", "title": "C:\\music", "rating": 4.5,
+                                      "birthDate": None, "sameAs": ["https://example.com/a/b"]}]}}
+        expected = None
+        for codec in jsoncodec.available_codecs():
+            jsoncodec.use_codec(codec)
+            encoded = jsoncodec.dumps(value)
+            assert isinstance(encoded, bytes)
+            assert jsoncodec.loads(encoded) == jsoncodec.loads(encoded.decode()) == value
+            assert jsoncodec.dumps_str(value) == encoded.decode()
+            if expected is not None:
+                assert encoded == expected, codec
+            expected = encoded
+
+    def test_default(self):
+        jsoncodec.use_codec()
+        assert jsoncodec.name == jsoncodec.available_codecs()[0]
+        assert jsoncodec.available_codecs()[-1] == jsoncodec.STDLIB
+
+    def test_chosen_on_first_use(self):
+        """The library is imported when JSON is first encoded, and TROMPACE_JSON is read then"""
+        code = "import sys\nfrom trompace import jsoncodec\n" \
+               "print(jsoncodec.name, 'orjson' in sys.modules)\n" \
+               "jsoncodec.dumps({})\n" \
+               "print(jsoncodec.name, jsoncodec.loads(b'[1]'))"
+        result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, universal_newlines=True,
+                                env=dict(os.environ, TROMPACE_JSON="json"), check=True)
+        assert result.stdout.splitlines() == ["None False", "json [1]"]
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            jsoncodec.use_codec("simplejson")
+        with self.assertRaises(ValueError):
+            jsoncodec.loads(b"<html>Bad Gateway</html>")
@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+import re
+import unittest
+from unittest import mock
+
+from trompace.application import lease
+from trompace.application.lease import JobLease, parse_datetime
+
+
+class FakeCE:
+    """Store the status and lease of a single ControlAction, updated by the mutations that JobLease sends.
+    With lagging_replica, queries that aren't sent to the primary return the job as it was at the start"""
+
+    def __init__(self, status, start_time=None, end_time=None, ignore_claims=False, lagging_replica=False):
+        self.job = {"identifier": "job-1", "actionStatus": status,
+                    "startTime": {"formatted": start_time}, "endTime": {"formatted": end_time}}
+        self.replica_job = dict(self.job) if lagging_replica else None
+        self.ignore_claims = ignore_claims
+        self.mutations = 0
+
+    async def submit_query_async(self, query, auth_required=False, session=None, primary=False):
+        if query.startswith("query"):
+            job = self.job if primary or self.replica_job is None else self.replica_job
+            return {"data": {"ControlAction": [dict(job)]}}
+        self.mutations += 1
+        if not self.ignore_claims:
+            for field in ["actionStatus", "startTime", "endTime"]:
+                match = re.search(field + r': (?:{formatted: "(.*?)"}|(\w+))', query)
+                if match and match.group(1):
+                    self.job[field] = {"formatted": match.group(1)}
+                elif match:
+                    self.job[field] = match.group(2)
+        return {"data": {}}
+
+
+def in_seconds(seconds):
+    return (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=seconds)).isoformat()
+
+
+class TestJobLease(unittest.TestCase):
+
+    def _claim(self, ce, job_lease=None):
+        job_lease = job_lease or JobLease("job-1", duration=60, settle_time=0)
+        with mock.patch.object(lease, "submit_query_async", ce.submit_query_async):
+            return asyncio.run(job_lease.claim())
+
+    def test_parse_datetime(self):
+        expected = datetime.datetime(2020, 5, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc)
+        assert parse_datetime({"formatted": "2020-05-01T12:00:00.123456+00:00"}) == expected
+        assert parse_datetime({"formatted": "2020-05-01T12:00:00.123456789Z"}) == expected
+        assert parse_datetime({"formatted": "2020-05-01T12:00:00.1234Z"}) == expected.replace(microsecond=123400)
+        assert parse_datetime({"formatted": None}) is None
+        assert parse_datetime(None) is None
+
+    def test_claim_potential(self):
+        ce = FakeCE("PotentialActionStatus")
+        assert self._claim(ce)
+        assert ce.job["actionStatus"] == "ActiveActionStatus"
+
+    def test_claim_with_lagging_replica(self):
+        """The claim is read back from the primary, which has it, and not from a replica that doesn't yet"""
+        ce = FakeCE("PotentialActionStatus", lagging_replica=True)
+        job_lease = JobLease("job-1", duration=60, settle_time=0)
+        assert self._claim(ce, job_lease)
+        with mock.patch.object(lease, "submit_query_async", ce.submit_query_async):
+            asyncio.run(job_lease.renew())
+        assert ce.mutations == 2
+
+    def test_claim_lost(self):
+        """Another worker's claim was stored instead"""
+        ce = FakeCE("PotentialActionStatus", ignore_claims=True)
+        assert not self._claim(ce)
+
+    def test_claimed_by_other_worker(self):
+        ce = FakeCE("ActiveActionStatus", in_seconds(-10), in_seconds(50))
+        assert not self._claim(ce)
+        assert ce.mutations == 0
+
+    def test_claim_expired(self):
+        ce = FakeCE("ActiveActionStatus", in_seconds(-100), in_seconds(-40))
+        assert self._claim(ce)
+
+    def test_claim_finished(self):
+        ce = FakeCE("CompletedActionStatus")
+        assert not self._claim(ce)
+
+    def test_reclaim_own_job(self):
+        """After a restart, a worker can take back a job that it claimed earlier"""
+        start_time = in_seconds(-10)
+        ce = FakeCE("ActiveActionStatus", start_time, in_seconds(50))
+        job_lease = JobLease("job-1", duration=60, settle_time=0,
+                             start_time=parse_datetime({"formatted": start_time}))
+        assert self._claim(ce, job_lease)
+        assert ce.job["startTime"]["formatted"] == start_time
@@ -0,0 +1,80 @@
+import unittest
+
+from tests.mockce import mock_ce_config, run_mock_ce
+from trompace import connection
+from trompace.connection import RequestHook, submit_query
+from trompace.exceptions import QueryException
+from trompace.metrics import MetricsCollector
+from trompace.mutations import person
+from trompace.queries.person import query_person
+
+
+class RecordingHook(RequestHook):
+
+    def __init__(self):
+        self.calls = []
+
+    def before_request(self, context):
+        context.headers["X-Test"] = "yes"
+        self.calls.append(("before", context.operation))
+
+    def after_response(self, context):
+        self.calls.append(("after", context.operation))
+
+    def on_error(self, context, exception):
+        self.calls.append(("error", context.operation))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_operation_name(self):
+        assert connection.operation_name(query_person()) == "Person"
+        assert connection.operation_name(person.mutation_delete_person("p-1")) == "DeletePerson"
+        assert connection.operation_name("mutation CreatePerson_bulk {\n  m0: CreatePerson() { identifier } }") == \
+            "CreatePerson_bulk"
+
+    def test_hooks(self):
+        hook = RecordingHook()
+        connection.add_hook(hook)
+        self.addCleanup(connection.remove_hook, hook)
+        with run_mock_ce() as mock_ce, mock_ce_config(mock_ce):
+            submit_query(query_person())
+            with self.assertRaises(QueryException):
+                submit_query(person.mutation_delete_person("p-1"))
+        assert hook.calls == [("before", "Person"), ("after", "Person"),
+                              ("before", "DeletePerson"), ("error", "DeletePerson")]
+
+    def test_request_headers(self):
+        contexts = []
+        hook = RequestHook()
+        hook.before_request = contexts.append
+        connection.add_hook(hook)
+        self.addCleanup(connection.remove_hook, hook)
+        with run_mock_ce() as mock_ce, mock_ce_config(mock_ce):
+            submit_query(query_person())
+            submit_query(query_person())
+        assert contexts[0].headers["X-Client-Id"] == "trompace-client"
+        assert contexts[0].headers["X-Client-Version"] == connection.client_version()
+        assert contexts[0].headers["X-Request-Id"] != contexts[1].headers["X-Request-Id"]
+
+    def test_collector(self):
+        collector = MetricsCollector(buckets=[0.5, 1.0]).install()
+        self.addCleanup(collector.uninstall)
+        with run_mock_ce() as mock_ce, mock_ce_config(mock_ce):
+            submit_query(query_person())
+            submit_query(query_person())
+            with self.assertRaises(QueryException):
+                submit_query(person.mutation_delete_person("p-1"))
+
+        snapshot = collector.snapshot()
+        assert snapshot["Person"]["requests"] == 2
+        assert snapshot["Person"]["errors"] == 0
+        assert snapshot["Person"]["request_bytes"] > 0 and snapshot["Person"]["response_bytes"] > 0
+        assert snapshot["Person"]["latency_buckets"][-1] == (float("inf"), 2)
+        assert snapshot["DeletePerson"]["errors"] == 1
+        assert snapshot["DeletePerson"]["graphql_errors"] == 1
+
+        text = collector.to_prometheus()
+        assert 'trompace_client_requests_total{operation="Person"} 2' in text
+        assert 'trompace_client_request_duration_seconds_bucket{operation="Person",le="+Inf"} 2' in text
+        assert 'trompace_client_graphql_errors_total{operation="DeletePerson"} 1' in text
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import websockets
+
+from tests.mockce import MockCE, mock_ce_config, run_mock_ce
+from trompace.application.reconcile import reconcile
+from trompace.bulk import BulkStats, RequestTemplate, submit_requests
+from trompace.connection import submit_query_async
+from trompace.exceptions import QueryException
+from trompace.mutations import person
+from trompace.queries.person import query_person
+from trompace.subscriptions.controlaction import subscription_controlaction
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs")
+
+
+class TestMockCE(unittest.TestCase):
+
+    def test_create_and_query(self):
+        with run_mock_ce() as mock_ce, mock_ce_config(mock_ce):
+            async def run():
+                create = person.mutation_create_person(title="Gustav Mahler", contributor="https://musicbrainz.org",
+                                                       creator="https://www.upf.edu", source="https://example.com",
+                                                       format_="text/html", name="Gustav Mahler")
+                resp = await submit_query_async(create)
+                identifier = resp['data']['CreatePerson']['identifier']
+                return identifier, await submit_query_async(query_person(identifier=identifier))
+
+            identifier, resp = asyncio.run(run())
+        assert resp == {"data": {"Person": [{"identifier": identifier, "name": "Gustav Mahler"}]}}
+
+    def test_errors(self):
+        with run_mock_ce(MockCE(error_rate=1.0)) as mock_ce, mock_ce_config(mock_ce):
+            with self.assertRaises(QueryException):
+                asyncio.run(submit_query_async(query_person()))
+
+        with run_mock_ce(MockCE(require_auth=True)) as mock_ce, mock_ce_config(mock_ce) as config:
+            config.server_auth_required = False
+            with self.assertRaises(QueryException):
+                asyncio.run(submit_query_async(person.mutation_delete_person("ff562d2e")))
+
+    def test_reconcile_and_request(self):
+        """Provision an entry point, request jobs for it and receive them with a subscription"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        app_config = shutil.copy(os.path.join(DOCS_DIR, "app_config.ini"), tmp)
+        ep_config = shutil.copy(os.path.join(DOCS_DIR, "ep_config.ini"), tmp)
+
+        with run_mock_ce(MockCE(job_duration=0.05)) as mock_ce, mock_ce_config(mock_ce):
+            # The ids in the docs configs don't exist in the mock CE, so everything is created
+            asyncio.run(reconcile(app_config, ep_config))
+            requests_made = mock_ce.requests
+            asyncio.run(reconcile(app_config, ep_config))
+            # Nothing left to do, only one query
+            assert mock_ce.requests == requests_made + 1
+
+            entrypoint = next(n for n in mock_ce.nodes.values() if n["__typename"] == "EntryPoint")
+            controlaction = next(n for n in mock_ce.nodes.values() if n["__typename"] == "ControlAction")
+            prop = next(n for n in mock_ce.nodes.values() if n["__typename"] == "Property")
+            pvs = [n for n in mock_ce.nodes.values() if n["__typename"] == "PropertyValueSpecification"]
+            document = mock_ce.add_node("DigitalDocument", {"source": "https://example.com/a.wav"})
+            template = RequestTemplate(
+                entrypoint["identifier"], controlaction["identifier"],
+                {prop["title"]: {"identifier": prop["identifier"], "nodeType": "DigitalDocument"}},
+                {p["valueName"]: {"identifier": p["identifier"], "valuePattern": "String", "defaultValue": "x"}
+                 for p in pvs})
+
+            async def run():
+                async with websockets.connect(mock_ce.websocket_url, subprotocols=["graphql-ws"]) as ws:
+                    await ws.send(json.dumps({"type": "connection_init", "payload": {}}))
+                    assert await ws.recv() == '{"type":"connection_ack"}'
+                    await ws.send(json.dumps({"id": "1", "type": "start",
+                                              "payload": {"query": subscription_controlaction(entrypoint["identifier"])}}))
+                    await asyncio.sleep(0.05)
+                    stats = BulkStats()
+                    inputs = [{prop["title"]: document["identifier"]}] * 3
+                    results = [r async for r in submit_requests(template, inputs, poll_interval=0.02, stats=stats)]
+                    received = [json.loads(await ws.recv()) for _ in range(3)]
+                    return results, received
+
+            results, received = asyncio.run(run())
+        assert len(results) == 3 and all(r.succeeded for r in results)
+        assert sorted(m["payload"]["data"]["ControlActionRequest"]["identifier"] for m in received) == \
+            sorted(r.identifier for r in results)
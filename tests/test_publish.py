@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+import os
+import shutil
+import tempfile
+
+from tests import CeTestCase
+from trompace.application.publish import LocalDirectoryStore, ResultStore, mutation_complete_job, \
+    mutation_create_result
+
+
+class TestPublish(CeTestCase):
+
+    def setUp(self) -> None:
+        super()
+        self.data_dir = os.path.join(self.test_directory, "data", "batch")
+
+    def test_complete_job(self):
+        expected = self.read_file(os.path.join(self.data_dir, "complete_job.txt"))
+
+        creator = "https://github.com/trompamusic/trompa-ce-client"
+        contributor = "https://www.upf.edu"
+        results = [
+            ("0e2c9d62-1d59-4bd3-8c79-38a8e0b7c9e4",
+             mutation_create_result("/tmp/output/result.mp3", "https://example.com/results/result.mp3",
+                                    "0e2c9d62-1d59-4bd3-8c79-38a8e0b7c9e4", creator, contributor)),
+            ("5a8f1e0e-3b7a-4a87-9a54-3cb1b5dd1d2f",
+             mutation_create_result("/tmp/output/result.json", "https://example.com/results/result.json",
+                                    "5a8f1e0e-3b7a-4a87-9a54-3cb1b5dd1d2f", creator, contributor)),
+        ]
+        end_time = datetime.datetime(2020, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        self.assert_queries_equal(mutation_complete_job("93982f65-005d-4d69-9731-6079d2489598", results, end_time),
+                                  expected)
+
+    def test_complete_job_no_results(self):
+        mutation = mutation_complete_job("93982f65-005d-4d69-9731-6079d2489598", [])
+        assert "m0: UpdateControlAction(" in mutation
+        assert "CompletedActionStatus" in mutation
+        # The end of the job replaces the expiry of the lease
+        assert "endTime: {formatted: " in mutation
+
+    def test_local_directory_store(self):
+        """Files with the same name in different subdirectories are stored separately"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        output = os.path.join(tmp, "output")
+        for name in ["a/out.mid", "b/out.mid"]:
+            os.makedirs(os.path.dirname(os.path.join(output, name)), exist_ok=True)
+            with open(os.path.join(output, name), "w") as fp:
+                fp.write(name)
+        store = LocalDirectoryStore(os.path.join(tmp, "results"), "https://example.com/results/")
+
+        async def store_files():
+            return [await store.store(os.path.join(output, name), "job 1", name) for name in ["a/out.mid", "b/out.mid"]]
+
+        urls = asyncio.run(store_files())
+        assert urls == ["https://example.com/results/job%201/a/out.mid", "https://example.com/results/job%201/b/out.mid"]
+        with open(os.path.join(tmp, "results", "job 1", "b", "out.mid")) as fp:
+            assert fp.read() == "b/out.mid"
+        with self.assertRaises(ValueError):
+            asyncio.run(store.store(os.path.join(output, "a", "out.mid"), "job 1", "../out.mid"))
+
+    def test_incomplete_store(self):
+        """A store that doesn't implement store can't be created"""
+        class IncompleteStore(ResultStore):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteStore()
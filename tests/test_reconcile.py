@@ -0,0 +1,120 @@
+import asyncio
+import configparser
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from graphql import parse
+
+from trompace.application import reconcile
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs")
+
+LINKED = {
+    "app": [{"identifier": "app-1"}],
+    "entrypoint": [{"identifier": "ep-1", "actionApplication": [{"identifier": "app-1"}],
+                    "potentialAction": [{"identifier": "ca-1"}]}],
+    "controlaction": [{"identifier": "ca-1", "object": [{"identifier": "pro-1"}, {"identifier": "pvs-1"},
+                                                        {"identifier": "pvs-2"}]}],
+    "property1": [{"identifier": "pro-1"}],
+    "propertyvaluespecification1": [{"identifier": "pvs-1"}],
+    "propertyvaluespecification2": [{"identifier": "pvs-2"}],
+}
+
+
+class TestReconcile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app_config = os.path.join(self.tmp.name, "app_config.ini")
+        self.ep_config = os.path.join(self.tmp.name, "ep_config.ini")
+        shutil.copy(os.path.join(DOCS_DIR, "app_config.ini"), self.app_config)
+        shutil.copy(os.path.join(DOCS_DIR, "ep_config.ini"), self.ep_config)
+        self.set_ids({"app": "app-1", "EntryPoint": "ep-1", "ControlAction": "ca-1", "Property1": "pro-1",
+                      "PropertyValueSpecification1": "pvs-1", "PropertyValueSpecification2": "pvs-2"})
+        self.submitted = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def set_ids(self, ids):
+        for path in [self.app_config, self.ep_config]:
+            config = configparser.ConfigParser()
+            config.read(path)
+            for section, identifier in ids.items():
+                if section in config:
+                    if identifier is None:
+                        config.remove_option(section, "ce_id")
+                    else:
+                        config[section]["ce_id"] = identifier
+            with open(path, "w") as f:
+                config.write(f)
+
+    def read_id(self, path, section):
+        config = configparser.ConfigParser()
+        config.read(path)
+        return config[section].get("ce_id")
+
+    def _reconcile(self, current, link_error=None):
+        async def submit_query_async(query, auth_required=False):
+            parse(query)
+            self.submitted.append(query)
+            if query.startswith("query"):
+                return {"data": current}
+            if "CreateEntryPoint" in query:
+                return {"data": {"entrypoint": {"identifier": "ep-2"}}}
+            if "CreateProperty" in query:
+                return {"data": {"property1": {"identifier": "pro-2"}}}
+            if link_error is not None:
+                raise link_error
+            return {"data": {}}
+
+        with mock.patch.object(reconcile, "submit_query_async", submit_query_async):
+            asyncio.run(reconcile.reconcile(self.app_config, self.ep_config))
+
+    def test_nothing_to_do(self):
+        self._reconcile(LINKED)
+        assert len(self.submitted) == 1
+
+    def test_missing_link(self):
+        current = dict(LINKED, controlaction=[{"identifier": "ca-1", "object": [{"identifier": "pro-1"}]}])
+        self._reconcile(current)
+        assert len(self.submitted) == 2
+        assert self.submitted[1].count(": AddControlActionObject") == 2
+
+    def test_create_entrypoint(self):
+        """The entry point is created and linked in one mutation for the nodes and one for the links"""
+        self.set_ids({"EntryPoint": None})
+        current = dict(LINKED)
+        del current["entrypoint"]
+        self._reconcile(current)
+
+        assert len(self.submitted) == 3
+        assert "entrypoint: CreateEntryPoint" in self.submitted[1]
+        assert "AddEntryPointActionApplication" in self.submitted[2]
+        assert "AddThingInterfacePotentialAction" in self.submitted[2]
+        assert "AddControlActionObject" not in self.submitted[2]
+        assert self.read_id(self.ep_config, "EntryPoint") == "ep-2"
+
+    def test_link_fails(self):
+        """The identifiers of created nodes are saved even if linking them fails, so they aren't created again"""
+        self.set_ids({"EntryPoint": None})
+        current = dict(LINKED)
+        del current["entrypoint"]
+        with self.assertRaises(ConnectionError):
+            self._reconcile(current, link_error=ConnectionError())
+        assert self.read_id(self.ep_config, "EntryPoint") == "ep-2"
+
+    def test_rangeincludes(self):
+        config = configparser.ConfigParser()
+        config.read(self.ep_config)
+        config["Property1"]["rangeincludes"] = "DigitalDocument, MediaObject"
+        config.remove_option("Property1", "ce_id")
+        with open(self.ep_config, "w") as f:
+            config.write(f)
+        current = dict(LINKED)
+        del current["property1"]
+        self._reconcile(current)
+        assert "rangeIncludes: [DigitalDocument, MediaObject]" in self.submitted[1]
@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+
+from tests.mockce import mock_ce_config, run_mock_ce
+from trompace import connection, tracing
+from trompace.connection import RequestHook, submit_query
+from trompace.queries.person import query_person
+
+try:
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+except ImportError:
+    TracerProvider = None
+
+
+class HeaderHook(RequestHook):
+
+    def __init__(self):
+        self.headers = []
+
+    def before_request(self, context):
+        self.headers.append(dict(context.headers))
+
+
+class TestTracing(unittest.TestCase):
+
+    def test_disabled(self):
+        """Without enable_tracing, spans do nothing and no headers are added"""
+        hook = HeaderHook()
+        connection.add_hook(hook)
+        self.addCleanup(connection.remove_hook, hook)
+        with tracing.span("job", identifier="ca-1") as job_span:
+            assert job_span is None
+        with run_mock_ce() as mock_ce, mock_ce_config(mock_ce):
+            submit_query(query_person())
+        assert len(hook.headers) == 1 and "traceparent" not in hook.headers[0]
+
+    @unittest.skipIf(TracerProvider is not None, "opentelemetry is installed")
+    def test_enable_without_opentelemetry(self):
+        with self.assertRaises(ImportError):
+            tracing.enable_tracing()
+
+    @unittest.skipIf(TracerProvider is None, "needs opentelemetry-sdk")
+    def test_enabled(self):
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        tracing.enable_tracing(provider.get_tracer("test"))
+        self.addCleanup(tracing.disable_tracing)
+        hook = HeaderHook()
+        connection.add_hook(hook)
+        self.addCleanup(connection.remove_hook, hook)
+
+        async def job():
+            with tracing.span("job"):
+                await connection.submit_query_async(query_person())
+
+        with run_mock_ce() as mock_ce, mock_ce_config(mock_ce):
+            asyncio.run(job())
+
+        spans = {s.name: s for s in exporter.get_finished_spans()}
+        assert set(spans) == {"job", "CE Person"}
+        assert spans["CE Person"].parent.span_id == spans["job"].context.span_id
+        assert "traceparent" in hook.headers[0]
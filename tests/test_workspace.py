@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+from trompace.application.workspace import JobWorkspace
+from trompace.exceptions import WorkspaceQuotaException
+
+
+class TestJobWorkspace(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cleanup(self):
+        with JobWorkspace("job-1", base_dir=self.tmp.name) as workspace:
+            assert workspace.path.startswith(self.tmp.name)
+            assert os.path.isdir(workspace.inputs)
+            assert os.path.isdir(workspace.output)
+        assert not os.path.exists(workspace.path)
+
+    def test_separate_jobs(self):
+        with JobWorkspace("job-1", base_dir=self.tmp.name) as first, \
+                JobWorkspace("job-1", base_dir=self.tmp.name) as second:
+            assert first.path != second.path
+
+    def test_cleanup_failed(self):
+        workspace = JobWorkspace("job-1", base_dir=self.tmp.name)
+        with self.assertRaises(RuntimeError):
+            with workspace:
+                raise RuntimeError("job failed")
+        assert not os.path.exists(workspace.path)
+
+    def test_keep_failed(self):
+        workspace = JobWorkspace("job-1", base_dir=self.tmp.name, keep_failed=True)
+        with self.assertRaises(RuntimeError):
+            with workspace:
+                raise RuntimeError("job failed")
+        assert os.path.exists(workspace.path)
+
+    def test_quota(self):
+        with JobWorkspace("job-1", base_dir=self.tmp.name, quota=100) as workspace:
+            with open(os.path.join(workspace.output, "result.txt"), "w") as fp:
+                fp.write("a" * 60)
+            workspace.check_quota()
+            assert workspace.remaining() == 40
+            with open(os.path.join(workspace.inputs, "input.txt"), "w") as fp:
+                fp.write("a" * 60)
+            with self.assertRaises(WorkspaceQuotaException):
+                workspace.check_quota()
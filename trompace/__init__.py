@@ -1,7 +1,11 @@
 import datetime
+import enum
 import json
+import math
+import re
 from datetime import date
 import logging
+from typing import Iterable, List
 
 logger = logging.getLogger(__file__)
 
@@ -38,47 +42,131 @@ class StringConstant:
     def __init__(self, value):
         self.value = value
 
+    def __str__(self):
+        return self.value
+
     def __repr__(self):
         return self.value
 
 
-def encode_list(thelist, encoder):
-    for item in thelist:
-        if isinstance(item, StringConstant):
-            yield item.value
-        elif isinstance(item, dict):
-            yield "{" + make_parameters(**item) + "}"
-        else:
-            yield encoder.encode(item)
+class ListConstant:
+    """Some values in GraphQL are constants, not strings, and so they shouldn't
+    be encoded or have quotes put around them. Use this to represent a list of
+    constants and it won't be quoted in the query"""
+
+    def __init__(self, values):
+        self.values = [StringConstant(x) for x in values]
+
+
+# The separator between parameters in a query, and in compact mode
+PARAMETER_SEPARATOR = "\n        "
+COMPACT_SEPARATOR = " "
+
+# The C string encoder of the json module is faster than the other JSON libraries for the many short strings
+# of a query, and keeps queries ASCII
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def _encode(value, out, separator):
+    """Append the graphql representation of value to the list out"""
+    value_type = type(value)
+    if value_type is str:
+        out.append(_encode_string(value))
+    elif value_type is bool:
+        out.append("true" if value else "false")
+    elif value_type is int:
+        out.append(int.__repr__(value))
+    elif value is None:
+        out.append("null")
+    elif isinstance(value, StringConstant):
+        # The value of a constant can also be an object that formats as a constant, like an enum member
+        out.append(value.value if type(value.value) is str else str(value.value))
+    elif value_type is dict or isinstance(value, dict):
+        out.append("{")
+        _encode_fields(value, out, separator)
+        out.append("}")
+    elif value_type is list or isinstance(value, (list, tuple, ListConstant)):
+        if value_type is ListConstant:
+            value = value.values
+        out.append("[")
+        for i, item in enumerate(value):
+            if i:
+                out.append(", ")
+            _encode(item, out, separator)
+        out.append("]")
+    elif isinstance(value, enum.Enum):
+        out.append(value.name)
+    elif isinstance(value, datetime.datetime):
+        out.append("{formatted: ")
+        out.append(_encode_string(value.isoformat()))
+        out.append("}")
+    elif isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f"{value} cannot be written in GraphQL")
+        out.append(float.__repr__(value))
+    elif isinstance(value, str):
+        out.append(_encode_string(value))
+    elif isinstance(value, int):
+        out.append(int.__repr__(value))
+    else:
+        # Types like date and UUID, which some JSON libraries would encode, are rejected so that a query
+        # can be made the same way whatever libraries are installed
+        raise TypeError(f"Cannot write a value of type {value_type.__name__} in GraphQL: {value!r}. "
+                        f"Convert it to a str, or use _Neo4jDate for dates")
+
+
+def _encode_fields(fields, out, separator):
+    first = True
+    for k, v in fields.items():
+        if not first:
+            out.append(separator)
+        first = False
+        out.append(k)
+        out.append(": ")
+        _encode(v, out, separator)
+
+
+def encode_value(value, compact: bool = False):
+    """Convert a single value to the graphql format.
+    StringConstants, ListConstants and enum members are written without quotes, datetimes as a
+    _Neo4jDateTime input, and lists and dicts are encoded recursively, so they can be nested to any depth.
+    Arguments:
+        value: the value to encode
+        compact: if True, separate the fields of objects with a space instead of a newline and indent
+    Returns:
+        A string representation of the value
+    """
+    out = []
+    _encode(value, out, COMPACT_SEPARATOR if compact else PARAMETER_SEPARATOR)
+    return "".join(out)
+
+
+def format_parameters(params: dict, compact: bool = False):
+    """Convert a dictionary of query parameters to the graphql format, see make_parameters.
+    Arguments:
+        params: a mapping of field names to values
+        compact: if True, separate parameters with a space instead of a newline and indent
+    Returns:
+        A string representation of the graphql parameters
+    """
+    out = []
+    _encode_fields(params, out, COMPACT_SEPARATOR if compact else PARAMETER_SEPARATOR)
+    return "".join(out)
 
 
 def make_parameters(**kwargs):
     """Convert query parameters to the graphql format.
     This creates a formatted string of parameters and values suitable to be passed to a graphql
-    mutation or query. It has a special-case for String constants (that are represented without
-    quotes around them) and lists.
-    String constants in a list are supported, but only to one level deep.
+    mutation or query. It has a special-case for String constants, lists of constants and enums
+    (that are represented without quotes around them), datetimes, and lists and dicts, which can
+    be nested to any depth and contain any of these values.
     This method does no validation of parameter names.
     Arguments:
          **kwargs: a mapping of field names to values
     Returns:
         A string representation of the graphql parameters
     """
-    encoder = json.JSONEncoder()
-    parts = []
-    for k, v in kwargs.items():
-        if isinstance(v, StringConstant):
-            value = v.value
-        elif isinstance(v, datetime.datetime):
-            value = f"{{formatted: {encoder.encode(v.isoformat())}}}"
-        elif isinstance(v, list):
-            value = "[{}]".format(", ".join(item for item in encode_list(v, encoder)))
-        elif isinstance(v, dict):
-            value = "{" + make_parameters(**v) + "}"
-        else:
-            value = encoder.encode(v)
-        parts.append("{}: {}".format(k, value))
-    return "\n        ".join(parts)
+    return format_parameters(kwargs)
 
 
 class _Neo4jDate(StringConstant):
@@ -107,6 +195,63 @@ class _Neo4jDate(StringConstant):
             self.value = "{{ year: {0} }}".format(value)
 
 
-QUERY = '''query {{
-  {query}
-}}'''
+# The name of a field, or its alias and then its name
+_FIELD_NAME_RE = re.compile(r"\s*(\w+)(?:\s*:\s*(\w+))?")
+
+
+def operation_name_for(selection: str) -> str:
+    """A name for an operation with the given selection, so that the operation can be told apart in the logs
+    of the CE. This is the name of the first field in the selection, so ``DeletePerson(...) {...}`` is
+    named DeletePerson"""
+    match = _FIELD_NAME_RE.match(selection)
+    if not match:
+        return ""
+    return match.group(2) or match.group(1)
+
+
+def _document_name(document: str) -> str:
+    """The operation name of a document, or else the name of its first field"""
+    brace = document.index("{")
+    header = document[:brace].split()
+    return header[1] if len(header) > 1 else operation_name_for(document[brace + 1:])
+
+
+def batch_operation_name(documents: List[str], headers: Iterable[str]) -> str:
+    """The name of a batch of documents: the distinct names of the documents followed by _bulk, like
+    CreateMediaObject_bulk. headers are the distinct texts before the first { of the documents, collected while
+    the batch was built, so that the documents are only looked at again if one of them has no name"""
+    names = []
+    for header in headers:
+        words = header.split()
+        if len(words) < 2:
+            names = [_document_name(document) for document in documents]
+            break
+        names.append(words[1])
+    return "_".join(list(dict.fromkeys(names)) + ["bulk"])
+
+
+# Submodules and functions of the package that are imported the first time that they are used, so that
+# ``import trompace`` stays fast and doesn't load the HTTP and websocket libraries. For example,
+# ``trompace.connection`` or ``trompace.submit_query(...)`` work after only ``import trompace``.
+_LAZY_SUBMODULES = {"application", "background", "batch", "bulk", "client", "config", "connection", "constants",
+                    "exceptions", "journal", "metrics", "mutations", "queries", "subscriptions", "tracing"}
+_LAZY_ATTRIBUTES = {"CEClient": "trompace.connection",
+                    "submit_many": "trompace.connection",
+                    "submit_query": "trompace.connection",
+                    "submit_query_async": "trompace.connection"}
+
+
+def __getattr__(name):
+    import importlib
+
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | _LAZY_SUBMODULES | set(_LAZY_ATTRIBUTES))
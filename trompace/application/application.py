@@ -1,24 +1,25 @@
 # Generate GraphQL queries to setup a software application, entrypoint and the associated control action, property and propoerty value specification.
-import json
+import asyncio
+import datetime
+import functools
 import os
+import subprocess
 
-import websockets
-
+import trompace
 import trompace.config as config
-from trompace.connection import submit_query, download_file
-from trompace.exceptions import QueryException, ValueNotFound
-from trompace.mutations.application import mutation_create_application, mutation_add_entrypoint_application
-from trompace.mutations.controlaction import mutation_create_controlaction, mutation_add_entrypoint_controlaction, \
-    mutation_modify_controlaction
-from trompace.mutations.digitaldocument import mutation_create_digitaldocument
-
-from trompace.mutations.digitaldocument import mutation_create_digitaldocument
-from trompace.mutations.entrypoint import mutation_create_entry_point
-from trompace.mutations.property import mutation_create_property, mutation_create_propertyvaluespecification
-from trompace.mutations.controlaction import mutation_add_controlaction_propertyvaluespecification, \
-    mutation_add_controlaction_property, mutation_add_controlaction_object
+from trompace import jsoncodec
+from trompace.application.download import DownloadCache, download_inputs
+from trompace.application.jobqueue import JobQueue, recover_jobs
+from trompace.application.lease import JobLease, parse_datetime, run_with_lease
+from trompace.application.publish import output_files, publish_results, result_store_from_config
+from trompace.application.workspace import JobWorkspace
+from trompace.connection import submit_query_async
+from trompace.constants import ActionStatusType
+from trompace.exceptions import ValueNotFound, JobAlreadyClaimedException
+from trompace.mutations.controlaction import mutation_modify_controlaction
 
 from trompace.subscriptions.controlaction import subscription_controlaction
+from trompace.tracing import span
 
 
 def get_sub_dict(query):
@@ -28,12 +29,12 @@ def get_sub_dict(query):
     message = {"id": "1",
                "type": "start",
                "payload": payload}
-    return json.dumps(message)
+    return jsoncodec.dumps_str(message)
 
 
 INIT_STR = """{"type":"connection_init","payload":{}}"""
 
-QUERY_ENTRYPOINT = """query{
+QUERY_ENTRYPOINT = """query EntryPoint {
   EntryPoint {
     identifier
     title
@@ -76,7 +77,7 @@ QUERY_ENTRYPOINT = """query{
 }
 """
 QUERY_CONTROLACTION_ID = """
-    query {{
+    query ControlAction {{
         ControlAction(identifier: "{identifier}") {{
             actionStatus
             identifier
@@ -85,10 +86,16 @@ QUERY_CONTROLACTION_ID = """
                     value
                     name
                     nodeValue {{
+                        __typename
                         ... on DigitalDocument {{
                             format
                             source
                         }}
+                        ... on MediaObject {{
+                            format
+                            source
+                            contentUrl
+                        }}
                     }}
                 }}
             }}
@@ -97,163 +104,103 @@ QUERY_CONTROLACTION_ID = """
 """
 
 
-async def create_entrypointcontrolaction_CE(created_app_id, entrypoint_name, contributor, subject, description_ep,
-                                            creator,
-                                            source, language, actionPlatform, contentType, encodingType, formatin,
-                                            control_name, description_ca, actionStatus):
-    """
-    Creates an entry point and control action in the contributor environment and linkss the two to the application.
-    Arguments:
-        created_app_id: The id of the application that the entry point and control actions should be linked to.
-        Entry point arguments:
-            entrypoint_name: The name of the entry point.
-            source: The URL of the web resource to be represented by the node.
-            description: A description of the application.
-            formatin: The format of the input files to be used for the application.
-            subject: The subject associated with the application.
-            contributor: A person, an organization, or a service responsible for adding the software application. This can be either a name or a base URL.
-            creator: The person, organization or service responsible for adding the software application.
-            actionPlatform: The action platform.
-            contentType: The content type associated with the entry point, should be a mimetype.
-            encodingType: The encoding type associated with the entry point, should be a mimetype.
-        Controal Action arguments:
-            control_name: the name of the control action.
-            actionStatus: The default actionStatus for a newly instantiated ControlAction 'job'.
-    """
-
-    create_entrypoint_query = mutation_create_entry_point(entrypoint_name, contributor, subject, description_ep,
-                                                          creator, \
-                                                          source, language, actionPlatform, contentType, encodingType,
-                                                          formatin)
-    resp = await submit_query(create_entrypoint_query)
-
-    created_ep_id = resp['data']['CreateEntryPoint']['identifier']
-
-    add_entrypoint_query = mutation_add_entrypoint_application(created_app_id, created_ep_id)
-    resp = await submit_query(add_entrypoint_query)
-
-    created_control_action = mutation_create_controlaction(control_name, description_ca, actionStatus)
-    resp = await submit_query(created_control_action)
-    created_ca_id = resp['data']['CreateControlAction']['identifier']
-
-    add_entrypoint_controlaction_query = mutation_add_entrypoint_controlaction(created_ep_id, created_ca_id)
-    resp = await submit_query(add_entrypoint_controlaction_query)
-    if "errors" in resp.keys():
-        raise QueryException(resp['errors'])
-    return created_ep_id, created_ca_id
-
-
-async def create_property_CE(property_title, property_name, property_description, rangeIncludes, created_ca_id):
-    """
-    Creates a property in the contributor environment and links it to the control action.
-    Argument:
-        created_ca_id: The contributor environment id of the control action to link the property to.
-        property_title: The title of the property
-        property_name: The name of the property
-        property_description: An account of the property
-        rangeIncludes: accepts an array of possible node types for this content reference and can be used by the \
-        Component developer to limit the type of nodes (content types) that can be selected.
-    """
-
-    create_property_query = mutation_create_property(property_title, property_name, property_description, rangeIncludes)
-    resp = await submit_query(create_property_query)
-
-    created_property_id = resp['data']['CreateProperty']['identifier']
-    add_controlaction_property_query = mutation_add_controlaction_property(created_ca_id, created_property_id)
-
-    resp = await submit_query(add_controlaction_property_query)
-
-    return created_property_id
-
-
-async def create_propertyvalue_CE(created_ca_id, value_name, value_description, defaultValue, valueMaxLength,
-                                  valueMinLength \
-                                  , multipleValues, valueName, valuePattern, valueRequired):
-    """
-    Creates a property value specification in the controbutor environment and liks it to the control action.
-    Arguments:
-        created_ca_id: The contributor environment id of the control action to link the property value specification object to.
-        value_name: The name of the property value specification.
-        value_description: An account of the property
-        defaultValue: the default value to use for the property value specification.
-        valueMaxLength: The maximum length of the value.
-        valueMinLength: The minimum length of the value.
-        multipleValues: A boolean that states if multiple values are accepted or not.
-        valueName: The name of the value.
-        valuePattern: The format of the value.
-        valueRequired: A boolean stating if the value is required or not.
-    """
-
-    create_propertyvaluespecification_query = mutation_create_propertyvaluespecification(value_name, value_description,
-                                                                                         defaultValue, valueMaxLength,
-                                                                                         valueMinLength \
-                                                                                         , multipleValues, valueName,
-                                                                                         valuePattern, valueRequired)
-
-    resp = await submit_query(create_propertyvaluespecification_query)
-
-    created_propertyvaluespec_id = resp['data']['CreatePropertyValueSpecification']['identifier']
-    add_propertyvalue_controlaction_query = mutation_add_controlaction_propertyvaluespecification(created_ca_id,
-                                                                                                  created_propertyvaluespec_id)
-    resp = await submit_query(add_propertyvalue_controlaction_query)
-    return created_propertyvaluespec_id
-
-
-async def create_application_CE(application_name: str, subject: str, description: str, source: str, formatin: str, \
-                                language: str = "en", contributor: str = "UPF", creator: str = "www.upf.edu"):
-    """
-    Creates an application on the Contributor Environment and returns the identifier.
-    Arguments:
-        application_name: The name of the application.
-        source: The URL of the web resource to be represented by the node.
-        description: A description of the application.
-        formatin: The format of the input files to be used for the application.
-        subject: The subject associated with the application.
-        contributor: A person, an organization, or a service responsible for adding the software application. This can be either a name or a base URL.
-        creator: The person, organization or service responsible for adding the software application.
-    Returns:
-        The identifiers for the created application.
-
-    """
-    create_application_query = mutation_create_application(application_name, contributor, creator, source, subject,
-                                                           description, language, formatin)
-    resp = await submit_query(create_application_query)
-
-    created_app_id = resp['data']['CreateSoftwareApplication']['identifier']
-    return created_app_id
-
-
-async def subscribe_controlaction(entrypoint_id, command_line, num_properties, num_propertyvalues):
+async def subscribe_controlaction(entrypoint_id, command_line, num_properties, num_propertyvalues,
+                                  range_includes=None, creator="www.upf.edu", contributor="UPF", language="en"):
     """
     Sends a subscribtion request for the control action pertaining to the input control_id.
     Establishes a websockets connection with the GraphQl database and waits for calls to the application linked to the control action
+    Requests are stored in a JobQueue and run by ``worker.job_concurrency`` executors. Jobs that were interrupted
+    the last time that the worker ran are recovered before subscribing.
     Arguments:
         entrypoint_id: the identifier for the entry point linked to the control action to subscribe to.
         command_line: The command line command for the application, must adhere to the standards proposed.
         num_properties: The number of properties related to the control action.
         num_propertyvalues: The number of property values related to the control action.
+        range_includes: A mapping of property names to the node types that the property accepts.
+        creator: The application that creates the output files of jobs.
+        contributor: The person, organization or service that adds the output files of jobs to the CE.
+        language: The language of the metadata of the output files.
     """
-    websocket_port = config.websocket_port
-    print(websocket_port)
+    import websockets
+
+    handler = functools.partial(handle_control_action, command_line=command_line, properties=num_properties,
+                                property_values=num_propertyvalues, range_includes=range_includes,
+                                creator=creator, contributor=contributor, language=language)
+    queue = JobQueue(config.config.job_queue_path, config.config.job_max_attempts)
+    await recover_jobs(queue)
+
+    wakeup = asyncio.Event()
+    executors = [asyncio.ensure_future(execute_jobs(queue, handler, wakeup))
+                 for _ in range(config.config.job_concurrency)]
+    wakeup.set()
+
     is_ok = False
     subs = subscription_controlaction(entrypoint_id)
-    async with websockets.connect(websocket_port, subprotocols=['graphql-ws']) as websocket:
-        await websocket.send(INIT_STR)
-        async for message in websocket:
-            if message == """{"type":"connection_ack"}""":
-                is_ok = True
-                print("Ack recieved")
-                await websocket.send(get_sub_dict(subs))
-            elif is_ok:
-                print("Message recieved, processesing")
-                control_id = json.loads(message)["payload"]["data"]["ControlActionRequest"]["identifier"]
-                await handle_control_action(control_id, command_line, num_properties, num_propertyvalues)
-                break
-            if not is_ok:
-                raise Exception("don't have an ack yet")
-
-
-async def handle_control_action(identifier, command_line, properties, property_values):
+    try:
+        async with websockets.connect(config.config.websocket_host, subprotocols=['graphql-ws']) as websocket:
+            await websocket.send(INIT_STR)
+            async for message in websocket:
+                if message == """{"type":"connection_ack"}""":
+                    is_ok = True
+                    print("Ack recieved")
+                    await websocket.send(get_sub_dict(subs))
+                elif is_ok:
+                    message = jsoncodec.loads(message)
+                    if message.get("type") != "data":
+                        continue
+                    control_id = message["payload"]["data"]["ControlActionRequest"]["identifier"]
+                    if queue.add(control_id):
+                        print("Job {} recieved".format(control_id))
+                        wakeup.set()
+                if not is_ok:
+                    raise Exception("don't have an ack yet")
+    finally:
+        for executor in executors:
+            executor.cancel()
+        queue.close()
+
+
+async def execute_jobs(queue, handler, wakeup, poll_interval=1):
+    """
+    Run jobs from the job queue, one at a time, until cancelled.
+    Each job is claimed with a JobLease before it runs, and is skipped if another worker claims it.
+    Arguments:
+        queue: The JobQueue to take jobs from.
+        handler: A coroutine function that runs the job with the given identifier and ``lease``.
+        wakeup: An asyncio.Event that is set when a job is added to the queue.
+        poll_interval: How often to check the queue for jobs if ``wakeup`` isn't set, in seconds.
+    """
+    while True:
+        wakeup.clear()
+        identifier = queue.claim()
+        if identifier is None:
+            try:
+                await asyncio.wait_for(wakeup.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        stored_lease = queue.lease(identifier)
+        lease = JobLease(identifier, config.config.lease_duration, config.config.lease_settle_time,
+                         parse_datetime({"formatted": stored_lease}))
+        try:
+            if not await lease.claim():
+                queue.skip(identifier)
+                continue
+            queue.set_lease(identifier, lease.start_time.isoformat())
+            await handler(identifier, lease=lease)
+            queue.finish(identifier)
+        except asyncio.CancelledError:
+            # Leave the job as running, it is recovered the next time the worker starts
+            raise
+        except JobAlreadyClaimedException:
+            queue.skip(identifier)
+        except Exception as e:
+            trompace.logger.exception(f"Job {identifier} failed")
+            queue.fail(identifier, str(e))
+
+
+async def handle_control_action(identifier, command_line, properties, property_values, range_includes=None,
+                                creator="www.upf.edu", contributor="UPF", language="en", lease=None):
     """
     A function to handle a control action request.
     Arguments:
@@ -261,55 +208,98 @@ async def handle_control_action(identifier, command_line, properties, property_v
         command_line: The command line associated with the application associated with the entry point,
         properties: A list of required properties.
         property_values: A list of required property values.
+        range_includes: A mapping of property names to the node types that the property accepts.
+        creator: The application that creates the output files of the job.
+        contributor: The person, organization or service that adds the output files to the CE.
+        language: The language of the metadata of the output files.
+        lease: The JobLease that this worker holds on the job. If not set, the job is claimed first.
+    Raises:
+        JobAlreadyClaimedException if another worker claimed the job.
     """
 
-    properties, property_values = await get_control_action_id(identifier, properties, property_values)
-
-    query_modify_ca = mutation_modify_controlaction(identifier, "running")
-    resp = await submit_query(query_modify_ca)
-
-    input_paths = []
-
-    format_dict = {"PropertyValue{}".format(x + 1): property_values[y] for x, y in enumerate(property_values)}
-
+    if lease is None:
+        lease = JobLease(identifier, config.config.lease_duration, config.config.lease_settle_time)
+        if not await lease.claim():
+            raise JobAlreadyClaimedException(identifier)
+
+    workspace = JobWorkspace(identifier, config.config.scratch_dir, config.config.scratch_quota,
+                             config.config.keep_failed_jobs)
+    with span("job", **{"trompace.job.id": identifier}):
+        try:
+            with span("job.get_control_action"):
+                properties, property_values = await get_control_action_id(identifier, properties, property_values)
+            format_dict = {"PropertyValue{}".format(x + 1): property_values[y]
+                           for x, y in enumerate(property_values)}
+            with workspace:
+                await run_with_lease(lease, run_job(workspace, identifier, command_line, properties,
+                                                    property_values, format_dict, range_includes, creator,
+                                                    contributor, language))
+        except JobAlreadyClaimedException:
+            raise
+        except asyncio.CancelledError:
+            # A subclass of Exception before Python 3.8. The worker is stopping, the job didn't fail
+            raise
+        except Exception as e:
+            query_modify_ca = mutation_modify_controlaction(identifier, ActionStatusType.FailedActionStatus, str(e),
+                                                            datetime.datetime.now(datetime.timezone.utc))
+            await submit_query_async(query_modify_ca, auth_required=True)
+            raise
+
+
+async def run_job(workspace, identifier, command_line, properties, property_values, format_dict, range_includes,
+                  creator, contributor, language):
+    """
+    Download the inputs of a control action job and run its command in a workspace.
+    Arguments:
+        workspace: The JobWorkspace to run the job in.
+        identifier: the identifier of the control action.
+        command_line: The command line associated with the application associated with the entry point.
+        properties: A mapping of property names to the node that they point to.
+        property_values: A mapping of property value names to their value.
+        format_dict: The values to format command_line with.
+        range_includes: A mapping of property names to the node types that the property accepts.
+        creator: The application that creates the output files of the job.
+        contributor: The person, organization or service that adds the output files to the CE.
+        language: The language of the metadata of the output files.
+    """
+    cache = None
+    if config.config.download_cache_dir:
+        cache = DownloadCache(config.config.download_cache_dir)
+    max_sizes = [x for x in [config.config.download_max_size, workspace.remaining()] if x is not None]
+    with span("job.download"):
+        input_paths = await download_inputs(properties, workspace.inputs, range_includes=range_includes,
+                                            cache=cache, concurrency=config.config.download_concurrency,
+                                            max_size=min(max_sizes) if max_sizes else None)
+    workspace.check_quota()
     for i, pro in enumerate(properties, 1):
-        # TODO: Assert that the format of the file matches the required format.
-
-        input_url = properties[pro]['source']
-        out_path = "./{}".format(input_url.split("/")[-1])
-
-        await download_file(input_url, out_path)
-        input_paths.append(out_path)
-        format_dict['Property{}'.format(i)] = os.path.abspath(out_path)
-
-        print("Downloaded File {}".format(out_path))
-
-    os.system(command_line.format(**format_dict))
-
-    # TODO: How to get the right output file name (possibly one of the property value specifications) and the right source path?
-
-    create_doc_query = mutation_create_digitaldocument(property_values['outputName'], "UPF", "IPF", "www.upf.edu",
-                                                "./dummy_path",
-                                                "output of test algorithm", "test subject", "en")
-    resp = await submit_query(create_doc_query)
-    created_doc_id = resp['data']['CreateDigitalDocument']['identifier']
-
-    query_add_doc = mutation_add_controlaction_object(created_doc_id, identifier)
-
-    resp = await submit_query(query_add_doc)
-
-    print(resp)
-
-    query_modify_ca = mutation_modify_controlaction(identifier, "complete")
-    resp = await submit_query(query_modify_ca)
-    print(resp)
+        format_dict['Property{}'.format(i)] = input_paths[pro]
+        print("Downloaded File {}".format(input_paths[pro]))
+    format_dict['OutputDirectory'] = workspace.output
+
+    command = command_line.format(**format_dict)
+    with span("job.command"):
+        process = await asyncio.create_subprocess_shell(command, cwd=workspace.path)
+        try:
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+    workspace.check_quota()
+
+    store = result_store_from_config(config.config)
+    with span("job.publish"):
+        created_ids = await publish_results(identifier, output_files(workspace.output), store, creator,
+                                            contributor, language, root=workspace.output)
+    print("Completed job {} with {} results".format(identifier, len(created_ids)))
 
 
 async def get_control_all_actions():
     """
     Submits a query to get all control actions, entry points and associated property and property value specifications.
     """
-    resp = await submit_query(QUERY_ENTRYPOINT)
+    resp = await submit_query_async(QUERY_ENTRYPOINT)
 
     entry_point_ids = {y: {"Id": x['identifier'], "Description": x['description'],
                            x['potentialAction'][0]['__typename'] + "_id": x['potentialAction'][0]['identifier'] \
@@ -335,7 +325,7 @@ async def get_control_action_id(control_id, properties, property_values):
         Add optional values using valueRequired.
     """
     query_ca = QUERY_CONTROLACTION_ID.format(identifier=control_id)
-    resp = await submit_query(query_ca)
+    resp = await submit_query_async(query_ca)
     op_pro = {}
     op_pvs = {}
 
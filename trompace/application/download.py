@@ -0,0 +1,282 @@
+# Download the input files of a control action job concurrently, with a local content-addressed cache.
+import asyncio
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import trompace
+from trompace import jsoncodec
+from trompace.exceptions import InvalidInputException
+
+if TYPE_CHECKING:
+    import aiohttp
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Held while the index of any cache is updated, for caches in the same process
+_index_lock = threading.Lock()
+
+
+class DownloadCache:
+    """A cache of downloaded files, stored by the sha256 of their content.
+    An index maps each url to the stored object and to the ETag and Last-Modified headers
+    that it was served with, so that a later download of the same url can be made conditional
+    and skipped if the server reports that the file has not changed.
+    Several caches, in one process or in several, can use the same directory: the index is read again and
+    updated under a lock each time that a file is added, so that no entries are lost."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.objects_directory = os.path.join(directory, "objects")
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(self.objects_directory, exist_ok=True)
+        self.index = self._read_index()
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "rb") as fp:
+                return jsoncodec.loads(fp.read())
+        except ValueError:
+            trompace.logger.warning(f"Could not read download cache index {self.index_path}, ignoring")
+            return {}
+
+    @contextlib.contextmanager
+    def _locked_index(self):
+        """Lock the index against other caches of this directory, and read it again"""
+        with _index_lock, open(self.index_path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.index = self._read_index()
+            yield
+
+    def _write_index(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".index")
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(jsoncodec.dumps(self.index))
+        os.replace(tmp_path, self.index_path)
+
+    def object_path(self, digest: str):
+        return os.path.join(self.objects_directory, digest[:2], digest)
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """Get the index entry of a url, if the object that it points to is still in the cache"""
+        entry = self.index.get(url)
+        if entry and os.path.exists(self.object_path(entry["digest"])):
+            return entry
+        return None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Headers to revalidate a cached url with the server"""
+        entry = self.lookup(url)
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def add(self, url: str, path: str, digest: str, size: int, headers) -> str:
+        """Move a downloaded file into the cache and record it in the index.
+        Arguments:
+            url: the url the file was downloaded from
+            path: the location of the downloaded file, it is moved into the cache
+            digest: the sha256 hex digest of the file
+            size: the size of the file in bytes
+            headers: the headers of the response that the file was downloaded from
+        Returns:
+            the path of the file in the cache
+        """
+        object_path = self.object_path(digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if os.path.exists(object_path):
+            os.remove(path)
+        else:
+            os.chmod(path, 0o444)
+            os.replace(path, object_path)
+        with self._locked_index():
+            self.index[url] = {
+                "digest": digest,
+                "size": size,
+                "content_type": headers.get("Content-Type"),
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+            }
+            self._write_index()
+        return object_path
+
+
+def _mimetype(content_type: Optional[str]):
+    if not content_type:
+        return None
+    return content_type.split(";")[0].strip().lower()
+
+
+def check_node_type(name: str, node: dict, range_includes: Optional[List[str]]):
+    """Check that the node linked to a Property is one of the types in the Property's rangeIncludes"""
+    node_type = node.get("__typename")
+    if range_includes and node_type and node_type not in range_includes:
+        raise InvalidInputException(name, f"node type {node_type} is not one of {', '.join(range_includes)}")
+
+
+def check_content_type(url: str, expected_format: Optional[str], content_type: Optional[str]):
+    """Check that a downloaded file has the mimetype set in the ``format`` of its node in the CE"""
+    expected = _mimetype(expected_format)
+    received = _mimetype(content_type)
+    if expected and received and expected != received:
+        raise InvalidInputException(url, f"expected a file of type {expected}, got {received}")
+
+
+def _place(source_path: str, destination: str):
+    """Put a file from the cache at ``destination``, as a hard link if possible"""
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source_path, destination)
+    except OSError:
+        shutil.copyfile(source_path, destination)
+
+
+async def _stream_to_file(response, path: str, url: str, max_size: Optional[int]):
+    """Write the body of a response to a file in chunks, returning the sha256 digest and the size"""
+    expected_size = response.content_length
+    if response.headers.get("Content-Encoding"):
+        # Content-Length is the size of the encoded body, not of the file
+        expected_size = None
+    if max_size is not None and expected_size is not None and expected_size > max_size:
+        raise InvalidInputException(url, f"size of {expected_size} bytes is larger than the limit of {max_size}")
+
+    import aiofiles
+
+    digest = hashlib.sha256()
+    size = 0
+    async with aiofiles.open(path, "wb") as fp:
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise InvalidInputException(url, f"size is larger than the limit of {max_size} bytes")
+            digest.update(chunk)
+            await fp.write(chunk)
+
+    if expected_size is not None and size != expected_size:
+        raise InvalidInputException(url, f"received {size} bytes, expected {expected_size}")
+    return digest.hexdigest(), size
+
+
+async def download_input(session: "aiohttp.ClientSession", url: str, destination: str, expected_format: str = None,
+                         cache: DownloadCache = None, max_size: int = None):
+    """Download a single input file.
+    Arguments:
+        session: the http session to download with
+        url: the url of the file
+        destination: the path to save the file to
+        expected_format: the mimetype that the file should have
+        cache: a cache to look up and store the file in, or None to always download the file
+        max_size: the maximum size of the file in bytes
+    Raises:
+        InvalidInputException if the size or the type of the file is not what is expected
+    """
+    headers = cache.conditional_headers(url) if cache else {}
+    async with session.get(url, headers=headers) as response:
+        if response.status != 304 or cache is None:
+            await _save(response, url, destination, expected_format, cache, max_size)
+            return
+        entry = cache.lookup(url)
+        if entry is not None:
+            check_content_type(url, expected_format, entry.get("content_type"))
+            try:
+                _place(cache.object_path(entry["digest"]), destination)
+                trompace.logger.debug(f"{url} has not changed, using cached file")
+                return
+            except FileNotFoundError:
+                pass
+    # The cached file was evicted or removed by another process after the request was made
+    trompace.logger.debug(f"{url} has not changed, but it is no longer in the cache, downloading it again")
+    async with session.get(url) as response:
+        await _save(response, url, destination, expected_format, cache, max_size)
+
+
+async def _save(response, url: str, destination: str, expected_format: Optional[str], cache: Optional[DownloadCache],
+                max_size: Optional[int]):
+    """Save the body of a response to destination, through the cache if there is one"""
+    response.raise_for_status()
+    check_content_type(url, expected_format, response.headers.get("Content-Type"))
+
+    path = destination
+    if cache is not None:
+        fd, path = tempfile.mkstemp(dir=cache.directory, suffix=".part")
+        os.close(fd)
+    try:
+        digest, size = await _stream_to_file(response, path, url, max_size)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    if cache is not None:
+        _place(cache.add(url, path, digest, size, response.headers), destination)
+
+
+def _input_url(node: dict):
+    # MediaObjects point to the file with contentUrl, DigitalDocuments with source
+    return node.get("contentUrl") or node["source"]
+
+
+def _destination(directory: str, url: str, used: set):
+    basename = url.rstrip("/").split("/")[-1] or "input"
+    filename = basename
+    i = 1
+    while filename in used:
+        filename = f"{i}_{basename}"
+        i += 1
+    used.add(filename)
+    return os.path.join(directory, filename)
+
+
+async def download_inputs(inputs: Dict[str, dict], directory: str, range_includes: Dict[str, List[str]] = None,
+                          cache: DownloadCache = None, concurrency: int = 4, max_size: int = None):
+    """Download all of the input files of a control action job at the same time.
+    Arguments:
+        inputs: a mapping of property names to the node in the CE that the property points to.
+                Each node has a ``source`` or ``contentUrl`` and optionally a ``format`` and a ``__typename``
+        directory: the directory to save the files in
+        range_includes: a mapping of property names to the node types that the property accepts
+        cache: a cache to reuse files from, or None to download every file
+        concurrency: the maximum number of files to download at the same time
+        max_size: the maximum size in bytes of each file
+    Returns:
+        A mapping of property names to the absolute path of their downloaded file
+    Raises:
+        InvalidInputException if a node or a file is not what the property expects
+    """
+    range_includes = range_includes or {}
+    for name, node in inputs.items():
+        check_node_type(name, node, range_includes.get(name))
+
+    used = set()
+    destinations = {name: _destination(directory, _input_url(node), used) for name, node in inputs.items()}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _download(session, name, node):
+        async with semaphore:
+            await download_input(session, _input_url(node), destinations[name], node.get("format"), cache, max_size)
+            trompace.logger.debug(f"Downloaded input {name} to {destinations[name]}")
+
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[_download(session, name, node) for name, node in inputs.items()])
+
+    return {name: os.path.abspath(path) for name, path in destinations.items()}
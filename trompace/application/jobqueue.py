@@ -0,0 +1,147 @@
+# A durable queue of control action jobs between the subscription and the workers that run them.
+import datetime
+import sqlite3
+import time
+from typing import List, Optional
+
+import trompace
+from trompace.connection import submit_query_async
+from trompace.constants import ActionStatusType
+from trompace.mutations.controlaction import mutation_modify_controlaction
+from trompace.queries.controlaction import query_controlaction
+
+JOB_ACCEPTED = "accepted"
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_FAILED = "failed"
+# Another worker claimed the job
+JOB_SKIPPED = "skipped"
+
+CREATE_TABLE = """CREATE TABLE IF NOT EXISTS jobs (
+    identifier TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    lease TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)"""
+
+
+class JobQueue:
+    """Control action jobs stored in a SQLite database, so that they survive a crash of the worker.
+    A job is ``accepted`` when it is received from the subscription, ``running`` while a worker runs it,
+    and ``finished`` or ``failed`` when it's done, or ``skipped`` if another worker claimed it.
+    A job that is still ``running`` when the queue is opened was interrupted by a crash, see ``recover_jobs``.
+
+    A job is run at most ``max_attempts`` times."""
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(CREATE_TABLE)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(jobs)")]
+        if "lease" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN lease TEXT")
+
+    def close(self):
+        self.db.close()
+
+    def _set_state(self, identifier: str, state: str, error: str = None):
+        self.db.execute("UPDATE jobs SET state = ?, error = ?, updated = ? WHERE identifier = ?",
+                        (state, error, time.time(), identifier))
+
+    def add(self, identifier: str):
+        """Accept a job. Returns False if the job is already in the queue, for example if the
+        subscription delivered it twice"""
+        now = time.time()
+        cursor = self.db.execute("INSERT OR IGNORE INTO jobs (identifier, state, created, updated) "
+                                 "VALUES (?, ?, ?, ?)", (identifier, JOB_ACCEPTED, now, now))
+        return cursor.rowcount == 1
+
+    def claim(self) -> Optional[str]:
+        """Take the oldest accepted job and mark it as running. Returns None if there are no jobs to run"""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute("SELECT identifier FROM jobs WHERE state = ? ORDER BY created LIMIT 1",
+                                  (JOB_ACCEPTED,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE jobs SET state = ?, attempts = attempts + 1, updated = ? WHERE identifier = ?",
+                            (JOB_RUNNING, time.time(), row[0]))
+            return row[0]
+        finally:
+            self.db.execute("COMMIT")
+
+    def finish(self, identifier: str):
+        self._set_state(identifier, JOB_FINISHED)
+
+    def fail(self, identifier: str, error: str = None):
+        self._set_state(identifier, JOB_FAILED, error)
+
+    def skip(self, identifier: str):
+        self._set_state(identifier, JOB_SKIPPED)
+
+    def set_lease(self, identifier: str, lease: Optional[str]):
+        """Remember the claim that this worker has on a job in the CE, see JobLease"""
+        self.db.execute("UPDATE jobs SET lease = ? WHERE identifier = ?", (lease, identifier))
+
+    def lease(self, identifier: str) -> Optional[str]:
+        row = self.db.execute("SELECT lease FROM jobs WHERE identifier = ?", (identifier,)).fetchone()
+        return row[0] if row else None
+
+    def release(self, identifier: str, error: str = None):
+        """Put a running job back in the queue to be run again, or fail it if it has been tried too many times.
+        Returns True if the job will be run again"""
+        attempts = self.attempts(identifier)
+        if attempts is not None and attempts < self.max_attempts:
+            self._set_state(identifier, JOB_ACCEPTED, error)
+            return True
+        self.fail(identifier, error)
+        return False
+
+    def state(self, identifier: str) -> Optional[str]:
+        row = self.db.execute("SELECT state FROM jobs WHERE identifier = ?", (identifier,)).fetchone()
+        return row[0] if row else None
+
+    def attempts(self, identifier: str) -> Optional[int]:
+        row = self.db.execute("SELECT attempts FROM jobs WHERE identifier = ?", (identifier,)).fetchone()
+        return row[0] if row else None
+
+    def jobs(self, state: str) -> List[str]:
+        """The identifiers of all jobs in a state, oldest first"""
+        rows = self.db.execute("SELECT identifier FROM jobs WHERE state = ? ORDER BY created", (state,))
+        return [row[0] for row in rows]
+
+
+async def recover_jobs(queue: JobQueue):
+    """Deal with jobs that were running when the worker stopped.
+    The status of each job is checked in the CE. Jobs that were completed or failed in the CE are
+    marked as such in the queue. Other jobs are put back in the queue to be run again, unless they
+    have already been tried ``max_attempts`` times, in which case they are failed in the CE too.
+    Arguments:
+        queue: the job queue
+    """
+    for identifier in queue.jobs(JOB_RUNNING):
+        resp = await submit_query_async(query_controlaction(identifier))
+        controlactions = resp['data']['ControlAction']
+        if not controlactions:
+            trompace.logger.warning(f"Job {identifier} no longer exists in the CE")
+            queue.fail(identifier, "ControlAction not found")
+            continue
+
+        status = controlactions[0]['actionStatus']
+        if status == str(ActionStatusType.CompletedActionStatus):
+            queue.finish(identifier)
+        elif status == str(ActionStatusType.FailedActionStatus):
+            queue.fail(identifier)
+        elif queue.release(identifier, "worker stopped while running the job"):
+            trompace.logger.info(f"Job {identifier} was interrupted, running it again")
+        else:
+            trompace.logger.warning(f"Job {identifier} was interrupted too many times, failing it")
+            error = f"Job was interrupted {queue.attempts(identifier)} times"
+            query_modify_ca = mutation_modify_controlaction(identifier, ActionStatusType.FailedActionStatus, error,
+                                                            datetime.datetime.now(datetime.timezone.utc))
+            await submit_query_async(query_modify_ca, auth_required=True)
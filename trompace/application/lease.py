@@ -0,0 +1,141 @@
+# Claim control action jobs so that only one of several workers subscribed to an entry point runs each job.
+import asyncio
+import datetime
+import random
+from typing import Optional
+
+import trompace
+from trompace.connection import submit_query_async
+from trompace.constants import ActionStatusType
+from trompace.exceptions import JobAlreadyClaimedException
+from trompace.mutations.controlaction import mutation_claim_controlaction, mutation_renew_controlaction_lease
+from trompace.queries.controlaction import query_controlaction_lease
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def parse_datetime(value: Optional[dict]) -> Optional[datetime.datetime]:
+    """Parse a _Neo4jDateTime ``{formatted}`` value from the CE"""
+    if not value or not value.get("formatted"):
+        return None
+    formatted = value["formatted"].replace("Z", "+00:00")
+    # The CE can return nanoseconds, but python only supports microseconds
+    if "." in formatted:
+        seconds, rest = formatted.split(".", 1)
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        formatted = seconds + "." + rest[:min(digits, 6)].ljust(6, "0") + rest[digits:]
+    parsed = datetime.datetime.fromisoformat(formatted)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+class JobLease:
+    """A worker's claim on a control action job.
+
+    The CE can't update a node only if it has a certain value, so claims are made optimistically.
+    A worker can claim a job if it is in PotentialActionStatus, or if it is in ActiveActionStatus and the
+    lease of the worker that claimed it has expired. The worker sets the job to ActiveActionStatus, with a
+    unique startTime and an endTime when its lease expires. It then waits ``settle_time`` seconds and reads
+    the job again. If another worker claimed the job at the same time, only one of their startTimes is
+    stored, and the other worker gives up the job.
+
+    While the job runs, the worker renews its lease every third of ``duration`` with ``hold``."""
+
+    def __init__(self, identifier: str, duration: float = 60, settle_time: float = 1,
+                 start_time: datetime.datetime = None):
+        """
+        Arguments:
+            identifier: the identifier of the control action job
+            duration: the number of seconds that a claim is valid for if it's not renewed
+            settle_time: the number of seconds to wait for other workers' claims before checking the claim
+            start_time: the start time of an earlier claim on the job by this worker, to take the job
+                        back after the worker was restarted
+        """
+        self.identifier = identifier
+        self.duration = duration
+        self.settle_time = settle_time
+        self.start_time = start_time
+
+    async def _read(self):
+        # From the primary, because a replica may not have the latest claim yet
+        resp = await submit_query_async(query_controlaction_lease(self.identifier), primary=True)
+        controlactions = resp['data']['ControlAction']
+        return controlactions[0] if controlactions else None
+
+    def _claimable(self, job):
+        if job is None:
+            return False
+        status = job['actionStatus']
+        if status == str(ActionStatusType.PotentialActionStatus):
+            return True
+        if status == str(ActionStatusType.ActiveActionStatus):
+            expires = parse_datetime(job.get('endTime'))
+            return expires is None or expires < _now()
+        return False
+
+    def _owned(self, job):
+        return job is not None and parse_datetime(job.get('startTime')) == self.start_time
+
+    async def claim(self) -> bool:
+        """Try to claim the job. Returns True if this worker now owns the job"""
+        job = await self._read()
+        if self.start_time is not None and self._owned(job):
+            await self.renew()
+            return True
+        if not self._claimable(job):
+            return False
+
+        # Make the start time unique between workers that claim at the same moment
+        self.start_time = _now() + datetime.timedelta(microseconds=random.randrange(1000))
+        lease_expires = self.start_time + datetime.timedelta(seconds=self.duration)
+        query = mutation_claim_controlaction(self.identifier, self.start_time, lease_expires)
+        await submit_query_async(query, auth_required=True)
+
+        await asyncio.sleep(self.settle_time)
+        if self._owned(await self._read()):
+            return True
+        trompace.logger.info(f"Job {self.identifier} was claimed by another worker")
+        self.start_time = None
+        return False
+
+    async def renew(self):
+        """Extend the lease on the job.
+        Raises:
+            JobAlreadyClaimedException if another worker has claimed the job since this worker did"""
+        if not self._owned(await self._read()):
+            raise JobAlreadyClaimedException(self.identifier)
+        lease_expires = _now() + datetime.timedelta(seconds=self.duration)
+        await submit_query_async(mutation_renew_controlaction_lease(self.identifier, lease_expires),
+                                 auth_required=True)
+
+    async def hold(self):
+        """Renew the lease until cancelled.
+        Raises:
+            JobAlreadyClaimedException if the lease is lost"""
+        while True:
+            await asyncio.sleep(self.duration / 3)
+            try:
+                await self.renew()
+            except JobAlreadyClaimedException:
+                raise
+            except Exception:
+                # The lease is still valid until it expires, try again at the next renewal
+                trompace.logger.exception(f"Could not renew the lease on job {self.identifier}")
+
+
+async def run_with_lease(lease: JobLease, coroutine):
+    """Run a coroutine while holding a lease on a job.
+    If the lease is lost, the coroutine is cancelled and JobAlreadyClaimedException is raised."""
+    job = asyncio.ensure_future(coroutine)
+    heartbeat = asyncio.ensure_future(lease.hold())
+    try:
+        await asyncio.wait([job, heartbeat], return_when=asyncio.FIRST_COMPLETED)
+        if heartbeat.done():
+            heartbeat.result()
+        return job.result()
+    finally:
+        job.cancel()
+        heartbeat.cancel()
@@ -0,0 +1,169 @@
+# Publish the output files of a control action job to the CE.
+import abc
+import asyncio
+import datetime
+import mimetypes
+import os
+import shutil
+import urllib.parse
+import uuid
+from typing import List, Tuple
+
+import trompace
+from trompace.connection import submit_query_async
+from trompace.constants import ActionStatusType
+from trompace.mutations.controlaction import mutation_add_actioninterface_result, \
+    mutation_update_controlaction_status
+from trompace.mutations.digitaldocument import mutation_create_digitaldocument
+from trompace.mutations.mediaobject import mutation_create_media_object
+from trompace.mutations.templates import format_batch_mutation
+
+# Output files with these types of content are published as MediaObjects, all others as DigitalDocuments
+MEDIA_TYPES = {"audio", "video", "image"}
+
+
+class ResultStore(abc.ABC):
+    """A place to put the output files of a job, so that they can be downloaded from a url"""
+
+    @abc.abstractmethod
+    async def store(self, path: str, job_id: str, name: str = None) -> str:
+        """Store a file and return the url that it can be downloaded from
+        Arguments:
+            path: the file to store
+            job_id: the identifier of the job
+            name: the path of the file relative to the output directory of the job, with / as separator, so that
+               files with the same name in different subdirectories don't overwrite each other. If not set, the
+               name of the file is used
+        """
+
+
+def _store_name(path: str, name: str = None) -> str:
+    name = name or os.path.basename(path)
+    if name.startswith("/") or ".." in name.split("/"):
+        raise ValueError(f"The name of a stored file must be a relative path in the job directory, not {name}")
+    return name
+
+
+class LocalDirectoryStore(ResultStore):
+    """Copy output files to a directory that is served by a web server at ``base_url``"""
+
+    def __init__(self, directory: str, base_url: str):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+
+    @staticmethod
+    def _copy(path: str, destination: str):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(path, destination)
+
+    async def store(self, path, job_id, name=None):
+        name = _store_name(path, name)
+        destination = os.path.join(self.directory, job_id, *name.split("/"))
+        # Copy in a thread, so that copying large files doesn't block the other jobs
+        await asyncio.get_running_loop().run_in_executor(None, self._copy, path, destination)
+        return f"{self.base_url}/{urllib.parse.quote(f'{job_id}/{name}')}"
+
+
+class HttpUploadStore(ResultStore):
+    """Upload output files with an HTTP PUT request to ``base_url``"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    async def store(self, path, job_id, name=None):
+        import aiohttp
+
+        url = f"{self.base_url}/{urllib.parse.quote(f'{job_id}/{_store_name(path, name)}')}"
+        async with aiohttp.ClientSession() as session:
+            with open(path, "rb") as fp:
+                async with session.put(url, data=fp) as response:
+                    response.raise_for_status()
+        return url
+
+
+def result_store_from_config(config):
+    """Get the ResultStore set in the worker section of the configuration, or None if there isn't one"""
+    if config.result_upload_url:
+        return HttpUploadStore(config.result_upload_url)
+    if config.result_dir and config.result_base_url:
+        return LocalDirectoryStore(config.result_dir, config.result_base_url)
+    return None
+
+
+def output_files(directory: str):
+    """All files in a directory and its subdirectories, in a stable order"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files)
+    return sorted(paths)
+
+
+def mutation_create_result(path: str, url: str, identifier: str, creator: str, contributor: str,
+                           language: str = "en"):
+    """Returns a mutation for creating the node that describes an output file of a job.
+    Audio, video and image files are MediaObjects, other files are DigitalDocuments.
+    Arguments:
+        path: the path of the output file
+        url: the url that the file was stored at
+        identifier: the identifier to give the new node
+        creator: The person, organization or service who created the file, e.g. the url of the application
+        contributor: The person, organization or service who is adding the file to the CE
+        language: the language of the metadata
+    """
+    title = os.path.basename(path)
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if mimetype.split("/")[0] in MEDIA_TYPES:
+        return mutation_create_media_object(identifier=identifier, title=title, name=title, creator=creator,
+                                            contributor=contributor, source=url, contenturl=url, format_=mimetype,
+                                            encodingformat=mimetype, language=language)
+    return mutation_create_digitaldocument(identifier=identifier, title=title, creator=creator,
+                                           contributor=contributor, source=url, format_=mimetype, language=language)
+
+
+def mutation_complete_job(controlaction_id: str, results: List[Tuple[str, str]], end_time: datetime.datetime = None):
+    """Returns a single mutation that creates the result nodes of a job, links them to the ControlAction
+    and sets the ControlAction to CompletedActionStatus.
+    Arguments:
+        controlaction_id: the identifier of the control action
+        results: (identifier, mutation) pairs of the nodes to create, from mutation_create_result
+        end_time: the time that the job ended, which replaces the expiry of the worker's lease in the endTime
+           of the control action. If not set, the current time
+    """
+    end_time = end_time or datetime.datetime.now(datetime.timezone.utc)
+    mutations = []
+    for identifier, create_mutation in results:
+        mutations.append(create_mutation)
+        mutations.append(mutation_add_actioninterface_result(controlaction_id, identifier))
+    mutations.append(mutation_update_controlaction_status(controlaction_id, ActionStatusType.CompletedActionStatus,
+                                                          end_time))
+    return format_batch_mutation(mutations)
+
+
+async def publish_results(controlaction_id: str, paths: List[str], store: ResultStore, creator: str,
+                          contributor: str, language: str = "en", root: str = None):
+    """Store the output files of a job and complete the job in a single request to the CE.
+    Arguments:
+        controlaction_id: the identifier of the control action
+        paths: the output files of the job
+        store: where to put the files. If None, the job is completed without results
+        creator: The person, organization or service who created the files, e.g. the url of the application
+        contributor: The person, organization or service who is adding the files to the CE
+        language: the language of the metadata
+        root: the output directory of the job. Files are stored with their path relative to it, or with only
+           their name if it isn't set
+    Returns:
+        the identifiers of the created nodes, in the same order as ``paths``
+    """
+    results = []
+    if store is None and paths:
+        trompace.logger.warning(f"No result store is configured, not publishing {len(paths)} output files")
+    elif paths:
+        names = [os.path.relpath(path, root).replace(os.sep, "/") if root else None for path in paths]
+        urls = await asyncio.gather(*[store.store(path, controlaction_id, name) for path, name in zip(paths, names)])
+        for path, url in zip(paths, urls):
+            identifier = str(uuid.uuid4())
+            results.append((identifier, mutation_create_result(path, url, identifier, creator, contributor,
+                                                               language)))
+
+    await submit_query_async(mutation_complete_job(controlaction_id, results), auth_required=True)
+    return [identifier for identifier, _ in results]
@@ -0,0 +1,261 @@
+# Make the software application, entry point, control action, properties and property value specifications
+# described in the application and entry point config files exist in the CE, with as few requests as possible.
+import configparser
+from typing import Callable, Dict, List, Optional
+
+import trompace
+from trompace import StringConstant
+from trompace.connection import submit_query_async
+from trompace.constants import ActionStatusType
+from trompace.exceptions import ConfigRequirementException
+from trompace.mutations.application import mutation_create_application, mutation_add_entrypoint_application
+from trompace.mutations.controlaction import mutation_create_controlaction, mutation_add_entrypoint_controlaction, \
+    mutation_add_controlaction_object
+from trompace.mutations.entrypoint import mutation_create_entry_point
+from trompace.mutations.property import mutation_create_property, mutation_create_propertyvaluespecification
+from trompace.mutations.templates import format_batch_mutation
+from trompace.queries.templates import format_query, format_batch_query
+
+APP_FIELDS = ['application_name', 'subject', 'source', 'formatin', 'contributor', 'creator', 'language']
+EP_FIELDS = ['name', 'description', 'actionplatform', 'contenttype', 'encodingtype', 'formatin']
+CA_FIELDS = ['name', 'description', 'actionstatus', 'numproperties', 'numpropertyvaluespecifications']
+PROPERTY_FIELDS = ['name', 'title', 'description', 'rangeincludes']
+PVS_FIELDS = ['name', 'description', 'defaultValue', 'valuemaxlength', 'valueminlength', 'multiplevalues',
+              'valuename', 'valuepattern', 'valuerequired']
+
+# The fields to query to find the nodes that are linked to a node
+LINK_FIELDS = {
+    "SoftwareApplication": [],
+    "EntryPoint": ["actionApplication {\n  identifier\n}",
+                   "potentialAction {\n  ... on ControlAction {\n    identifier\n  }\n}"],
+    "ControlAction": ["object {\n  ... on Property {\n    identifier\n  }\n"
+                      "  ... on PropertyValueSpecification {\n    identifier\n  }\n}"],
+    "Property": [],
+    "PropertyValueSpecification": [],
+}
+
+
+class DesiredNode:
+    """A node that should exist in the CE, described by a section of a config file"""
+
+    def __init__(self, alias: str, typename: str, config: configparser.ConfigParser, section: str,
+                 mutation: str):
+        """
+        Arguments:
+            alias: a unique name for the node in batched queries and mutations
+            typename: the type of the node in the CE
+            config: the config file that describes the node
+            section: the section of the config file that describes the node
+            mutation: the mutation to create the node
+        """
+        self.alias = alias
+        self.typename = typename
+        self.config = config
+        self.section = section
+        self.mutation = mutation
+
+    @property
+    def identifier(self) -> Optional[str]:
+        return self.config[self.section].get('ce_id') or None
+
+    @identifier.setter
+    def identifier(self, value: str):
+        self.config[self.section]['ce_id'] = value
+
+
+class DesiredLink:
+    """A link that should exist between two nodes. ``field`` is the field of ``target`` in which
+    ``source`` is listed when the link exists, and ``mutation`` is called with the identifiers of
+    ``source`` and ``target`` to create it"""
+
+    def __init__(self, source: DesiredNode, target: DesiredNode, field: str,
+                 mutation: Callable[[str, str], str]):
+        self.source = source
+        self.target = target
+        self.field = field
+        self.mutation = mutation
+
+
+def _check_fields(section, fields):
+    missing_fields = [x for x in fields if x not in section.keys()]
+    if missing_fields:
+        raise ConfigRequirementException(missing_fields)
+
+
+def _action_status(value: str):
+    try:
+        return ActionStatusType[value]
+    except KeyError:
+        trompace.logger.warning(f"'{value}' is not an ActionStatusType, using PotentialActionStatus")
+        return ActionStatusType.PotentialActionStatus
+
+
+def desired_state(app_config: configparser.ConfigParser, ep_config: configparser.ConfigParser = None):
+    """Read the nodes and links that should exist in the CE from the application and entry point configs.
+    Arguments:
+        app_config: the application config, with an ``app`` section
+        ep_config: the entry point config, with ``EntryPoint``, ``ControlAction``, ``PropertyN`` and
+                   ``PropertyValueSpecificationN`` sections. If None, only the application is described.
+    Returns:
+        a list of DesiredNode and a list of DesiredLink
+    Raises:
+        ConfigRequirementException if a required section or value is missing
+    """
+    if 'app' not in app_config:
+        raise ConfigRequirementException('app')
+    app = app_config['app']
+    _check_fields(app, APP_FIELDS)
+    app_node = DesiredNode("app", "SoftwareApplication", app_config, 'app', mutation_create_application(
+        application_name=app['application_name'], contributor=app['contributor'], creator=app['creator'],
+        source=app['source'], subject=app['subject'], language=app['language'],
+        description=app.get('description'), formatin=app['formatin']))
+    nodes = [app_node]
+    links = []
+    if ep_config is None:
+        return nodes, links
+
+    missing_sections = [x for x in ['EntryPoint', 'ControlAction'] if x not in ep_config]
+    if missing_sections:
+        raise ConfigRequirementException(missing_sections)
+
+    ep = ep_config['EntryPoint']
+    _check_fields(ep, EP_FIELDS)
+    ep_node = DesiredNode("entrypoint", "EntryPoint", ep_config, 'EntryPoint', mutation_create_entry_point(
+        name=ep['name'], contributor=app['contributor'], subject=app['subject'], creator=app['creator'],
+        source=app['source'], language=app['language'], actionPlatform=ep['actionplatform'],
+        contentType=ep['contenttype'].split(','), encodingType=ep['encodingtype'].split(','),
+        formatin=ep['formatin'], description=ep['description']))
+    nodes.append(ep_node)
+    links.append(DesiredLink(app_node, ep_node, "actionApplication", mutation_add_entrypoint_application))
+
+    ca = ep_config['ControlAction']
+    _check_fields(ca, CA_FIELDS)
+    ca_node = DesiredNode("controlaction", "ControlAction", ep_config, 'ControlAction', mutation_create_controlaction(
+        ca['name'], _action_status(ca['actionstatus']), ca['description']))
+    nodes.append(ca_node)
+    links.append(DesiredLink(ca_node, ep_node, "potentialAction",
+                             lambda ca_id, ep_id: mutation_add_entrypoint_controlaction(ep_id, ca_id)))
+
+    for i in range(1, int(ca['numproperties']) + 1):
+        section = 'Property{}'.format(i)
+        if section not in ep_config:
+            raise ConfigRequirementException(section)
+        pro = ep_config[section]
+        _check_fields(pro, PROPERTY_FIELDS)
+        rangeIncludes = [StringConstant(x.strip()) for x in pro['rangeincludes'].split(',')]
+        node = DesiredNode("property{}".format(i), "Property", ep_config, section, mutation_create_property(
+            pro['title'], pro['name'], rangeIncludes, pro['description']))
+        nodes.append(node)
+        links.append(DesiredLink(node, ca_node, "object",
+                                 lambda property_id, ca_id: mutation_add_controlaction_object(ca_id, property_id)))
+
+    for i in range(1, int(ca['numpropertyvaluespecifications']) + 1):
+        section = 'PropertyValueSpecification{}'.format(i)
+        if section not in ep_config:
+            raise ConfigRequirementException(section)
+        pvs = ep_config[section]
+        _check_fields(pvs, PVS_FIELDS)
+        node = DesiredNode("propertyvaluespecification{}".format(i), "PropertyValueSpecification", ep_config,
+                           section, mutation_create_propertyvaluespecification(
+                               pvs['name'], pvs['defaultValue'], int(pvs['valuemaxlength']),
+                               int(pvs['valueminlength']), pvs.getboolean('multiplevalues'), pvs['valuename'],
+                               pvs['valuepattern'], pvs.getboolean('valuerequired'), pvs['description']))
+        nodes.append(node)
+        links.append(DesiredLink(node, ca_node, "object",
+                                 lambda pvs_id, ca_id: mutation_add_controlaction_object(ca_id, pvs_id)))
+
+    return nodes, links
+
+
+def query_current_state(nodes: List[DesiredNode]) -> Optional[str]:
+    """Returns a single query for all nodes that already have an identifier, and the nodes they are linked to.
+    Returns None if no node has an identifier"""
+    existing = [node for node in nodes if node.identifier]
+    if not existing:
+        return None
+    queries = [format_query(node.typename, {"identifier": node.identifier}, ["identifier"] + LINK_FIELDS[node.typename])
+               for node in existing]
+    return format_batch_query(queries, [node.alias for node in existing])
+
+
+def plan(nodes: List[DesiredNode], links: List[DesiredLink], current: Dict[str, list]):
+    """Compare the desired state with the state of the CE.
+    Arguments:
+        nodes: the nodes that should exist
+        links: the links that should exist
+        current: the ``data`` of the response to ``query_current_state``
+    Returns:
+        the nodes to create and the links to create
+    """
+    found = {}
+    for node in nodes:
+        results = current.get(node.alias) or []
+        if results:
+            found[node.alias] = results[0]
+        elif node.identifier:
+            trompace.logger.info(f"{node.typename} {node.identifier} not found in the CE, creating it again")
+
+    to_create = [node for node in nodes if node.alias not in found]
+    to_link = []
+    for link in links:
+        if link.source.alias in found and link.target.alias in found:
+            linked_ids = [x.get('identifier') for x in found[link.target.alias].get(link.field) or []]
+            if link.source.identifier in linked_ids:
+                continue
+        to_link.append(link)
+    return to_create, to_link
+
+
+async def apply(to_create: List[DesiredNode], to_link: List[DesiredLink], created: Callable[[], None] = None):
+    """Create nodes in one batched mutation, and then link them in a second one.
+    The identifiers of the created nodes are set in their configs, and ``created`` is called before the nodes are
+    linked to save the configs, so that the nodes aren't created again if linking them fails."""
+    if to_create:
+        resp = await submit_query_async(format_batch_mutation([node.mutation for node in to_create],
+                                                              [node.alias for node in to_create]),
+                                        auth_required=True)
+        for node in to_create:
+            node.identifier = resp['data'][node.alias]['identifier']
+            print("Created {} {}".format(node.typename, node.identifier))
+        if created is not None:
+            created()
+    if to_link:
+        mutations = [link.mutation(link.source.identifier, link.target.identifier) for link in to_link]
+        await submit_query_async(format_batch_mutation(mutations), auth_required=True)
+        print("Created {} links".format(len(to_link)))
+
+
+async def reconcile(app_config_file: str, ep_config_file: str = None):
+    """Make the CE match the application and entry point config files.
+    The current state is read from the CE in one query, and the missing nodes and links are created in
+    two batched mutations. The identifiers of created nodes are written to the config files as soon as they are
+    created, before the nodes are linked.
+    Arguments:
+        app_config_file: The path to the config file for the application.
+        ep_config_file: The path to the config file for the entry point, or None to only create the application.
+    """
+    app_config = configparser.ConfigParser()
+    app_config.read(app_config_file)
+    ep_config = None
+    if ep_config_file is not None:
+        ep_config = configparser.ConfigParser()
+        ep_config.read(ep_config_file)
+
+    nodes, links = desired_state(app_config, ep_config)
+    query = query_current_state(nodes)
+    current = {}
+    if query:
+        current = (await submit_query_async(query))['data']
+    to_create, to_link = plan(nodes, links, current)
+    if not to_create and not to_link:
+        print("Application and entry point already exist")
+        return
+
+    def save():
+        with open(app_config_file, 'w') as configfile:
+            app_config.write(configfile)
+        if ep_config is not None:
+            with open(ep_config_file, 'w') as configfile:
+                ep_config.write(configfile)
+
+    await apply(to_create, to_link, save)
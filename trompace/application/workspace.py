@@ -0,0 +1,78 @@
+# Isolated scratch directories for control action jobs.
+import os
+import shutil
+import tempfile
+
+import trompace
+from trompace.exceptions import WorkspaceQuotaException
+
+
+class JobWorkspace:
+    """A temporary directory that a single control action job downloads its inputs to and runs in.
+    Use it as a context manager. The directory is removed when the job ends, unless the job failed
+    and ``keep_failed`` is set, in which case it is left in place for debugging.
+
+    The directory contains an ``inputs`` directory for downloaded files and an ``output`` directory
+    for the files that the job creates."""
+
+    def __init__(self, job_id: str, base_dir: str = None, quota: int = None, keep_failed: bool = False):
+        """
+        Arguments:
+            job_id: the identifier of the job, used in the name of the directory
+            base_dir: the directory to create the workspace in, for example a tmpfs mount.
+                      If None, use the system temporary directory.
+            quota: the maximum number of bytes that the workspace may use, or None for no limit
+            keep_failed: if True, don't remove the workspace of a job that raised an exception
+        """
+        self.job_id = job_id
+        self.base_dir = base_dir
+        self.quota = quota
+        self.keep_failed = keep_failed
+        self.path = None
+
+    @property
+    def inputs(self):
+        return os.path.join(self.path, "inputs")
+
+    @property
+    def output(self):
+        return os.path.join(self.path, "output")
+
+    def __enter__(self):
+        if self.base_dir:
+            os.makedirs(self.base_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=f"trompace-job-{self.job_id}-", dir=self.base_dir)
+        os.makedirs(self.inputs)
+        os.makedirs(self.output)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self.keep_failed:
+            trompace.logger.warning(f"Job {self.job_id} failed, keeping its workspace {self.path}")
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+        return False
+
+    def usage(self):
+        """The number of bytes used by the files in the workspace"""
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def remaining(self):
+        """The number of bytes that can still be written to the workspace, or None if there is no quota"""
+        if self.quota is None:
+            return None
+        return max(self.quota - self.usage(), 0)
+
+    def check_quota(self):
+        """Raise WorkspaceQuotaException if the workspace uses more than its quota"""
+        if self.quota is not None:
+            usage = self.usage()
+            if usage > self.quota:
+                raise WorkspaceQuotaException(self.job_id, usage, self.quota)
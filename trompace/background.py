@@ -0,0 +1,96 @@
+# Send requests from synchronous code with the async transport, which runs on a shared event loop in a
+# background thread, so that scripts can send many requests at the same time without using asyncio.
+import asyncio
+import concurrent.futures
+import threading
+from typing import Iterable, List
+
+from trompace.connection import CEClient, default_client, gather_futures
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """The event loop that BackgroundClient runs requests on. It runs in a daemon thread, which is started the
+    first time that this is called, and is shared by all BackgroundClients"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="trompace-background-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+class BackgroundClient:
+    """Sends requests of a CEClient concurrently from synchronous code. Requests are sent by the async transport
+    on the background event loop, sharing one session, and no more than ``concurrency`` are sent at a time::
+
+        with BackgroundClient(concurrency=20) as background:
+            future = background.submit(query_person(identifier="..."))
+            results = background.submit_many(mutations, auth_required=True)
+            person = future.result()
+
+    The ``max_requests_per_second`` limit of the client applies to these requests too.
+    A BackgroundClient can be used from several threads.
+
+    Arguments:
+        client: the client to send requests with, or the default client if not set
+        concurrency: the maximum number of requests that are being sent at the same time
+    """
+
+    def __init__(self, client: CEClient = None, concurrency: int = 10):
+        self.client = client or default_client
+        self.concurrency = concurrency
+        self._loop = background_loop()
+        self._session = None
+        self._semaphore = None
+
+    async def _submit(self, querystr: str, auth_required: bool):
+        # The session and semaphore belong to the background loop, so they are only used in coroutines on it
+        if self._session is None:
+            self._session = self.client.new_session()
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await self.client.submit_query_async(querystr, auth_required, self._session)
+
+    def submit(self, querystr: str, auth_required=False) -> concurrent.futures.Future:
+        """Start sending a query, and return a future of its response.
+        Arguments:
+            querystr: The query to be submitted
+            auth_required: If true, send an authentication key with this request
+        Returns:
+            A concurrent.futures.Future whose result is the response of the CE. If the query fails, the
+            future has its exception, like a QueryException
+        """
+        return asyncio.run_coroutine_threadsafe(self._submit(querystr, auth_required), self._loop)
+
+    def submit_many(self, queries: Iterable[str], auth_required=False, return_exceptions=False) -> List:
+        """Send queries concurrently, and wait until they have all finished.
+        Arguments:
+            queries: The queries to be submitted
+            auth_required: If true, send an authentication key with these requests
+            return_exceptions: If true, the exception of a query that fails is returned in its place in the
+               results. Otherwise, the exception of the first query that failed is raised, after all the queries
+               have finished
+        Returns:
+            The responses of the CE, in the order of the queries
+        """
+        futures = [self.submit(querystr, auth_required) for querystr in queries]
+        concurrent.futures.wait(futures)
+        return gather_futures(futures, return_exceptions)
+
+    def close(self):
+        """Close the connections of this client"""
+        if self._session is not None:
+            # httpx.AsyncClient is closed with aclose, and aiohttp.ClientSession with close
+            close = getattr(self._session, "aclose", None) or self._session.close
+            asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+            self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,327 @@
+# Send many mutations in batches, and deal with the mutations of a batch that fail without losing the others.
+import datetime
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+import trompace
+from trompace import jsoncodec
+from trompace.connection import operation_name, submit_query_async
+from trompace.exceptions import QueryException
+from trompace.journal import MutationJournal
+from trompace.mutations.templates import format_batch_mutation
+
+
+class MutationResult:
+    """The outcome of one mutation of a batch.
+    ``data`` is the result of the mutation, found in the response under its alias, and ``errors`` are the GraphQL
+    errors of its last attempt, or None if it succeeded. ``attempts`` is the number of times that it was run.
+    ``resumed`` is true if the mutation wasn't sent, because it succeeded before according to a MutationJournal."""
+
+    def __init__(self, index: int, mutation: str, alias: str):
+        self.index = index
+        self.mutation = mutation
+        self.alias = alias
+        self.data = None
+        self.errors = None
+        self.attempts = 0
+        self.resumed = False
+
+    @classmethod
+    def from_journal(cls, index: int, mutation: str, outcome: dict):
+        result = cls(index, mutation, None)
+        result.data = outcome["data"]
+        result.errors = outcome["errors"]
+        result.attempts = outcome["attempts"]
+        result.resumed = True
+        return result
+
+    @property
+    def succeeded(self):
+        return self.errors is None and self.attempts > 0
+
+    def __repr__(self):
+        status = "succeeded" if self.succeeded else f"failed: {self.errors}"
+        return f"MutationResult({self.index}, {status}, attempts={self.attempts})"
+
+
+class DeadLetterFile:
+    """Mutations that failed after all their attempts, appended to a file with one JSON object per line, so that
+    they can be looked at and sent again later. It can be shared by threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, result: MutationResult):
+        record = {"mutation": result.mutation, "errors": result.errors, "attempts": result.attempts,
+                  "time": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+        with self._lock, open(self.path, "ab") as fp:
+            fp.write(jsoncodec.dumps(record) + b"\n")
+
+    def read(self) -> List[dict]:
+        """The failed mutations in the file, oldest first"""
+        try:
+            with open(self.path, "rb") as fp:
+                return [jsoncodec.loads(line) for line in fp if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+# HTTP statuses of a batch that was too large or too slow for the CE or a proxy in front of it
+SHRINK_STATUSES = {408, 413, 504}
+
+
+def _is_timeout(exception: Exception) -> bool:
+    # asyncio, aiohttp, requests and httpx timeouts
+    return isinstance(exception, TimeoutError) or "Timeout" in type(exception).__name__
+
+
+class BatchSizer:
+    """Chooses the number of mutations to send in one batch for each operation, like CreateMediaObject, from how
+    long batches of that operation take. A batch that is full and takes less than ``target_latency`` seconds
+    makes the next batches up to 25% larger, and a batch that takes longer makes them smaller in proportion.
+    A batch that was too large for the CE, because the request was rejected as too large or timed out, halves
+    the size. It can be shared by threads and event loops.
+
+    Add it to a MetricsCollector with ``add_batch_sizer`` to report the sizes.
+
+    Arguments:
+        target_latency: the number of seconds that a batch should take
+        initial_size: the size of the first batch of each operation
+        min_size, max_size: the limits of the size
+    """
+
+    def __init__(self, target_latency: float = 1.0, initial_size: int = 50, min_size: int = 1,
+                 max_size: int = 1000):
+        self.target_latency = target_latency
+        self.initial_size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def size(self, operation: str) -> int:
+        """The number of mutations to send in the next batch of operation"""
+        with self._lock:
+            return self._sizes.get(operation, self.initial_size)
+
+    def sizes(self) -> Dict[str, int]:
+        """The current size of each operation that has been sent"""
+        with self._lock:
+            return dict(sorted(self._sizes.items()))
+
+    def record(self, operation: str, size: int, latency: float):
+        """Change the size of operation after a batch of size mutations took latency seconds"""
+        with self._lock:
+            current = self._sizes.get(operation, self.initial_size)
+            # The size that would take target_latency, if the time of a batch is proportional to its size
+            projected = int(size * self.target_latency / latency) if latency > 0 else self.max_size
+            if latency > self.target_latency:
+                current = min(current, projected)
+            elif size >= current:
+                # Only a full batch shows that the size can grow
+                current = max(current, min(current + max(1, current // 4), projected))
+            self._sizes[operation] = max(self.min_size, min(self.max_size, current))
+
+    def shrink(self, operation: str, size: int):
+        """Halve the size of operation after a batch of size mutations was too large for the CE"""
+        with self._lock:
+            current = max(self.min_size, min(self._sizes.get(operation, self.initial_size), size) // 2)
+            self._sizes[operation] = current
+        trompace.logger.info(f"Batches of {size} {operation} mutations are too large, sending {current}")
+
+
+def _attribute_errors(errors: List[dict], aliases) -> Tuple[Dict[str, List[dict]], List[dict]]:
+    """Split the errors of a response into the errors of each alias, found from the first element of their
+    path, and the errors that cannot be attributed to one mutation, like a syntax error in the document"""
+    by_alias = {}
+    other = []
+    for error in errors:
+        path = error.get("path") or []
+        if path and path[0] in aliases:
+            by_alias.setdefault(path[0], []).append(error)
+        else:
+            other.append(error)
+    return by_alias, other
+
+
+async def _send(submit, session, items: List[MutationResult], auth_required: bool, stats,
+                sizer: Optional[BatchSizer]) -> List[MutationResult]:
+    """Send items in one batch, and set the result of each item that the CE ran. If the CE rejected the whole
+    batch, the items with errors of their own fail and the others are sent again without them. If no item has
+    errors of its own, the batch is split in two halves that are sent separately, until the mutation with the
+    error is found.
+    Returns:
+        the items that failed
+    """
+    aliases = [item.alias for item in items]
+    query = format_batch_mutation([item.mutation for item in items], aliases)
+    operation = operation_name(items[0].mutation)
+    record = sizer is not None
+    start = time.perf_counter()
+    try:
+        if stats is not None:
+            stats.requests += 1
+        data, errors = (await submit(query, auth_required, session)).get("data"), []
+    except QueryException as e:
+        data, errors = e.data, e.errors
+        if record and e.status in SHRINK_STATUSES:
+            sizer.shrink(operation, len(items))
+            record = False
+    except Exception as e:
+        if record and _is_timeout(e):
+            sizer.shrink(operation, len(items))
+        raise
+    if record:
+        sizer.record(operation, len(items), time.perf_counter() - start)
+
+    by_alias, other = _attribute_errors(errors, set(aliases))
+    if data is None:
+        # Nothing was run
+        if by_alias and len(by_alias) < len(items):
+            # Send the mutations without errors of their own again, without the ones that have errors
+            not_run = [item for item in items if item.alias not in by_alias]
+            trompace.logger.debug(f"Batch of {len(items)} mutations failed, sending the {len(not_run)} mutations "
+                                  f"without errors again")
+            failed = _set_results([item for item in items if item.alias in by_alias], None, by_alias, other)
+            return failed + await _send(submit, session, not_run, auth_required, stats, sizer)
+        if not by_alias and len(items) > 1:
+            half = len(items) // 2
+            trompace.logger.debug(f"Batch of {len(items)} mutations failed, sending it in two halves: {other}")
+            return (await _send(submit, session, items[:half], auth_required, stats, sizer) +
+                    await _send(submit, session, items[half:], auth_required, stats, sizer))
+    return _set_results(items, data, by_alias, other)
+
+
+def _set_results(items: List[MutationResult], data: Optional[dict], by_alias: Dict[str, List[dict]],
+                 other: List[dict]) -> List[MutationResult]:
+    """Set the result of each item that was run, and return the items that failed. An item without data and
+    without errors of its own didn't run, maybe because of an error in another one, and gets the errors that
+    aren't attributed to a mutation"""
+    failed = []
+    for item in items:
+        item.attempts += 1
+        item.data = (data or {}).get(item.alias)
+        item.errors = by_alias.get(item.alias)
+        if item.errors is None and item.data is None:
+            item.errors = other or [{"message": "The CE returned no data for the mutation"}]
+        if item.errors is not None:
+            failed.append(item)
+    return failed
+
+
+async def submit_batch(mutations: List[str], aliases: List[str] = None,
+                       submit: Callable[..., Awaitable[dict]] = None, session=None, auth_required: bool = True,
+                       max_attempts: int = 2, dead_letter: Optional[DeadLetterFile] = None,
+                       stats=None, sizer: BatchSizer = None,
+                       finished: Callable[[MutationResult], None] = None) -> List[MutationResult]:
+    """Send mutations to the CE in one batch, and find out which of them succeeded.
+    A mutation that failed with an error is sent again, up to ``max_attempts`` times, without the mutations that
+    succeeded. If the CE rejects the whole batch, for example because one mutation is invalid or the request is
+    too large, the batch is split in two until each part succeeds or only has one mutation. Mutations that
+    still fail are written to ``dead_letter``, so that one bad mutation doesn't stop the others.
+    Arguments:
+        mutations: mutations created by the other mutation functions
+        aliases: a name for each mutation in the batch. If not set, the mutations are named m0, m1, ...
+        submit: the function to send a query with, like ``CEClient.submit_query_async``. If not set,
+           ``trompace.connection.submit_query_async`` is used
+        session: a session from ``new_session()`` of the client to send the requests with
+        auth_required: if true, send an authentication key with the requests
+        max_attempts: the number of times to run a mutation before giving up on it
+        dead_letter: if set, where to write the mutations that failed after all their attempts
+        stats: if set, an object with a ``requests`` counter, like BulkStats, that is incremented for each request
+        sizer: if set, told how long each request took, to choose the size of the next batches. The batch is
+           counted as a batch of the operation of its first mutation
+        finished: if set, called with the result of each mutation that was run, like ``journal.finish``. It is
+           also called if an error of the transport stops the batch, for the mutations that were run before it
+    Returns:
+        A MutationResult for each mutation, in the order of the mutations
+    Raises:
+        Errors of the transport, like a connection error, which don't say if any mutation was run. The
+        mutations that ran before the error, for example in the first half of a batch that was split, are
+        passed to ``finished`` first
+    """
+    if aliases is None:
+        aliases = ["m{}".format(i) for i in range(len(mutations))]
+    if len(aliases) != len(mutations):
+        raise ValueError("there must be one alias for each mutation")
+    submit = submit or submit_query_async
+    results = [MutationResult(index, mutation, alias)
+               for index, (mutation, alias) in enumerate(zip(mutations, aliases))]
+    pending = results
+    try:
+        while pending:
+            failed = await _send(submit, session, pending, auth_required, stats, sizer)
+            pending = [item for item in failed if item.attempts < max_attempts]
+            for item in failed:
+                if item.attempts >= max_attempts:
+                    trompace.logger.warning(f"Mutation {item.index} of a batch failed {item.attempts} times: "
+                                            f"{item.errors}")
+                    if dead_letter is not None:
+                        dead_letter.add(item)
+    finally:
+        # Also after an error of the transport, so that the outcome of the mutations that ran isn't lost
+        if finished is not None:
+            for item in results:
+                if item.attempts:
+                    finished(item)
+    return results
+
+
+async def submit_mutations(mutations: Union[Iterable[str], Mapping[int, str]], sizer: BatchSizer = None,
+                           submit: Callable[..., Awaitable[dict]] = None, session=None, auth_required: bool = True,
+                           max_attempts: int = 2, dead_letter: Optional[DeadLetterFile] = None,
+                           stats=None, journal: MutationJournal = None) -> AsyncIterator[MutationResult]:
+    """Send any number of mutations in batches with submit_batch. Consecutive mutations of the same operation
+    are sent together, in batches of the size that ``sizer`` chooses for the operation, so that each operation
+    gets the largest batches that the CE can run within the target latency.
+    Arguments:
+        mutations: mutations created by the other mutation functions, which can be a lazy iterable, or a dict
+           of the position of each mutation to the mutation, like ``MutationJournal.pending()``
+        sizer: chooses the size of the batches. If not set, a BatchSizer with its default settings is used
+        journal: if set, each batch is written to the journal before it is sent, and the outcome of each
+           mutation after it. Mutations that succeeded in an earlier run of the same import, according to the
+           journal, are not sent again
+        The other arguments are the same as those of submit_batch
+    Returns:
+        An async iterator of a MutationResult for each mutation, in the order of the mutations. The ``index`` of
+        each result is its position in mutations
+    """
+    sizer = sizer or BatchSizer()
+
+    async def send(batch):
+        finished = None
+        if journal is not None:
+            journal.begin(batch)
+
+            def finished(result):
+                journal.finish(batch[result.index][0], result.mutation, result.data, result.errors, result.attempts)
+
+        results = await submit_batch([mutation for _, mutation in batch], None, submit, session, auth_required,
+                                     max_attempts, dead_letter, stats, sizer, finished)
+        for result in results:
+            result.index = batch[result.index][0]
+        return results
+
+    batch = []
+    operation = None
+    items = mutations.items() if isinstance(mutations, Mapping) else enumerate(mutations)
+    for position, mutation in items:
+        outcome = journal.completed(position, mutation) if journal is not None else None
+        mutation_operation = None if outcome is not None else operation_name(mutation)
+        if batch and (outcome is not None or mutation_operation != operation or
+                      len(batch) >= sizer.size(operation)):
+            for result in await send(batch):
+                yield result
+            batch = []
+        if outcome is not None:
+            yield MutationResult.from_journal(position, mutation, outcome)
+            continue
+        operation = mutation_operation
+        batch.append((position, mutation))
+    if batch:
+        for result in await send(batch):
+            yield result
+    if journal is not None:
+        journal.sync()
@@ -0,0 +1,281 @@
+# Request a control action for many inputs at once, and gather the results as the jobs finish.
+import asyncio
+import configparser
+import math
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import trompace
+from trompace import StringConstant
+from trompace.batch import BatchSizer, DeadLetterFile, submit_batch
+from trompace.connection import new_session, submit_query_async
+from trompace.constants import ActionStatusType
+from trompace.exceptions import ValueNotFound
+from trompace.journal import MutationJournal
+from trompace.mutations.controlaction import mutation_request_controlaction
+from trompace.queries.templates import format_query, format_batch_query
+
+FINISHED_STATUSES = {str(ActionStatusType.CompletedActionStatus), str(ActionStatusType.FailedActionStatus)}
+
+STATUS_RETURN_ITEMS = [
+    "identifier",
+    "actionStatus",
+    "error",
+    "result {\n  ... on DigitalDocument {\n    identifier\n    source\n  }\n"
+    "  ... on MediaObject {\n    identifier\n    source\n    contentUrl\n  }\n}"
+]
+
+
+class RequestTemplate:
+    """The control action of an entry point and its properties and property value specifications,
+    used to make a RequestControlAction mutation for each set of inputs.
+
+    Inputs are given as a dict, with the title of a Property mapped to the identifier of the node to use
+    for it, and the valueName of a PropertyValueSpecification mapped to its value. Property value
+    specifications that are not in the inputs get their default value."""
+
+    def __init__(self, entrypoint_id: str, controlaction_id: str, properties: Dict[str, dict],
+                 property_values: Dict[str, dict]):
+        """
+        Arguments:
+            entrypoint_id: the identifier of the entry point
+            controlaction_id: the identifier of the potential control action of the entry point
+            properties: for each Property title, a dict with its ``identifier`` and ``nodeType``
+            property_values: for each PropertyValueSpecification valueName, a dict with its ``identifier``,
+                             ``valuePattern``, ``defaultValue`` and whether a value is ``required``
+        """
+        self.entrypoint_id = entrypoint_id
+        self.controlaction_id = controlaction_id
+        self.properties = properties
+        self.property_values = property_values
+
+    @classmethod
+    def from_config(cls, req_config_file: str):
+        """Read a template from a request config file, as written by client_get_control"""
+        config = configparser.ConfigParser()
+        config.read(req_config_file)
+        properties = {}
+        for i in range(int(config['ControlAction']['numprops'])):
+            prop = config['Property{}'.format(i + 1)]
+            properties[prop['title']] = {"identifier": prop['ce_id'],
+                                         "nodeType": prop['rangeincludes'].split(',')[0].strip()}
+        property_values = {}
+        for i in range(int(config['ControlAction']['numpvs'])):
+            pvs = config['PropertyValueSpecification{}'.format(i + 1)]
+            property_values[pvs['valuename']] = {"identifier": pvs['ce_id'], "valuePattern": pvs['valuepattern'],
+                                                 "defaultValue": pvs['value'],
+                                                 "required": pvs.getboolean('valuerequired')}
+        return cls(config['EntryPoint']['ce_id'], config['ControlAction']['ce_id'], properties, property_values)
+
+    def mutation(self, inputs: Dict[str, Any]):
+        """Returns the RequestControlAction mutation for one set of inputs
+        Raises:
+            ValueNotFound if a Property or a required PropertyValueSpecification has no value
+        """
+        properties = []
+        for title, prop in self.properties.items():
+            if not inputs.get(title):
+                raise ValueNotFound(title)
+            properties.append({"potentialActionPropertyIdentifier": prop['identifier'],
+                               "nodeIdentifier": inputs[title],
+                               "nodeType": StringConstant(prop['nodeType'])})
+        property_values = []
+        for name, pvs in self.property_values.items():
+            value = inputs.get(name, pvs.get('defaultValue') or '')
+            if value == '' and pvs.get('required'):
+                raise ValueNotFound(name)
+            property_values.append({"potentialActionPropertyValueSpecificationIdentifier": pvs['identifier'],
+                                    "value": value,
+                                    "valuePattern": StringConstant(pvs['valuePattern'])})
+        return mutation_request_controlaction(self.controlaction_id, self.entrypoint_id, properties,
+                                              property_values)
+
+
+class RequestResult:
+    """The outcome of one requested control action"""
+
+    def __init__(self, inputs: Dict[str, Any], identifier: Optional[str], status: str, error: str = None,
+                 results: List[dict] = None, latency: float = None):
+        self.inputs = inputs
+        self.identifier = identifier
+        self.status = status
+        self.error = error
+        self.results = results or []
+        self.latency = latency
+
+    @property
+    def succeeded(self):
+        return self.status == str(ActionStatusType.CompletedActionStatus)
+
+    def __repr__(self):
+        return f"RequestResult(identifier={self.identifier!r}, status={self.status!r})"
+
+
+class BulkStats:
+    """Counts and timings of a bulk request"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        # Inputs that were not requested because a value was missing, or that the CE didn't accept
+        self.rejected = 0
+        self.requests = 0
+        self.latencies = []
+
+    def add_result(self, result: RequestResult):
+        if result.identifier is None:
+            self.rejected += 1
+        elif result.succeeded:
+            self.completed += 1
+        else:
+            self.failed += 1
+        if result.latency is not None:
+            self.latencies.append(result.latency)
+
+    @property
+    def finished(self):
+        return self.completed + self.failed
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self):
+        """Finished jobs per second"""
+        elapsed = self.elapsed
+        return self.finished / elapsed if elapsed else 0.0
+
+    def latency(self, percentile: float):
+        """The time from submitting a job to seeing it finished, at a percentile (0-100) of all finished jobs"""
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        rank = math.ceil(percentile / 100 * len(latencies))
+        return latencies[min(max(rank, 1), len(latencies)) - 1]
+
+    def summary(self):
+        return {"submitted": self.submitted, "completed": self.completed, "failed": self.failed,
+                "rejected": self.rejected, "pending": self.submitted - self.finished, "requests": self.requests,
+                "elapsed": self.elapsed, "throughput": self.throughput,
+                "latency_p50": self.latency(50), "latency_p95": self.latency(95)}
+
+
+def _error_message(errors: Optional[List[dict]]) -> str:
+    return "; ".join(error.get("message", "") for error in errors or []) or "The CE returned no identifier"
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def submit_requests(template: RequestTemplate, inputs: Iterable[Dict[str, Any]], batch_size: int = 50,
+                          max_pending: int = 1000, poll_interval: float = 1.0, stats: BulkStats = None,
+                          dead_letter: DeadLetterFile = None, sizer: BatchSizer = None,
+                          journal: MutationJournal = None) -> AsyncIterator[RequestResult]:
+    """Request the template's control action for each set of inputs, and yield a result for each job as it finishes.
+    Requests are sent ``batch_size`` at a time in one mutation, and the status of the running jobs is
+    polled with one batched query per ``batch_size`` jobs. No more than ``max_pending`` jobs are submitted
+    and not yet finished at any time, so ``inputs`` can be a lazy iterable of any length.
+    Results are yielded in the order that jobs finish, not the order of the inputs.
+    Arguments:
+        template: the control action to request
+        inputs: the inputs for each request, see RequestTemplate
+        batch_size: the number of requests or status queries to send in one request to the CE
+        max_pending: the maximum number of unfinished jobs
+        poll_interval: the number of seconds between checks of the status of the jobs
+        stats: if set, updated with the progress of the requests
+        dead_letter: if set, where to write the requests that the CE didn't accept, see submit_batch
+        sizer: if set, it chooses the number of requests to send in one mutation, instead of batch_size
+        journal: if set, the requests are written to the journal before they are sent, and the identifiers
+           of their jobs after, by the position of their inputs. Inputs whose request succeeded in an earlier
+           run with the journal are not requested again: the status of their job is checked instead
+    Returns:
+        An async iterator of RequestResult. Inputs that couldn't be requested, because a value was missing or
+        the CE returned an error for their request, are yielded with a failed status and no identifier.
+    """
+    if stats is None:
+        stats = BulkStats()
+    inputs = enumerate(inputs)
+    # identifier -> (inputs, time submitted)
+    pending = {}
+    exhausted = False
+
+    async with new_session() as session:
+        while not exhausted or pending:
+            failed = []
+            while not exhausted and len(pending) < max_pending:
+                batch = []
+                size = sizer.size("RequestControlAction") if sizer else batch_size
+                for position, item in inputs:
+                    try:
+                        mutation = template.mutation(item)
+                    except ValueNotFound as e:
+                        failed.append(RequestResult(item, None, str(ActionStatusType.FailedActionStatus), str(e)))
+                        continue
+                    outcome = journal.completed(position, mutation) if journal is not None else None
+                    if outcome is not None and outcome["data"]:
+                        pending[outcome["data"]["identifier"]] = (item, time.monotonic())
+                        stats.submitted += 1
+                    else:
+                        batch.append((position, item, mutation))
+                    if len(batch) >= size or len(pending) + len(batch) >= max_pending:
+                        break
+                else:
+                    exhausted = True
+                if not batch:
+                    continue
+                aliases = ["r{}".format(i) for i in range(len(batch))]
+                finished = None
+                if journal is not None:
+                    journal.begin([(position, m) for position, _, m in batch])
+
+                    def finished(result):
+                        journal.finish(batch[result.index][0], result.mutation, result.data, result.errors,
+                                       result.attempts)
+
+                results = await submit_batch([m for _, _, m in batch], aliases, submit_query_async, session,
+                                             dead_letter=dead_letter, stats=stats, sizer=sizer, finished=finished)
+                submitted = time.monotonic()
+                for (_, item, _), result in zip(batch, results):
+                    if result.succeeded and result.data:
+                        pending[result.data['identifier']] = (item, submitted)
+                        stats.submitted += 1
+                    else:
+                        failed.append(RequestResult(item, None, str(ActionStatusType.FailedActionStatus),
+                                                    _error_message(result.errors)))
+
+            for result in failed:
+                stats.add_result(result)
+                yield result
+            if not pending:
+                continue
+
+            await asyncio.sleep(poll_interval)
+            for identifiers in _chunks(list(pending), batch_size):
+                queries = [format_query("ControlAction", {"identifier": identifier}, STATUS_RETURN_ITEMS)
+                           for identifier in identifiers]
+                aliases = ["s{}".format(i) for i in range(len(identifiers))]
+                # From the primary, because a replica may not have the jobs that were just created yet
+                resp = await submit_query_async(format_batch_query(queries, aliases), session=session, primary=True)
+                stats.requests += 1
+                for alias, identifier in zip(aliases, identifiers):
+                    found = resp['data'][alias]
+                    if found and found[0]['actionStatus'] not in FINISHED_STATUSES:
+                        continue
+                    item, submitted = pending.pop(identifier)
+                    if found:
+                        job = found[0]
+                        result = RequestResult(item, identifier, job['actionStatus'], job.get('error'),
+                                               job.get('result'), time.monotonic() - submitted)
+                    else:
+                        trompace.logger.warning(f"Requested control action {identifier} not found in the CE")
+                        result = RequestResult(item, identifier, str(ActionStatusType.FailedActionStatus),
+                                               "ControlAction not found")
+                    stats.add_result(result)
+                    yield result
+        if journal is not None:
+            journal.sync()
@@ -4,7 +4,7 @@ import configparser
 
 from trompace.connection import submit_query
 
-pq_2 = """query{
+pq_2 = """query EntryPoint {
   EntryPoint {
     identifier
     title
@@ -1,36 +1,15 @@
 import asyncio
 import configparser
-import json
 
-import websockets
-
-from trompace import StringConstant, make_parameters
-from trompace.connection import submit_query
+from trompace import StringConstant, jsoncodec
+from trompace.connection import submit_query_async
 from trompace.exceptions import ValueNotFound
+from trompace.mutations.controlaction import mutation_request_controlaction
 from trompace.subscriptions.controlaction import subscription_controlaction_client
 
 INIT_STR = """{"type":"connection_init","payload":{}}"""
 
-property_object = """  propertyObject: [{{potentialActionPropertyIdentifier:"{property_id}",
-    nodeIdentifier:"{doc_id}",
-    nodeType:DigitalDocument}}]"""
-
-property_value_object = """  propertyValueObject: [{{potentialActionPropertyValueSpecificationIdentifier:"{propertyvalue_id}",
-    value:"{output_name}",
-    valuePattern:String}}"""
-
-q1 = """mutation{{
-RequestControlAction(
-  controlAction: {{
-{params}
-  }}) {{
-    identifier
-        __typename
-          }}
-          }}
-"""
-
-q2 = """query{{ ControlAction(identifier: "{control_id}") {{
+q2 = """query ControlAction {{ ControlAction(identifier: "{control_id}") {{
     identifier
     description
     actionStatus
@@ -86,7 +65,7 @@ def get_sub_dict(query):
     message = {"id": "1",
                "type": "start",
                "payload": payload}
-    return json.dumps(message)
+    return jsoncodec.dumps_str(message)
 
 
 async def subscribe_controlaction(controlaction_id):
@@ -99,6 +78,8 @@ async def subscribe_controlaction(controlaction_id):
         set uri in the config file instead of hardcoded here.
         I
     """
+    import websockets
+
     uri = "ws://127.0.0.1:4000/graphql"
     is_ok = False
     subs = subscription_controlaction_client(controlaction_id)
@@ -137,36 +118,25 @@ async def request_controlaction(req_config_file='req_config1.ini'):
     props = []
     pvss = []
     for i in range(num_props):
-        prop_dict = {}
         prop = config['Property{}'.format(i + 1)]
-        prop_dict['potentialActionPropertyIdentifier'] = prop['ce_id']
         if prop['value'] == '':
-            raise ValueNotFound('potentialActionPropertyIdentifier{}'.format(1 + 1))
-        prop_dict['nodeIdentifier'] = prop['value']
-        prop_dict['nodeType'] = StringConstant(prop['rangeincludes'])
+            raise ValueNotFound('potentialActionPropertyIdentifier{}'.format(i + 1))
         # TODO: Right now, assumes that only one value is given.
-        prop_params = make_parameters(**prop_dict)
-        props.append("{{{}}}".format(prop_params))
+        props.append({"potentialActionPropertyIdentifier": prop['ce_id'],
+                      "nodeIdentifier": prop['value'],
+                      "nodeType": StringConstant(prop['rangeincludes'])})
 
     for i in range(num_pvs):
-        pvs_dict = {}
         pvs = config['PropertyValueSpecification{}'.format(i + 1)]
-        pvs_dict['potentialActionPropertyValueSpecificationIdentifier'] = pvs['ce_id']
         if pvs['value'] == '' and pvs.getboolean('valuerequired'):
-            raise ValueNotFound('potentialActionPropertyValueSpecificationIdentifier{}'.format(1 + 1))
-        pvs_dict['value'] = pvs['value']
-        pvs_dict['valuePattern'] = StringConstant(pvs['valuepattern'])
-        pvs_params = make_parameters(**pvs_dict)
-        pvss.append("{{{}}}".format(pvs_params))
-    param_dict = {"entryPointIdentifier": entrypoint_id, "potentialActionIdentifier": controlaction_id, \
-                  "propertyObject": props, "propertyValueObject": pvss}
-    params = make_parameters(**param_dict)
-
-    params = params.replace("\\n", "\n").replace("\\", "").replace("\"\"", "\"").replace("\"{", "{").replace("}\"", "}")
+            raise ValueNotFound('potentialActionPropertyValueSpecificationIdentifier{}'.format(i + 1))
+        pvss.append({"potentialActionPropertyValueSpecificationIdentifier": pvs['ce_id'],
+                     "value": pvs['value'],
+                     "valuePattern": StringConstant(pvs['valuepattern'])})
 
-    query = q1.format(params=params)
+    query = mutation_request_controlaction(controlaction_id, entrypoint_id, props, pvss)
 
-    resp_1 = await submit_query(query)
+    resp_1 = await submit_query_async(query)
 
     output_id = resp_1['data']['RequestControlAction']['identifier']
 
@@ -179,7 +149,7 @@ async def request_controlaction(req_config_file='req_config1.ini'):
     while act_status == 'accepted' or act_status == 'running':
         await asyncio.sleep(1)
 
-        resp_2 = await submit_query(status_query)
+        resp_2 = await submit_query_async(status_query)
 
         act_status = resp_2['data']['ControlAction'][0]['actionStatus']
 
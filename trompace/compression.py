@@ -0,0 +1,60 @@
+# Compression of the bodies of requests to the CE.
+# Responses are decompressed by the HTTP library while they are read: requests, aiohttp and httpx send an
+# Accept-Encoding header with the encodings that they can decode (gzip and deflate, and zstd if the zstandard
+# package is installed), so a CE that compresses its responses uses one of them.
+import gzip
+import zlib
+from typing import List
+
+GZIP = "gzip"
+DEFLATE = "deflate"
+ZSTD = "zstd"
+ENCODINGS = (GZIP, DEFLATE, ZSTD)
+
+# Levels that compress repetitive GraphQL documents well without slowing down requests
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def available_encodings() -> List[str]:
+    """The encodings that request bodies can be compressed with. zstd needs the zstandard package"""
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return [GZIP, DEFLATE]
+    return [GZIP, DEFLATE, ZSTD]
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a request body.
+    Arguments:
+        body: the body to compress
+        encoding: GZIP, DEFLATE or ZSTD, the value of the Content-Encoding header of the request
+    Raises:
+        ValueError if the encoding isn't known
+        ImportError if the encoding is ZSTD and the zstandard package isn't installed
+    """
+    if encoding == GZIP:
+        # mtime=0 so that the same body is always compressed to the same bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == DEFLATE:
+        # The deflate content encoding of HTTP is the zlib format
+        return zlib.compress(body, GZIP_LEVEL)
+    if encoding == ZSTD:
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    raise ValueError(f"Unknown content encoding '{encoding}', use one of {', '.join(ENCODINGS)}")
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    """Decompress a body compressed with ``compress``"""
+    if encoding == GZIP:
+        return gzip.decompress(body)
+    if encoding == DEFLATE:
+        return zlib.decompress(body)
+    if encoding == ZSTD:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(body)
+    raise ValueError(f"Unknown content encoding '{encoding}', use one of {', '.join(ENCODINGS)}")
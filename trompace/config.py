@@ -2,20 +2,42 @@ import configparser
 import datetime
 import logging
 import os
+import threading
 
 from typing import List, Dict
 from urllib.parse import urlparse
 
-import requests
-
 import trompace
-import jwt
+from trompace import jsoncodec
+from trompace.compression import ZSTD, available_encodings
+
+
+# Values of the server.http2 option
+HTTP2_NO = "no"
+HTTP2_YES = "yes"
+HTTP2_PRIOR_KNOWLEDGE = "prior_knowledge"
 
 
 class TrompaConfig:
     config: configparser.ConfigParser = None
     host: str = None
     websocket_host: str = None
+    # sent to the CE in the X-Client-Id header of each request, so that the CE can tell clients apart in its logs
+    client_id: str = "trompace-client"
+    # read replicas of the CE that queries are sent to, and standby hosts to use if host is down
+    read_hosts: List[str] = []
+    failover_hosts: List[str] = []
+    # number of seconds before a host that couldn't be connected to is tried again
+    host_retry_after: float = 30
+    # send requests with HTTP/2: HTTP2_NO, HTTP2_YES if the CE supports it over https, or HTTP2_PRIOR_KNOWLEDGE
+    # for a CE that supports HTTP/2 without TLS
+    http2: str = HTTP2_NO
+    # compress the bodies of requests that are at least compression_threshold bytes long with this
+    # Content-Encoding: "gzip", "deflate", "zstd" (needs the zstandard package), or None to not compress them
+    compression: str = None
+    compression_threshold: int = 1024
+    # maximum number of requests per second that a client sends to the CE, None for no limit
+    max_requests_per_second: float = None
 
     # Is authentication required to write to the CE?
     server_auth_required: bool = True
@@ -33,6 +55,38 @@ class TrompaConfig:
     # decoded jwt token
     jwt_token_decoded: Dict[str, str] = {}
 
+    # directory of the content-addressed cache for downloaded job inputs, None to disable the cache
+    download_cache_dir: str = None
+    # number of job inputs downloaded at the same time
+    download_concurrency: int = 4
+    # maximum size in bytes of a single job input, None for no limit
+    download_max_size: int = None
+    # directory to create job workspaces in, None to use the system temporary directory
+    scratch_dir: str = None
+    # maximum size in bytes of a single job workspace, None for no limit
+    scratch_quota: int = None
+    # keep the workspace of failed jobs for debugging
+    keep_failed_jobs: bool = False
+    # path of the SQLite database that stores the job queue
+    job_queue_path: str = None
+    # number of jobs to run at the same time
+    job_concurrency: int = 1
+    # number of times to try a job that is interrupted by the worker stopping
+    job_max_attempts: int = 3
+    # number of seconds that a worker's claim on a job lasts if it isn't renewed
+    lease_duration: float = 60
+    # number of seconds to wait for other workers' claims on a job before checking if a claim succeeded
+    lease_settle_time: float = 1
+    # directory to copy job output files to, and the url that this directory is served at
+    result_dir: str = None
+    result_base_url: str = None
+    # url to upload job output files to with a PUT request, instead of copying them to result_dir
+    result_upload_url: str = None
+
+    def __init__(self):
+        # Requests in several threads can find that the token has expired at the same time
+        self._token_lock = threading.Lock()
+
     def load(self, configfile: str = None):
         if configfile is None:
             configfile = os.getenv("TROMPACE_CLIENT_CONFIG")
@@ -47,6 +101,7 @@ class TrompaConfig:
         self._set_logging()
         self._set_server()
         self._set_jwt()
+        self._set_worker()
 
     def _set_logging(self):
         section_logging = self.config["logging"]
@@ -63,8 +118,8 @@ class TrompaConfig:
         if "host" not in server:
             raise ValueError("Cannot find 'server.host' option")
         host = server.get("host")
-        parsed = urlparse(host)
-        print(parsed)
+        # Without //, urlparse reads the host of localhost:4000 as a scheme
+        parsed = urlparse(host if "://" in host else f"//{host}")
         hostpath = parsed.netloc + parsed.path
         if not parsed.scheme and "secure" not in server:
             raise ValueError("No scheme set on ")
@@ -74,8 +129,36 @@ class TrompaConfig:
             trompace.logger.debug("Use a fully qualified URL in 'server.host'")
         else:
             scheme = parsed.scheme
-        self.host = f"{scheme}://{hostpath}"
-        wss_scheme = "wss" if scheme == "https" else "ws"
+        self.set_host(f"{scheme}://{hostpath}")
+        self.client_id = server.get("client_id", self.client_id)
+        self.read_hosts = _host_list(server.get("read_hosts", ""))
+        self.failover_hosts = _host_list(server.get("failover_hosts", ""))
+        self.host_retry_after = server.getfloat("host_retry_after", self.host_retry_after)
+        http2 = server.get("http2", self.http2).lower().replace("-", "_")
+        if http2 != HTTP2_PRIOR_KNOWLEDGE:
+            if http2 not in configparser.ConfigParser.BOOLEAN_STATES:
+                raise ValueError(f"'server.http2' must be yes, no or prior_knowledge, not '{http2}'")
+            http2 = HTTP2_YES if configparser.ConfigParser.BOOLEAN_STATES[http2] else HTTP2_NO
+        self.http2 = http2
+        compression = server.get("compression", "no").lower()
+        if compression in configparser.ConfigParser.BOOLEAN_STATES and \
+                not configparser.ConfigParser.BOOLEAN_STATES[compression]:
+            compression = None
+        elif compression not in available_encodings():
+            if compression == ZSTD:
+                raise ValueError("'server.compression' is zstd but the zstandard package isn't installed")
+            raise ValueError(f"'server.compression' must be {', '.join(available_encodings())} or no, "
+                             f"not '{compression}'")
+        self.compression = compression
+        self.compression_threshold = server.getint("compression_threshold", self.compression_threshold)
+        self.max_requests_per_second = server.getfloat("max_requests_per_second", None)
+
+    def set_host(self, host: str):
+        """Set the URL of the CE, like https://ce.example.com, and the URL of its websocket endpoint"""
+        parsed = urlparse(host)
+        hostpath = parsed.netloc + parsed.path
+        self.host = f"{parsed.scheme}://{hostpath}"
+        wss_scheme = "wss" if parsed.scheme == "https" else "ws"
         wss_path = os.path.join(hostpath, "graphql")
         self.websocket_host = f"{wss_scheme}://{wss_path}"
 
@@ -112,7 +195,30 @@ class TrompaConfig:
                 token = fp.read()
                 self._set_jwt_token(token)
 
+    def _set_worker(self):
+        self.job_queue_path = os.path.join(os.getcwd(), ".trompace-client-jobs.sqlite")
+        if "worker" not in self.config:
+            trompace.logger.debug("No worker section, using default settings for control action jobs")
+            return
+        worker = self.config["worker"]
+        self.download_cache_dir = worker.get("download_cache_dir", None)
+        self.download_concurrency = worker.getint("download_concurrency", self.download_concurrency)
+        self.download_max_size = worker.getint("download_max_size", None)
+        self.scratch_dir = worker.get("scratch_dir", None)
+        self.scratch_quota = worker.getint("scratch_quota", None)
+        self.keep_failed_jobs = worker.getboolean("keep_failed_jobs", False)
+        self.job_queue_path = worker.get("job_queue_path", self.job_queue_path)
+        self.job_concurrency = worker.getint("job_concurrency", self.job_concurrency)
+        self.job_max_attempts = worker.getint("job_max_attempts", self.job_max_attempts)
+        self.lease_duration = worker.getfloat("lease_duration", self.lease_duration)
+        self.lease_settle_time = worker.getfloat("lease_settle_time", self.lease_settle_time)
+        self.result_dir = worker.get("result_dir", None)
+        self.result_base_url = worker.get("result_base_url", None)
+        self.result_upload_url = worker.get("result_upload_url", None)
+
     def _set_jwt_token(self, token):
+        import jwt
+
         try:
             decoded = jwt.decode(token, algorithms=["HS256"], options={"verify_signature": False})
             self.jwt_token_encoded = token
@@ -122,6 +228,8 @@ class TrompaConfig:
 
     def _save_jwt_token(self, token):
         """Save a JWT token to the cache file"""
+        if self.jwt_key_cache is None:
+            return
         with open(self.jwt_key_cache, "w") as fp:
             fp.write(token)
 
@@ -130,39 +238,60 @@ class TrompaConfig:
         """Get the token needed to authenticate to the CE. If no token is available, request one from the CE
         using the id, key and scopes. If the token is going to expire within the next hour, re-request it.
         Once requested, save it to ``self.jwt_key_cache``"""
-        if self.jwt_token_encoded is None:
-            trompace.logger.debug("no token, getting one")
-            # No token, refresh it
-            token = get_jwt(self.host, self.jwt_id, self.jwt_key, self.jwt_scopes)
-            self._set_jwt_token(token)
-            self._save_jwt_token(token)
-        elif self.jwt_token_encoded:
-            token = jwt.decode(self.jwt_token_encoded, algorithms=["HS256"], options={"verify_signature": False})
-            now = datetime.datetime.now(datetime.timezone.utc).timestamp()
-            expired = token.get('exp', 0) < now
-            # check if it's expiring
-            if expired:
-                trompace.logger.debug("token is expiring, renewing")
-                # TODO: Duplicate
-                token = get_jwt(self.host, self.jwt_id, self.jwt_key, self.jwt_scopes)
+        return self.get_jwt_token()
+
+    def get_jwt_token(self, host: str = None):
+        """Get the token needed to authenticate to the CE, like ``jwt_token``, but request it from host if
+        a new token is needed. This is the host that the request is sent to, which is a failover host if the
+        primary host is down
+        Arguments:
+            host: the host to request a token from, or ``self.host`` if not set
+        """
+        import jwt
+
+        host = host or self.host
+
+        with self._token_lock:
+            if self.jwt_token_encoded is None:
+                trompace.logger.debug("no token, getting one")
+                # No token, refresh it
+                token = get_jwt(host, self.jwt_id, self.jwt_key, self.jwt_scopes)
                 self._set_jwt_token(token)
                 self._save_jwt_token(token)
+            elif self.jwt_token_encoded:
+                token = jwt.decode(self.jwt_token_encoded, algorithms=["HS256"], options={"verify_signature": False})
+                now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+                expired = token.get('exp', 0) < now
+                # check if it's expiring
+                if expired:
+                    trompace.logger.debug("token is expiring, renewing")
+                    # TODO: Duplicate
+                    token = get_jwt(host, self.jwt_id, self.jwt_key, self.jwt_scopes)
+                    self._set_jwt_token(token)
+                    self._save_jwt_token(token)
         # Now we have a token, return it
         # TODO: The issuing step could fail
         return self.jwt_token_encoded
 
 
+def _host_list(value: str) -> List[str]:
+    """Split a comma or newline separated list of hosts"""
+    return [host.strip() for host in value.replace("\n", ",").split(",") if host.strip()]
+
+
 def get_jwt(host, jwt_id, jwt_key, jwt_scopes):
     """Request a JWT key from the CE"""
     # TODO: Would be nice to put this in trompace.connection, but issues with circular import
+    import requests
+
     url = os.path.join(host, "jwt")
     data = {
         "id": jwt_id,
         "apiKey": jwt_key,
         "scopes": jwt_scopes
     }
-    r = requests.post(url, json=data)
-    j = r.json()
+    r = requests.post(url, data=jsoncodec.dumps(data), headers={"Content-Type": "application/json"})
+    j = jsoncodec.loads(r.content)
     if j['success']:
         return j['jwt']
     else:
@@ -1,62 +1,634 @@
 # Utility functions for sending queries and downloading files.
-import requests
+# The HTTP libraries are imported when the first request is sent, so that importing this module is fast.
+import contextlib
+import functools
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Iterator, List, Tuple
 
-from trompace.config import config
+import trompace
+from trompace import jsoncodec
+from trompace.compression import compress
+from trompace.config import HTTP2_NO, HTTP2_PRIOR_KNOWLEDGE, TrompaConfig, config
+from trompace.endpoints import Endpoint, EndpointPool
 from trompace.exceptions import QueryException
+from trompace.ratelimit import RateLimiter
 
 
-async def submit_query_async(querystr: str, auth_required=False):
-    """Submit a query to the CE (async).
+@functools.lru_cache(maxsize=None)
+def client_version():
+    """The version of the installed trompace-client package"""
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python 3.7
+        return "unknown"
+    try:
+        return version("trompace-client")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class RequestContext:
+    """Information about one request to the CE, passed to the callbacks of each RequestHook.
+    Hooks can add headers to ``headers`` in ``before_request``, and keep their own state in ``extra``.
+
+    Each request is tagged with the headers X-Client-Id (``server.client_id`` in the config), X-Client-Version
+    and a unique X-Request-Id, so that the CE can find the requests of a client in its logs.
+    Retries of a request keep its request id."""
+
+    def __init__(self, querystr: str, auth_required: bool, attempt: int = 1, request_id: str = None):
+        self.query = querystr
+        self.operation = operation_name(querystr)
+        self.auth_required = auth_required
+        # 1 for the first try of a request, 2 for the first retry, ...
+        self.attempt = attempt
+        self.request_id = request_id or uuid.uuid4().hex
+        # The url of the CE host that the request is sent to
+        self.endpoint = None
+        version = client_version()
+        self.headers = {"Content-Type": "application/json",
+                        "User-Agent": f"trompace-client/{version}",
+                        "X-Client-Version": version,
+                        "X-Request-Id": self.request_id}
+        self.extra = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.status = None
+        self.error_count = 0
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+
+class RequestHook:
+    """Callbacks around every request sent by submit_query and submit_query_async. Subclass and override the
+    callbacks that you need, and register the hook with add_hook. Exceptions in hooks are logged and ignored."""
+
+    def before_request(self, context: RequestContext):
+        """Called before the request is sent"""
+
+    def after_response(self, context: RequestContext):
+        """Called after a successful response is parsed"""
+
+    def on_error(self, context: RequestContext, exception: Exception):
+        """Called if the request failed, or the response had GraphQL errors. The exception is re-raised after"""
+
+
+_hooks = []
+
+
+def add_hook(hook: RequestHook):
+    """Call the callbacks of hook around every request"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: RequestHook):
+    _hooks.remove(hook)
+
+
+def _run_hooks(callback: str, *args):
+    for hook in _hooks:
+        try:
+            getattr(hook, callback)(*args)
+        except Exception:
+            trompace.logger.exception(f"Error in {callback} of {hook}")
+
+
+_OPERATION_RE = re.compile(r"^\s*(?:(query|mutation|subscription)\s*(\w*))?[^{]*{\s*(?:\w+\s*:\s*)?(\w+)")
+
+
+def operation_name(querystr: str) -> str:
+    """The name of a query document, to group requests by. This is the operation name if the document has one,
+    or else the name of its first field, like CreatePerson or ControlAction"""
+    match = _OPERATION_RE.match(querystr)
+    if not match:
+        return "unknown"
+    return match.group(2) or match.group(3)
+
+
+def _prepare(context: RequestContext, client_config: TrompaConfig):
+    context.headers["X-Client-Id"] = client_config.client_id
+    _run_hooks("before_request", context)
+    if context.auth_required and client_config.server_auth_required:
+        context.headers["Authorization"] = f"Bearer {client_config.get_jwt_token(context.endpoint)}"
+    body = jsoncodec.dumps({"query": context.query})
+    if client_config.compression and len(body) >= client_config.compression_threshold:
+        body = compress(body, client_config.compression)
+        context.headers["Content-Encoding"] = client_config.compression
+    context.request_bytes = len(body)
+    return body
+
+
+HEALTH_CHECK_QUERY = "query HealthCheck { __typename }"
+
+
+def is_mutation(querystr: str) -> bool:
+    return querystr.lstrip().startswith("mutation")
+
+
+def _is_failover_error(transport: str, mutation: bool, exception: Exception) -> bool:
+    """If a request that failed with exception is sent to the next host.
+    Only retry a mutation if the connection to the CE could not be opened, so that it cannot have run"""
+    if transport == "httpx":
+        import httpx
+
+        errors = (httpx.ConnectError, httpx.ConnectTimeout) if mutation else (httpx.NetworkError, httpx.TimeoutException)
+        if isinstance(exception, errors):
+            return True
+    elif transport == "aiohttp":
+        import asyncio
+        import aiohttp
+
+        errors = aiohttp.ClientConnectorError if mutation else (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        if isinstance(exception, errors):
+            return True
+    # The token for a request is requested from its host with requests, whatever the transport of the request
+    import requests
+
+    if not mutation:
+        return isinstance(exception, (requests.ConnectionError, requests.Timeout))
+    if isinstance(exception, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(exception, requests.ConnectionError):
+        return False
+    # requests also raises ConnectionError when the CE disconnects after the request was sent. The error from
+    # urllib3 is a NewConnectionError, in a MaxRetryError, only if the connection was refused or the host was
+    # not found
+    import urllib3
+
+    reason = exception.args[0] if exception.args else None
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def _read_body(response) -> Tuple[bytes, int]:
+    """Read the body of a requests response that was sent with stream=True, and return it with the number of
+    bytes received before it was decompressed. Response.content reads chunked responses in a way that urllib3
+    doesn't count. Errors are raised as the same exceptions as Response.content raises"""
+    import requests
+    from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+
+    try:
+        content = response.raw.read(decode_content=True)
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.ConnectionError(e)
+    return content, response.raw.tell()
+
+
+def _parse_response(context: RequestContext, status: int, content: bytes, received: int = None):
+    """Parse the body of a response. received is the number of bytes of the body before it was decompressed,
+    if the HTTP library knows it"""
+    context.status = status
+    context.response_bytes = len(content) if received is None else received
+    if status >= 400:
+        trompace.logger.error(f"HTTP error {status} from the CE for {context.operation}: {content[:1000]}")
+    try:
+        resp = jsoncodec.loads(content)
+    except ValueError:
+        raise QueryException([{"message": content.decode("utf-8", errors="replace")}], status=status)
+    if "errors" in resp.keys():
+        context.error_count = len(resp['errors'])
+        raise QueryException(resp['errors'], resp.get('data'), status)
+    return resp
+
+
+class CEClient:
+    """A client of one CE, with its own config, authentication token and HTTP connections.
+    Several clients can be used at the same time, for example to copy data from a staging CE to a production CE,
+    or to send requests with different API keys. A client can be shared between threads and event loops.
+
+    The functions that build mutations and queries return strings that can be sent with any client::
+
+        staging = CEClient.from_file("staging.ini")
+        production = CEClient.from_host("https://ce.example.com", auth_required=True, jwt_id="me",
+                                        jwt_key="...", jwt_scopes=["*"])
+        person = staging.submit_query(query_person(identifier="..."))
+        production.submit_query(mutation_create_person(...), auth_required=True)
+
+    The module-level submit_query and submit_query_async functions use a default client with the global
+    ``trompace.config.config``.
+
+    By default requests are sent with HTTP/1.1, using requests and aiohttp. If ``http2`` is set in the config,
+    they are sent with httpx instead (install trompace-client[http2]), which sends many concurrent requests over
+    one HTTP/2 connection.
+
+    If ``max_requests_per_second`` is set in the config, requests wait so that the client doesn't send more
+    requests than that, from all threads and event loops together.
+    """
+
+    def __init__(self, client_config: TrompaConfig):
+        self.config = client_config
+        # A requests session for each thread, which keeps connections to the CE open between requests
+        self._local = threading.local()
+        # An httpx client is thread safe, and shares its HTTP/2 connections between threads
+        self._httpx_client = None
+        self._httpx_lock = threading.Lock()
+        self._pool = None
+        self._pool_hosts = None
+        self._rate_limiter = None
+
+    @property
+    def endpoints(self) -> EndpointPool:
+        """The hosts of the CE. This is made again if the hosts in the config change"""
+        hosts = (self.config.host, tuple(self.config.read_hosts), tuple(self.config.failover_hosts),
+                 self.config.host_retry_after)
+        if hosts != self._pool_hosts:
+            self._pool = EndpointPool(self.config.host, self.config.read_hosts, self.config.failover_hosts,
+                                      self.config.host_retry_after)
+            self._pool_hosts = hosts
+        return self._pool
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        """The limit of ``max_requests_per_second`` in the config, shared by all the threads and event loops that
+        use this client, or None if there is no limit"""
+        rate = self.config.max_requests_per_second
+        if not rate:
+            return None
+        if self._rate_limiter is None or self._rate_limiter.rate != rate:
+            self._rate_limiter = RateLimiter(rate)
+        return self._rate_limiter
+
+    @classmethod
+    def from_file(cls, config_file: str = None):
+        """A client with the settings in a config file, like trompace.ini.
+        If config_file isn't set, the file in the TROMPACE_CLIENT_CONFIG environment variable is used."""
+        client_config = TrompaConfig()
+        client_config.load(config_file)
+        return cls(client_config)
+
+    @classmethod
+    def from_host(cls, host: str, auth_required: bool = False, jwt_id: str = None, jwt_key: str = None,
+                  jwt_scopes: List[str] = None, client_id: str = None, http2: str = HTTP2_NO,
+                  compression: str = None):
+        """A client of the CE at host, without a config file.
+        Arguments:
+            host: The URL of the CE, like https://ce.example.com
+            auth_required: If true, get a token with jwt_id, jwt_key and jwt_scopes for requests that need it
+            jwt_id, jwt_key, jwt_scopes: The identity to authenticate with
+            client_id: Sent to the CE in the X-Client-Id header of each request
+            http2: HTTP2_NO, HTTP2_YES to use HTTP/2 if an https CE supports it, or HTTP2_PRIOR_KNOWLEDGE to
+               use HTTP/2 without TLS with a CE that supports it
+            compression: The Content-Encoding to compress large requests with, gzip, deflate or zstd, see
+               ``TrompaConfig.compression``
+        """
+        client_config = TrompaConfig()
+        client_config.set_host(host)
+        client_config.server_auth_required = auth_required
+        client_config.jwt_id = jwt_id
+        client_config.jwt_key = jwt_key
+        client_config.jwt_scopes = jwt_scopes or []
+        if client_id:
+            client_config.client_id = client_id
+        client_config.http2 = http2
+        client_config.compression = compression
+        return cls(client_config)
+
+    @property
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+
+            session = self._local.session = requests.Session()
+        return session
+
+    @property
+    def _httpx(self):
+        with self._httpx_lock:
+            if self._httpx_client is None:
+                import httpx
+
+                self._httpx_client = httpx.Client(**self._httpx_options())
+            return self._httpx_client
+
+    def _httpx_options(self):
+        return {"http2": True, "http1": self.config.http2 != HTTP2_PRIOR_KNOWLEDGE, "timeout": None}
+
+    def close(self):
+        """Close the HTTP/2 connections, and the HTTP/1.1 connections of the current thread"""
+        session = getattr(self._local, "session", None)
+        if session is not None:
+            session.close()
+            self._local.session = None
+        with self._httpx_lock:
+            if self._httpx_client is not None:
+                self._httpx_client.close()
+                self._httpx_client = None
+
+    def new_session(self):
+        """A new session to pass to submit_query_async, so that many queries can share its connections.
+        This is an aiohttp.ClientSession, or an httpx.AsyncClient if HTTP/2 is enabled. Use it as::
+
+            async with client.new_session() as session:
+                await asyncio.gather(*[client.submit_query_async(query, session=session) for query in queries])
+        """
+        if self.config.http2 != HTTP2_NO:
+            import httpx
+
+            return httpx.AsyncClient(**self._httpx_options())
+        import aiohttp
+
+        return aiohttp.ClientSession()
+
+    async def submit_query_async(self, querystr: str, auth_required=False, session=None, primary=False):
+        """Submit a query to the CE (async).
+        Queries are sent to a read replica if the config has any. If a host cannot be connected to, the
+        request is sent to the next host, see EndpointPool.
+        Arguments:
+            querystr: The query to be submitted
+            auth_required: If true, send an authentication key with this request. Don't send a key
+               if server_auth_required is false in the config of this client
+            session: A session from ``new_session()``, an aiohttp.ClientSession or an httpx.AsyncClient to send the
+               query with, so that many queries can share its connections. If not set, a new session is used
+               for this query
+            primary: If true, send a query to the primary instead of a read replica, to read the latest writes
+        """
+        if session is None:
+            async with self.new_session() as session:
+                return await self.submit_query_async(querystr, auth_required, session, primary)
+
+        transport = "httpx" if type(session).__module__.startswith("httpx") else "aiohttp"
+        mutation = is_mutation(querystr)
+        pool = self.endpoints
+        candidates = pool.candidates(mutation, primary)
+        rate_limiter = self.rate_limiter
+        request_id = None
+        for attempt, endpoint in enumerate(candidates, 1):
+            if rate_limiter:
+                await rate_limiter.acquire_async()
+            context = RequestContext(querystr, auth_required, attempt, request_id)
+            request_id = context.request_id
+            context.endpoint = endpoint.url
+            try:
+                body = _prepare(context, self.config)
+                if transport == "httpx":
+                    r = await session.post(endpoint.url, content=body, headers=context.headers)
+                    status, content, received = r.status_code, r.content, r.num_bytes_downloaded
+                else:
+                    async with session.post(endpoint.url, data=body, headers=context.headers) as r:
+                        status, content = r.status, await r.read()
+                        # The bytes read from the connection, before they were decompressed. total_raw_bytes is
+                        # new in aiohttp 3.12, and older versions only count the decompressed bytes
+                        received = getattr(r.content, "total_raw_bytes", r.content.total_bytes)
+                resp = self._finish(context, pool, endpoint, status, content, received)
+            except Exception as e:
+                failover = _is_failover_error(transport, mutation, e)
+                if self._on_error(context, pool, endpoint, e, failover, attempt < len(candidates)):
+                    continue
+                raise
+            return resp
+
+    def submit_query(self, querystr: str, auth_required=False, primary=False):
+        """Submit a query to the CE.
+        Queries are sent to a read replica if the config has any. If a host cannot be connected to, the
+        request is sent to the next host, see EndpointPool.
+        Arguments:
+            querystr: The query to be submitted
+            auth_required: If true, send an authentication key with this request. Don't send a key
+               if server_auth_required is false in the config of this client
+            primary: If true, send a query to the primary instead of a read replica, to read the latest writes
+        """
+        return self._submit_query(querystr, auth_required, primary=primary)
+
+    def _submit_query(self, querystr: str, auth_required: bool, session=None, primary=False):
+        """submit_query, with a requests session that is used instead of the session of the thread"""
+        if session is None and self.config.http2 == HTTP2_NO:
+            session = self._session
+        transport = "requests" if self.config.http2 == HTTP2_NO else "httpx"
+        mutation = is_mutation(querystr)
+        pool = self.endpoints
+        candidates = pool.candidates(mutation, primary)
+        rate_limiter = self.rate_limiter
+        request_id = None
+        for attempt, endpoint in enumerate(candidates, 1):
+            if rate_limiter:
+                rate_limiter.acquire()
+            context = RequestContext(querystr, auth_required, attempt, request_id)
+            request_id = context.request_id
+            context.endpoint = endpoint.url
+            try:
+                body = _prepare(context, self.config)
+                if transport == "httpx":
+                    r = self._httpx.post(endpoint.url, content=body, headers=context.headers)
+                    content, received = r.content, r.num_bytes_downloaded
+                else:
+                    r = session.post(endpoint.url, data=body, headers=context.headers, stream=True)
+                    content, received = _read_body(r)
+                resp = self._finish(context, pool, endpoint, r.status_code, content, received)
+            except Exception as e:
+                failover = _is_failover_error(transport, mutation, e)
+                if self._on_error(context, pool, endpoint, e, failover, attempt < len(candidates)):
+                    continue
+                raise
+            return resp
+
+    @contextlib.contextmanager
+    def _worker_pool(self, max_workers: int, auth_required: bool):
+        """A pool of threads that send queries with submit_query. The threads share one requests session, which
+        keeps up to max_workers connections to each host open. Yields a function that starts sending a query and
+        returns its future. Queries that haven't started when the pool is closed are cancelled"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        session = None
+        if self.config.http2 == HTTP2_NO:
+            import requests
+
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        executor = ThreadPoolExecutor(max_workers, thread_name_prefix="trompace-submit")
+        futures = []
+
+        def submit(querystr: str):
+            future = executor.submit(self._submit_query, querystr, auth_required, session)
+            futures.append(future)
+            return future
+
+        try:
+            yield submit
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            if session is not None:
+                session.close()
+
+    def submit_many(self, queries: Iterable[str], auth_required=False, max_workers: int = 10,
+                    return_exceptions=False) -> List:
+        """Send queries concurrently from a pool of threads, and wait until they have all finished.
+        This is the same as calling submit_query for each query, including the failover to other hosts and
+        the ``max_requests_per_second`` limit, but up to max_workers queries are sent at the same time.
+        Arguments:
+            queries: The queries to be submitted
+            auth_required: If true, send an authentication key with these requests
+            max_workers: The maximum number of queries that are sent at the same time
+            return_exceptions: If true, the exception of a query that fails is returned in its place in the
+               results. Otherwise, the exception of the first query that failed is raised, after all the queries
+               have finished
+        Returns:
+            The responses of the CE, in the order of the queries
+        """
+        import concurrent.futures
+
+        with self._worker_pool(max_workers, auth_required) as submit:
+            futures = [submit(querystr) for querystr in queries]
+            concurrent.futures.wait(futures)
+        return gather_futures(futures, return_exceptions)
+
+    def submit_many_as_completed(self, queries: Iterable[str], auth_required=False, max_workers: int = 10,
+                                 return_exceptions=False) -> Iterator[Tuple[int, dict]]:
+        """Send queries concurrently from a pool of threads, like submit_many, and yield their responses in the
+        order that they finish. If the iterator is closed before the end, queries that haven't started are
+        not sent.
+        Arguments:
+            queries: The queries to be submitted
+            auth_required: If true, send an authentication key with these requests
+            max_workers: The maximum number of queries that are sent at the same time
+            return_exceptions: If true, the exception of a query that fails is yielded in place of its response.
+               Otherwise, it is raised
+        Returns:
+            An iterator of (index of the query, response) tuples
+        """
+        import concurrent.futures
+
+        with self._worker_pool(max_workers, auth_required) as submit:
+            futures = {submit(querystr): index for index, querystr in enumerate(queries)}
+            for future in concurrent.futures.as_completed(futures):
+                exception = future.exception()
+                if exception is not None and not return_exceptions:
+                    raise exception
+                yield futures[future], future.result() if exception is None else exception
+
+    def check_health(self, timeout: float = 5) -> Dict[str, bool]:
+        """Send a minimal query to each host of the CE, and update which hosts are healthy and their latency.
+        Call this periodically to stop sending requests to hosts that are down before a request fails.
+        Returns:
+            A mapping of the url of each host to True if it responded
+        """
+        body = jsoncodec.dumps({"query": HEALTH_CHECK_QUERY})
+        headers = {"Content-Type": "application/json"}
+        if self.config.http2 == HTTP2_NO:
+            import requests
+
+            post = functools.partial(self._session.post, data=body, headers=headers, timeout=timeout)
+            errors = requests.RequestException
+        else:
+            import httpx
+
+            post = functools.partial(self._httpx.post, content=body, headers=headers, timeout=timeout)
+            errors = httpx.HTTPError
+
+        pool = self.endpoints
+        for endpoint in pool.endpoints:
+            start = time.perf_counter()
+            try:
+                healthy = post(endpoint.url).status_code < 500
+            except errors:
+                healthy = False
+            if healthy:
+                pool.succeeded(endpoint, time.perf_counter() - start)
+            else:
+                pool.failed(endpoint)
+        return {endpoint.url: endpoint.healthy for endpoint in pool.endpoints}
+
+    @staticmethod
+    def _finish(context: RequestContext, pool: EndpointPool, endpoint: Endpoint, status: int, content: bytes,
+                received: int = None):
+        """Parse a response and record the latency of the endpoint, or that it failed if the status is not 2xx"""
+        try:
+            resp = _parse_response(context, status, content, received)
+        finally:
+            context.finish()
+            if 200 <= status < 300:
+                pool.succeeded(endpoint, context.duration)
+            else:
+                pool.failed(endpoint)
+        _run_hooks("after_response", context)
+        return resp
+
+    @staticmethod
+    def _on_error(context: RequestContext, pool: EndpointPool, endpoint: Endpoint, exception: Exception,
+                  failover: bool, can_retry: bool):
+        """Run the error hooks. Returns True if the request should be sent to the next endpoint"""
+        if context.duration is None:
+            context.finish()
+        _run_hooks("on_error", context, exception)
+        if not failover:
+            return False
+        pool.failed(endpoint)
+        return can_retry
+
+
+def gather_futures(futures, return_exceptions: bool) -> List:
+    """The results of finished futures, in order.
+    Arguments:
+        futures: concurrent.futures.Future objects that have finished
+        return_exceptions: If true, the exception of a future that failed is returned in its place. Otherwise,
+           the first exception is raised
+    """
+    results = []
+    for future in futures:
+        exception = future.exception()
+        if exception is not None and not return_exceptions:
+            raise exception
+        results.append(future.result() if exception is None else exception)
+    return results
+
+
+default_client = CEClient(config)
+
+
+def new_session():
+    """A new session of the default client to pass to submit_query_async, see CEClient.new_session"""
+    return default_client.new_session()
+
+
+async def submit_query_async(querystr: str, auth_required=False, session=None, primary=False):
+    """Submit a query to the CE (async), with the default client.
     Arguments:
         querystr: The query to be submitted
         auth_required: If true, send an authentication key with this request. Don't send a key
            if the global config.server_auth_required is false
+        session: A session from ``new_session()``, or an aiohttp.ClientSession, to send the query with, so that
+           many queries can share its connections. If not set, a new session is used for this query
+        primary: If true, send a query to the primary instead of a read replica, to read the latest writes
     """
-    q = {"query": querystr}
-    headers = {}
-    if auth_required and config.server_auth_required:
-        token = config.jwt_token
-        headers["Authorization"] = f"Bearer {token}"
-    r = requests.post(config.host, json=q, headers=headers)
-    try:
-        r.raise_for_status()
-    except requests.exceptions.HTTPError:
-        print("error")
-        print(r.content)
-    try:
-        resp = r.json()
-        if "errors" in resp.keys():
-            raise QueryException(resp['errors'])
-    except ValueError:
-        raise QueryException(r.content)
-    return resp
+    return await default_client.submit_query_async(querystr, auth_required, session, primary)
 
 
-def submit_query(querystr: str, auth_required=False):
-    """Submit a query to the CE.
+def submit_query(querystr: str, auth_required=False, primary=False):
+    """Submit a query to the CE, with the default client.
     Arguments:
         querystr: The query to be submitted
         auth_required: If true, send an authentication key with this request. Don't send a key
            if the global config.server_auth_required is false
+        primary: If true, send a query to the primary instead of a read replica, to read the latest writes
     """
-    q = {"query": querystr}
-    headers = {}
-    if auth_required and config.server_auth_required:
-        token = config.jwt_token
-        headers["Authorization"] = f"Bearer {token}"
-    r = requests.post(config.host, json=q, headers=headers)
-    try:
-        r.raise_for_status()
-    except requests.exceptions.HTTPError:
-        print("error")
-        print(r.content)
-    try:
-        resp = r.json()
-        if "errors" in resp.keys():
-            raise QueryException(resp['errors'])
-    except ValueError:
-        raise QueryException(r.content)
-    return resp
+    return default_client.submit_query(querystr, auth_required, primary)
+
+
+def submit_many(queries: Iterable[str], auth_required=False, max_workers: int = 10, return_exceptions=False) -> List:
+    """Send queries concurrently from a pool of threads with the default client, see CEClient.submit_many.
+    Arguments:
+        queries: The queries to be submitted
+        auth_required: If true, send an authentication key with these requests
+        max_workers: The maximum number of queries that are sent at the same time
+        return_exceptions: If true, return the exception of a query that fails in its place in the results
+    Returns:
+        The responses of the CE, in the order of the queries
+    """
+    return default_client.submit_many(queries, auth_required, max_workers, return_exceptions)
 
 
 async def download_file(url, file_link):
@@ -66,9 +638,8 @@ async def download_file(url, file_link):
     url: url for the file to be downloaded
     file_link: the path to save the file in
     """
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(file_link, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+    import aiohttp
+    from trompace.application.download import download_input
+
+    async with aiohttp.ClientSession() as session:
+        await download_input(session, url, file_link)
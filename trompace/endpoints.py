@@ -0,0 +1,89 @@
+# Choose which CE host to send each request to, when a CE has read replicas or standby hosts.
+import threading
+import time
+from typing import List
+
+import trompace
+
+# Weight of the latest request in the moving average of the latency of an endpoint
+LATENCY_SMOOTHING = 0.2
+
+PRIMARY = "primary"
+REPLICA = "replica"
+FAILOVER = "failover"
+
+
+class Endpoint:
+    """A CE host and what it is known about it"""
+
+    def __init__(self, url: str, role: str):
+        self.url = url
+        self.role = role
+        self.healthy = True
+        # Moving average of the request latency in seconds, None until the first request
+        self.latency = None
+        self.failed_at = None
+
+    def __repr__(self):
+        return f"Endpoint({self.url!r}, {self.role!r}, healthy={self.healthy})"
+
+
+class EndpointPool:
+    """The hosts of a CE, with their roles:
+        - primary: the host that mutations are sent to
+        - replica: hosts that serve queries, so that reads don't compete with writes on the primary
+        - failover: standby hosts that are used for mutations and queries when the primary is down
+
+    An endpoint is marked unhealthy when a connection to it fails, and is tried again after ``retry_after``
+    seconds, or after a successful health check.
+    """
+
+    def __init__(self, primary: str, replicas: List[str] = None, failover: List[str] = None,
+                 retry_after: float = 30):
+        self.primary = Endpoint(primary, PRIMARY)
+        self.replicas = [Endpoint(url, REPLICA) for url in replicas or []]
+        self.failover = [Endpoint(url, FAILOVER) for url in failover or []]
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+
+    @property
+    def endpoints(self) -> List[Endpoint]:
+        return [self.primary] + self.replicas + self.failover
+
+    def _available(self, endpoint: Endpoint, now: float):
+        if not endpoint.healthy and now - endpoint.failed_at >= self.retry_after:
+            trompace.logger.info(f"Trying {endpoint.url} again")
+            endpoint.healthy = True
+        return endpoint.healthy
+
+    def candidates(self, mutation: bool, primary: bool = False) -> List[Endpoint]:
+        """The endpoints to try for a request, in order. Mutations go to the primary, and then to the failover
+        hosts. Queries go to the replica with the lowest latency, and then to the other replicas, the primary and
+        the failover hosts, unless primary is true. Replicas can lag behind the primary, so queries that must see
+        the latest writes, like reading back a node that was just created, set primary to go to the primary and
+        failover hosts like mutations. Unhealthy endpoints are tried last."""
+        now = time.monotonic()
+        with self._lock:
+            if mutation or primary:
+                order = [self.primary] + self.failover
+            else:
+                # Endpoints that haven't been used yet come first, so that their latency is measured
+                replicas = sorted(self.replicas, key=lambda e: -1 if e.latency is None else e.latency)
+                order = replicas + [self.primary] + self.failover
+            available = [endpoint for endpoint in order if self._available(endpoint, now)]
+        return available + [endpoint for endpoint in order if endpoint not in available]
+
+    def succeeded(self, endpoint: Endpoint, latency: float):
+        with self._lock:
+            endpoint.healthy = True
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += LATENCY_SMOOTHING * (latency - endpoint.latency)
+
+    def failed(self, endpoint: Endpoint):
+        with self._lock:
+            if endpoint.healthy:
+                trompace.logger.warning(f"Request to {endpoint.url} failed, marking it as unhealthy")
+            endpoint.healthy = False
+            endpoint.failed_at = time.monotonic()
@@ -29,8 +29,30 @@ class ValueNotFound(Exception):
 
 
 class QueryException(Exception):
-    def __init__(self, errors):
+    """The CE answered a query with errors. ``errors`` are the GraphQL errors of the response, ``data`` is
+    its data, which has the results of the parts of the query that succeeded, or None, and ``status`` is the
+    HTTP status of the response"""
+
+    def __init__(self, errors, data=None, status=None):
+        self.errors = errors
+        self.data = data
+        self.status = status
         error_str = "\n"
         for i, error in enumerate(errors):
-            error_str += "{}. {}\n".format(1, error['message'])
+            error_str += "{}. {}\n".format(i + 1, error['message'])
         super().__init__("Query error {} occurred".format(error_str))
+
+
+class InvalidInputException(Exception):
+    def __init__(self, url, reason):
+        super().__init__("Input {} is not valid: {}".format(url, reason))
+
+
+class WorkspaceQuotaException(Exception):
+    def __init__(self, job_id, usage, quota):
+        super().__init__("Job {} uses {} bytes, more than its quota of {} bytes".format(job_id, usage, quota))
+
+
+class JobAlreadyClaimedException(Exception):
+    def __init__(self, identifier):
+        super().__init__("Job {} is claimed by another worker".format(identifier))
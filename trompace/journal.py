@@ -0,0 +1,208 @@
+# A write-ahead journal of the mutations sent by a long import, so that an import that stops halfway can be
+# resumed without sending the mutations that the CE already ran.
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import trompace
+from trompace import jsoncodec
+
+_SEGMENT_RE = re.compile(r"^segment-(\d+)\.jsonl\.gz$")
+
+
+def _fsync_directory(directory: str):
+    # Make the creation of a new segment durable. Directories can't be opened on Windows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _hash(mutation: str) -> str:
+    return hashlib.sha256(mutation.encode("utf-8")).hexdigest()[:32]
+
+
+def _read_segment(path: str) -> List[dict]:
+    """The records of a segment. Each sync appends a gzip member to the segment, so a member that is cut off or
+    damaged can only be the last one, written when the process stopped, and the records after it are ignored"""
+    with open(path, "rb") as fp:
+        data = fp.read()
+    records = []
+    while data:
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            chunk = decompressor.decompress(data)
+        except zlib.error:
+            chunk = None
+        if chunk is None or not decompressor.eof:
+            trompace.logger.warning(f"Ignoring {len(data)} bytes at the end of journal segment {path} that were "
+                                    f"not completely written")
+            break
+        records.extend(jsoncodec.loads(line) for line in chunk.splitlines() if line)
+        data = decompressor.unused_data
+    return records
+
+
+class MutationJournal:
+    """An append-only journal of the mutations of an import and their outcomes, in a directory.
+    Before a batch of mutations is sent, each mutation is written to the journal and the journal is synced to
+    disk with ``sync()``. After the CE has answered, the data that it returned for each mutation, like the
+    identifier of a new node, or its errors, is written. Outcomes are written to disk in batches, every
+    ``sync_every`` records or ``sync_interval`` seconds, and when the journal is closed.
+
+    Entries are identified by the position of the mutation in the input of the import, so use one journal
+    directory for each import, and generate the mutations in the same order when it is run again. Then
+    mutations that succeeded are not sent again, and the others, which failed or were pending when the import
+    stopped, are sent again. The CE may or may not have run the pending ones, so check for duplicate nodes if
+    they create nodes. ``pending()`` returns the mutations that haven't succeeded, to send them without
+    generating the import again.
+
+    The journal is written to gzip-compressed segments, and a new segment is started when one is larger than
+    ``segment_bytes`` and each time that the journal is opened. It can be shared by threads.
+
+    Arguments:
+        directory: the directory of the segments, which is created if it doesn't exist
+        segment_bytes: the compressed size after which a new segment is started
+        sync_every: the number of records to write to disk at a time
+        sync_interval: the longest number of seconds that records wait before they are written to disk
+        compresslevel: the gzip compression level, from 1 (fastest) to 9 (smallest)
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, sync_every: int = 1000,
+                 sync_interval: float = 1.0, compresslevel: int = 6):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._synced = time.monotonic()
+        self._fp = None
+        # position -> mutation, for the mutations that haven't succeeded
+        self._pending = {}
+        # position -> the last outcome record
+        self._outcomes = {}
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        for path in segments:
+            for record in _read_segment(path):
+                self._apply(record)
+        if self._pending:
+            trompace.logger.info(f"Journal {directory} has {len(self._outcomes)} finished and "
+                                 f"{len(self._pending)} unfinished or failed mutations")
+        self._segment = int(_SEGMENT_RE.match(os.path.basename(segments[-1])).group(1)) if segments else 0
+
+    def segments(self) -> List[str]:
+        """The paths of the segments of the journal, oldest first"""
+        names = [name for name in os.listdir(self.directory) if _SEGMENT_RE.match(name)]
+        names.sort(key=lambda name: int(_SEGMENT_RE.match(name).group(1)))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _apply(self, record: dict):
+        position = record["position"]
+        if record["op"] == "begin":
+            self._pending[position] = record["mutation"]
+        else:
+            self._outcomes[position] = record
+            if record["errors"] is None:
+                self._pending.pop(position, None)
+
+    def completed(self, position: int, mutation: str) -> Optional[dict]:
+        """The outcome of the mutation at position if it succeeded, or None if it hasn't been sent, it failed or
+        it is pending. The outcome is a dict with the ``data`` that the CE returned for the mutation and the
+        number of ``attempts`` to run it. If a different mutation was sent at this position, which happens if
+        the import doesn't generate its mutations in the same order, the outcome is ignored"""
+        with self._lock:
+            record = self._outcomes.get(position)
+        if record is None or record["errors"] is not None:
+            return None
+        if record["hash"] != _hash(mutation):
+            trompace.logger.warning(f"The mutation at position {position} is not the one in the journal, "
+                                    f"sending it again")
+            return None
+        return record
+
+    def pending(self) -> Dict[int, str]:
+        """The mutations that were written to the journal and haven't succeeded, because they failed or were
+        pending when the import stopped, by position. Send them again with
+        ``trompace.batch.submit_mutations(journal.pending(), journal=journal)``"""
+        with self._lock:
+            return dict(sorted(self._pending.items()))
+
+    def counts(self) -> Dict[str, int]:
+        """The number of mutations that succeeded, failed and are pending"""
+        with self._lock:
+            failed = sum(1 for record in self._outcomes.values() if record["errors"] is not None)
+            return {"succeeded": len(self._outcomes) - failed, "failed": failed,
+                    "pending": len(self._pending) - failed}
+
+    def begin(self, mutations: Iterable[Tuple[int, str]]):
+        """Write that mutations, pairs of a position and a mutation, are about to be sent, and sync the journal
+        to disk"""
+        with self._lock:
+            for position, mutation in mutations:
+                record = {"op": "begin", "position": position, "mutation": mutation}
+                self._apply(record)
+                self._buffer.append(record)
+            self._sync()
+
+    def finish(self, position: int, mutation: str, data=None, errors: List[dict] = None, attempts: int = 1):
+        """Write the outcome of the mutation at position: the data that the CE returned for it, or its errors if
+        it failed"""
+        record = {"op": "finish", "position": position, "hash": _hash(mutation), "data": data, "errors": errors,
+                  "attempts": attempts, "time": time.time()}
+        with self._lock:
+            self._apply(record)
+            self._buffer.append(record)
+            if len(self._buffer) >= self.sync_every or time.monotonic() - self._synced >= self.sync_interval:
+                self._sync()
+
+    def sync(self):
+        """Write the records that are waiting to disk"""
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        self._synced = time.monotonic()
+        if not self._buffer:
+            return
+        data = b"".join(jsoncodec.dumps(record) + b"\n" for record in self._buffer)
+        # A separate gzip member for each sync, so that the segment can be read up to the last complete sync
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+        data = compressor.compress(data) + compressor.flush()
+        if self._fp is None or self._fp.tell() >= self.segment_bytes:
+            self._rotate()
+        self._fp.write(data)
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._buffer = []
+
+    def _rotate(self):
+        if self._fp is not None:
+            self._fp.close()
+        self._segment += 1
+        self._fp = open(os.path.join(self.directory, f"segment-{self._segment:06d}.jsonl.gz"), "ab")
+        _fsync_directory(self.directory)
+
+    def close(self):
+        """Write the records that are waiting to disk and close the journal"""
+        with self._lock:
+            self._sync()
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,80 @@
+# Encoding and decoding of JSON with the fastest library that is installed: orjson, then ujson, then the json
+# module of the standard library. Set the TROMPACE_JSON environment variable to orjson, ujson or json to choose one.
+# The library is chosen and imported the first time that JSON is encoded or decoded, so that importing trompace
+# stays fast.
+import json
+import os
+
+ORJSON = "orjson"
+UJSON = "ujson"
+STDLIB = "json"
+CODECS = (ORJSON, UJSON, STDLIB)
+
+# The name of the library in use, or None before the first use
+name = None
+
+
+def _stdlib_dumps(obj) -> bytes:
+    # The same compact UTF-8 output as orjson
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _use_default_codec():
+    use_codec(os.getenv("TROMPACE_JSON") or None)
+
+
+# The functions of the library in use, set by use_codec. Until then, they choose the library and call its function
+def dumps(obj) -> bytes:
+    _use_default_codec()
+    return dumps(obj)
+
+
+def loads(data):
+    _use_default_codec()
+    return loads(data)
+
+
+def dumps_str(obj) -> str:
+    """Encode obj as a JSON string, for text protocols like websocket messages"""
+    return dumps(obj).decode()
+
+
+def available_codecs():
+    """The names of the JSON libraries that can be used, fastest first"""
+    codecs = []
+    for codec in CODECS[:-1]:
+        try:
+            __import__(codec)
+        except ImportError:
+            continue
+        codecs.append(codec)
+    return codecs + [STDLIB]
+
+
+def use_codec(codec: str = None):
+    """Choose the library that encodes and decodes JSON.
+    Arguments:
+        codec: ORJSON, UJSON or STDLIB. If not set, use the fastest library that is installed
+    Raises:
+        ValueError if codec is unknown
+        ImportError if the library isn't installed
+    """
+    global name, dumps, loads
+    if codec is None:
+        codec = available_codecs()[0]
+    if codec == ORJSON:
+        import orjson
+
+        dumps, loads = orjson.dumps, orjson.loads
+    elif codec == UJSON:
+        import ujson
+
+        def dumps(obj) -> bytes:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode()
+
+        loads = ujson.loads
+    elif codec == STDLIB:
+        dumps, loads = _stdlib_dumps, json.loads
+    else:
+        raise ValueError(f"Unknown JSON codec '{codec}', use one of {', '.join(CODECS)}")
+    name = codec
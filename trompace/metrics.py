@@ -0,0 +1,143 @@
+# Collect metrics about the requests sent to the CE, grouped by operation.
+import bisect
+import threading
+from typing import Dict, List
+
+from trompace.connection import RequestContext, RequestHook, add_hook, remove_hook
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class OperationMetrics:
+    """The metrics of one operation"""
+
+    def __init__(self, buckets: List[float]):
+        self.requests = 0
+        self.errors = 0
+        self.graphql_errors = 0
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_sum = 0.0
+        # The number of requests in each bucket, the last one is for requests slower than all buckets
+        self.latency_buckets = [0] * (len(buckets) + 1)
+
+    def as_dict(self, buckets: List[float]):
+        cumulative = []
+        total = 0
+        for bound, count in zip(buckets + [float("inf")], self.latency_buckets):
+            total += count
+            cumulative.append((bound, total))
+        return {"requests": self.requests, "errors": self.errors, "graphql_errors": self.graphql_errors,
+                "retries": self.retries, "request_bytes": self.request_bytes,
+                "response_bytes": self.response_bytes, "latency_sum": self.latency_sum,
+                "latency_buckets": cumulative}
+
+
+class MetricsCollector(RequestHook):
+    """A RequestHook that records, for each operation name, the number of requests, failed requests,
+    GraphQL errors and retries, the bytes sent and received, and a histogram of the latency.
+
+    Use ``snapshot`` to send the metrics to any monitoring system, or ``to_prometheus`` to get them in the
+    Prometheus text format, which also has the batch sizes of the BatchSizers added with ``add_batch_sizer``.
+    For example, to find the operations that take the most time::
+
+        collector = MetricsCollector()
+        collector.install()
+        ...  # send requests
+        for operation, metrics in collector.snapshot().items():
+            print(operation, metrics["requests"], metrics["latency_sum"])
+    """
+
+    def __init__(self, buckets: List[float] = None):
+        self.buckets = sorted(buckets or DEFAULT_BUCKETS)
+        self._operations = {}
+        self._batch_sizers = []
+        self._lock = threading.Lock()
+
+    def install(self):
+        """Start collecting metrics of all requests"""
+        add_hook(self)
+        return self
+
+    def uninstall(self):
+        remove_hook(self)
+
+    def add_batch_sizer(self, sizer):
+        """Report the batch size that a trompace.batch.BatchSizer chooses for each operation"""
+        self._batch_sizers.append(sizer)
+
+    def batch_sizes(self) -> Dict[str, int]:
+        """The current batch size of each operation of the batch sizers"""
+        sizes = {}
+        for sizer in self._batch_sizers:
+            sizes.update(sizer.sizes())
+        return sizes
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+
+    def _record(self, context: RequestContext, failed: bool):
+        with self._lock:
+            metrics = self._operations.get(context.operation)
+            if metrics is None:
+                metrics = self._operations[context.operation] = OperationMetrics(self.buckets)
+            metrics.requests += 1
+            if failed:
+                metrics.errors += 1
+            metrics.graphql_errors += context.error_count
+            if context.attempt > 1:
+                metrics.retries += 1
+            metrics.request_bytes += context.request_bytes
+            metrics.response_bytes += context.response_bytes
+            if context.duration is not None:
+                metrics.latency_sum += context.duration
+                metrics.latency_buckets[bisect.bisect_left(self.buckets, context.duration)] += 1
+
+    def after_response(self, context: RequestContext):
+        self._record(context, failed=False)
+
+    def on_error(self, context: RequestContext, exception: Exception):
+        self._record(context, failed=True)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """The metrics of each operation. The latency buckets are cumulative (upper bound, count) pairs"""
+        with self._lock:
+            return {name: metrics.as_dict(self.buckets) for name, metrics in sorted(self._operations.items())}
+
+    def to_prometheus(self, prefix: str = "trompace_client") -> str:
+        """The metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        counters = [("requests", "requests_total", "Requests sent to the CE"),
+                    ("errors", "request_errors_total", "Requests that failed"),
+                    ("graphql_errors", "graphql_errors_total", "GraphQL errors in responses"),
+                    ("retries", "request_retries_total", "Requests that were retries of a failed request"),
+                    ("request_bytes", "request_bytes_total", "Bytes sent to the CE"),
+                    ("response_bytes", "response_bytes_total", "Bytes received from the CE")]
+        lines = []
+        for key, name, description in counters:
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for operation, metrics in snapshot.items():
+                lines.append(f'{prefix}_{name}{{operation="{operation}"}} {metrics[key]}')
+
+        name = f"{prefix}_request_duration_seconds"
+        lines.append(f"# HELP {name} Time from sending a request to parsing its response")
+        lines.append(f"# TYPE {name} histogram")
+        for operation, metrics in snapshot.items():
+            for bound, count in metrics["latency_buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{operation="{operation}",le="{le}"}} {count}')
+            lines.append(f'{name}_sum{{operation="{operation}"}} {metrics["latency_sum"]}')
+            lines.append(f'{name}_count{{operation="{operation}"}} {metrics["requests"]}')
+
+        batch_sizes = self.batch_sizes()
+        if batch_sizes:
+            name = f"{prefix}_batch_size"
+            lines.append(f"# HELP {name} Number of mutations sent in one batch")
+            lines.append(f"# TYPE {name} gauge")
+            for operation, size in batch_sizes.items():
+                lines.append(f'{name}{{operation="{operation}"}} {size}')
+        return "\n".join(lines) + "\n"
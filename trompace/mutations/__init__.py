@@ -1,3 +1,16 @@
-MUTATION = '''mutation {{
+from trompace import operation_name_for
+
+MUTATION = '''mutation {name} {{
   {mutation}
 }}'''
+
+
+def mutation_document(mutation: str, name: str = None):
+    """Wrap mutation fields in a named mutation operation.
+    Arguments:
+        mutation: the fields of the mutation
+        name: the operation name. If not set, the mutation is named after its fields, like CreatePerson
+    Returns:
+        A formatted mutation
+    """
+    return MUTATION.format(name=name or operation_name_for(mutation), mutation=mutation)
@@ -1,9 +1,13 @@
 # Generate GraphQL queries for mutations pertaining to control actions.
+# While a worker runs a job, the endTime of its ControlAction is the time that the worker's lease on the job
+# expires, see mutation_claim_controlaction, because the CE has no field for a lease. When the job completes or
+# fails, endTime is set to the time that it ended, so finished jobs don't report a lease deadline.
 
 from trompace import StringConstant
 from trompace.mutations.templates import mutation_create, mutation_link, format_link_mutation, format_mutation
 from trompace.constants import ActionStatusType
 import trompace.exceptions
+import datetime
 from typing import List
 
 CREATE_CONTROLACTION = '''CreateControlAction(
@@ -71,12 +75,14 @@ def mutation_add_entrypoint_controlaction(entrypoint_id: str, controlaction_id:
     return mutation_link(entrypoint_id, controlaction_id, ADD_ENTRYPOINT_CONTROLACTION)
 
 
-def mutation_modify_controlaction(controlaction_id: str, actionstatus: ActionStatusType, error: str = None):
+def mutation_modify_controlaction(controlaction_id: str, actionstatus: ActionStatusType, error: str = None,
+                                  end_time: datetime.datetime = None):
     """Returns a mutation for modifying the status and errors of the ControlAction
     Arguments:
         controlaction_id: The unique identifier of the ControlAction.
         actionstatus: the status to update to.
         error: An error to set if the actionstatus is FailedActionStatus
+        end_time: The time that the job ended, if the actionstatus is CompletedActionStatus or FailedActionStatus
     Returns:
         The string for the mutation for modifying a ControlAction.
     """
@@ -90,6 +96,8 @@ def mutation_modify_controlaction(controlaction_id: str, actionstatus: ActionSta
     }
     if error:
         args["error"] = error
+    if end_time:
+        args["endTime"] = end_time
 
     return mutation_create(args, UPDATE_CONTROLACTION)
 
@@ -148,11 +156,13 @@ def mutation_request_controlaction(controlaction_id: str, entrypoint_id: str, pr
     return format_mutation("RequestControlAction", args)
 
 
-def mutation_update_controlaction_status(controlaction_id: str, action_status: ActionStatusType):
+def mutation_update_controlaction_status(controlaction_id: str, action_status: ActionStatusType,
+                                         end_time: datetime.datetime = None):
     """Returns a mutation for updating the status of a control action to an object
     Arguments:
         controlaction_id: The unique identifier of the control action.
         action_status: the action status enum object.
+        end_time: The time that the job ended, if action_status is CompletedActionStatus or FailedActionStatus.
     Returns:
         The string for the mutation for adding a control action to an object.
         """
@@ -160,6 +170,8 @@ def mutation_update_controlaction_status(controlaction_id: str, action_status: A
        "identifier": controlaction_id,
        "actionStatus": StringConstant(str(action_status))
     }
+    if end_time:
+        args["endTime"] = end_time
     return format_mutation("UpdateControlAction", args)
 
 
@@ -173,3 +185,41 @@ def mutation_add_actioninterface_result(controlaction_id: str, thing_interface_i
         """
 
     return format_link_mutation("AddActionInterfaceResult", controlaction_id, thing_interface_id)
+
+
+def mutation_claim_controlaction(controlaction_id: str, start_time: datetime.datetime,
+                                 lease_expires: datetime.datetime):
+    """Returns a mutation for a worker to claim a control action job.
+    The job is set to ActiveActionStatus. ``start_time`` identifies the claim: a worker knows that its claim
+    succeeded if the startTime of the job is still the value that it set. ``lease_expires`` is the time
+    after which other workers may claim the job if the worker hasn't renewed its lease. It is stored in
+    endTime until the job ends.
+    Arguments:
+        controlaction_id: The unique identifier of the control action.
+        start_time: The time that the worker claimed the job.
+        lease_expires: The time that the claim expires.
+    Returns:
+        The string for the mutation for claiming a control action.
+    """
+    args = {
+        "identifier": controlaction_id,
+        "actionStatus": StringConstant(ActionStatusType.ActiveActionStatus),
+        "startTime": start_time,
+        "endTime": lease_expires
+    }
+    return format_mutation("UpdateControlAction", args)
+
+
+def mutation_renew_controlaction_lease(controlaction_id: str, lease_expires: datetime.datetime):
+    """Returns a mutation for a worker to extend its claim on a control action job.
+    Arguments:
+        controlaction_id: The unique identifier of the control action.
+        lease_expires: The new time that the claim expires.
+    Returns:
+        The string for the mutation for renewing the claim.
+    """
+    args = {
+        "identifier": controlaction_id,
+        "endTime": lease_expires
+    }
+    return format_mutation("UpdateControlAction", args)
@@ -3,7 +3,7 @@ import datetime
 import pytz
 
 from trompace import check_required_args, filter_none_args
-from trompace.mutations import MUTATION
+from trompace.mutations import mutation_document
 from trompace.mutations.templates import format_mutation
 
 ADD_DEF_TERM_DEF_TERMSET = '''AddDefinedTermSetHasDefinedTerm (
@@ -143,7 +143,7 @@ def defined_term_add_to_defined_term_set(*, defined_term_set: str, defined_term:
     params = {"defined_term_set_id": defined_term_set,
               "defined_term_id": defined_term}
     add_dts_dt = ADD_DEF_TERM_DEF_TERMSET.format(**params)
-    return MUTATION.format(mutation=add_dts_dt)
+    return mutation_document(add_dts_dt)
 
 
 # TODO: Remove a term from termset - just delete it?
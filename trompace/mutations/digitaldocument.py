@@ -18,11 +18,13 @@ DIGITALDOCUMENT_ARGS_DOCS = """title: The title of the resource indicated by `so
 
 @docstring_interpolate("digitaldocument_args", DIGITALDOCUMENT_ARGS_DOCS)
 def mutation_create_digitaldocument(*, title: str, contributor: str, creator: str, source: str, format_: str,
-                                    subject: str = None, language: str = None, description: str = None):
+                                    subject: str = None, language: str = None, description: str = None,
+                                    identifier: str = None):
     """Returns a mutation for creating a digital document object.
 
     Arguments:
         {digitaldocument_args}
+        identifier (optional): The identifier to give the digital document, instead of letting the CE create one.
 
     Returns:
         The string for the mutation for creating the digital document.
@@ -46,6 +48,7 @@ def mutation_create_digitaldocument(*, title: str, contributor: str, creator: st
         "format": format_,
         "subject": subject,
         "description": description,
+        "identifier": identifier,
     }
     if language is not None:
         args["language"] = StringConstant(language.lower())
@@ -27,11 +27,12 @@ def mutation_create_media_object(*, title: str, contributor: str, creator: str,
                                  name: str = None, description: str = None, date: str = None,
                                  encodingformat: str = None, embedurl: str = None, url: str = None,
                                  contenturl: str = None, language: str = None, inlanguage: str = None,
-                                 license: str = None):
+                                 license: str = None, identifier: str = None):
     """Returns a mutation for creating a media object object.
 
     Arguments:
         {mediaobject_args}
+        identifier: The identifier to give the media object, instead of letting the CE create one.
 
     Returns:
         The string for the mutation for creating the media object.
@@ -63,6 +64,7 @@ def mutation_create_media_object(*, title: str, contributor: str, creator: str,
         "license": license,
         "contentUrl": contenturl,
         "inLanguage": inlanguage,
+        "identifier": identifier,
     }
 
     if date is not None:
@@ -1,9 +1,10 @@
 # Templates for generating GraphQL queries for mutations.
 
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 from trompace import make_parameters
-from trompace.mutations import MUTATION
+from trompace import batch_operation_name
+from trompace.mutations import mutation_document
 
 MUTATION_TEMPLATE = '''{mutationname}(
 {parameters}
@@ -34,7 +35,7 @@ def format_mutation(mutationname: str, args: Dict[str, Any]):
     """
 
     formatted_mutation = MUTATION_TEMPLATE.format(mutationname=mutationname, parameters=make_parameters(**args))
-    return MUTATION.format(mutation=formatted_mutation)
+    return mutation_document(formatted_mutation, mutationname)
 
 
 def format_link_mutation(mutationname: str, identifier_1: str, identifier_2: str):
@@ -46,8 +47,8 @@ def format_link_mutation(mutationname: str, identifier_1: str, identifier_2: str
     Returns:
         A formatted mutation
     """
-    return MUTATION.format(mutation=LINK_MUTATION_TEMPLATE.format(mutationname=mutationname, identifier_1=identifier_1,
-                                                                  identifier_2=identifier_2))
+    return mutation_document(LINK_MUTATION_TEMPLATE.format(mutationname=mutationname, identifier_1=identifier_1,
+                                                           identifier_2=identifier_2), mutationname)
 
 
 def mutation_create(args, mutation_string: str):
@@ -61,7 +62,7 @@ def mutation_create(args, mutation_string: str):
     """
 
     create_mutation = mutation_string.format(parameters=make_parameters(**args))
-    return MUTATION.format(mutation=create_mutation)
+    return mutation_document(create_mutation)
 
 
 def mutation_update(args, mutation_string: str):
@@ -75,7 +76,7 @@ def mutation_update(args, mutation_string: str):
     """
 
     create_mutation = mutation_string.format(parameters=make_parameters(**args))
-    return MUTATION.format(mutation=create_mutation)
+    return mutation_document(create_mutation)
 
 
 def mutation_delete(identifier: str, mutation_string: str):
@@ -91,7 +92,7 @@ def mutation_delete(identifier: str, mutation_string: str):
     args = {"identifier": identifier}
 
     delete_mutation = mutation_string.format(parameters=make_parameters(**args))
-    return MUTATION.format(mutation=delete_mutation)
+    return mutation_document(delete_mutation)
 
 
 def mutation_link(identifier_1: str, identifier_2: str, mutation_string: str):
@@ -104,4 +105,34 @@ def mutation_link(identifier_1: str, identifier_2: str, mutation_string: str):
     """
 
     broad_match_mutation = mutation_string.format(identifier_1=identifier_1, identifier_2=identifier_2)
-    return MUTATION.format(mutation=broad_match_mutation)
+    return mutation_document(broad_match_mutation)
+
+
+def format_batch_mutation(mutations: List[str], aliases: List[str] = None, name: str = None):
+    """Combine mutations into a single mutation to send to the Contributor Environment in one request.
+    Each mutation is given an alias, and its result is found in the response under this alias.
+    The CE runs the mutations in the order that they are given.
+    Arguments:
+        mutations: mutations created by the other mutation functions
+        aliases: a name for each mutation. If not set, the mutations are named m0, m1, ...
+        name: the operation name. If not set, the operation is named after the mutations in it followed by _bulk,
+           like CreateMediaObject_bulk
+    Returns:
+        A formatted mutation
+    """
+    if aliases is None:
+        aliases = ["m{}".format(i) for i in range(len(mutations))]
+    if len(aliases) != len(mutations):
+        raise ValueError("there must be one alias for each mutation")
+
+    parts = []
+    # The distinct texts before the outer {} block, which have the operation names
+    headers = {}
+    for alias, mutation in zip(aliases, mutations):
+        # Take the contents of the outer mutation {} block
+        brace = mutation.index("{")
+        headers[mutation[:brace]] = None
+        parts.append(alias + ": " + mutation[brace + 1:mutation.rindex("}")].strip())
+    if name is None:
+        name = batch_operation_name(mutations, headers)
+    return mutation_document("\n  ".join(parts), name)
@@ -1,3 +1,16 @@
-QUERY = '''query {{
+from trompace import operation_name_for
+
+QUERY = '''query {name} {{
   {query}
 }}'''
+
+
+def query_document(query: str, name: str = None):
+    """Wrap query fields in a named query operation.
+    Arguments:
+        query: the fields of the query
+        name: the operation name. If not set, the query is named after its fields, like Person
+    Returns:
+        A formatted query
+    """
+    return QUERY.format(name=name or operation_name_for(query), query=query)
@@ -4,7 +4,7 @@ from trompace import StringConstant, _Neo4jDate, filter_none_args, docstring_int
 from trompace.constants import SUPPORTED_LANGUAGES
 
 QUERY_CONTROLACTION_ID = """
-    query {{
+    query ControlAction {{
         ControlAction(identifier: "{identifier}") {{
             actionStatus
             identifier
@@ -36,3 +36,14 @@ def query_controlaction(identifier: str):
     """
     query_ca = QUERY_CONTROLACTION_ID.format(identifier=identifier)
     return query_ca
+
+
+def query_controlaction_lease(identifier: str):
+    """Returns a query for the status of a control action job and the claim that a worker has on it.
+    Arguments:
+        identifier: The identifier of the control action in the CE.
+    Returns:
+        The string for the query.
+    """
+    return_items = ["identifier", "actionStatus", "startTime {\n  formatted\n}", "endTime {\n  formatted\n}"]
+    return format_query("ControlAction", {"identifier": identifier}, return_items)
@@ -1,11 +1,10 @@
 # Templates for generating GraphQL queries.
 
 # To be added EntryPoint, ControlAction, PropertyValueSpecification and Property
-from .. import make_parameters, QUERY
-from typing import Dict, Any
+from typing import Dict, Any, List
 
-from trompace.queries import QUERY
-from trompace import make_parameters
+from trompace.queries import query_document
+from trompace import batch_operation_name, make_parameters
 
 QUERY_TEMPLATE = '''{queryname}{parameters}
 {{
@@ -28,4 +27,33 @@ def format_query(queryname: str, args: Dict[str, Any], return_items_list: list):
         parameters = "({})".format(make_parameters(**args))
     formatted_query = QUERY_TEMPLATE.format(queryname=queryname, parameters=parameters,\
     return_items="\n".join(return_items_list))
-    return QUERY.format(query=formatted_query)
+    return query_document(formatted_query, queryname)
+
+
+def format_batch_query(queries: List[str], aliases: List[str] = None, name: str = None):
+    """Combine queries into a single query to send to the Contributor Environment in one request.
+    Each query is given an alias, and its result is found in the response under this alias.
+    Arguments:
+        queries: queries created by the other query functions
+        aliases: a name for each query. If not set, the queries are named q0, q1, ...
+        name: the operation name. If not set, the operation is named after the queries in it followed by _bulk,
+           like ControlAction_bulk
+    Returns:
+        A formatted query
+    """
+    if aliases is None:
+        aliases = ["q{}".format(i) for i in range(len(queries))]
+    if len(aliases) != len(queries):
+        raise ValueError("there must be one alias for each query")
+
+    parts = []
+    # The distinct texts before the outer {} block, which have the operation names
+    headers = {}
+    for alias, query in zip(aliases, queries):
+        # Take the contents of the outer query {} block
+        brace = query.index("{")
+        headers[query[:brace]] = None
+        parts.append(alias + ": " + query[brace + 1:query.rindex("}")].strip())
+    if name is None:
+        name = batch_operation_name(queries, headers)
+    return query_document("\n  ".join(parts), name)
@@ -0,0 +1,42 @@
+# Limit the rate of requests to the CE.
+import threading
+import time
+
+
+class RateLimiter:
+    """A token bucket that lets through ``rate`` requests per second on average, and bursts of up to ``burst``
+    requests. It can be shared by threads and event loops: each request takes the next free slot, so requests
+    that wait are spaced out evenly instead of all being sent when a slot frees up."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, not {rate}")
+        self.rate = rate
+        self.burst = burst
+        # Negative if requests are waiting for a slot
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a slot, and return the number of seconds to wait before it can be used"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        """Wait until a request can be sent"""
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Wait until a request can be sent, without blocking the event loop"""
+        import asyncio
+
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
@@ -1,6 +1,6 @@
 # Templates for generate GraphQL queries for mutations.
 
-from . import make_parameters, SUBSCRIPTION
+from . import make_parameters, operation_name_for, SUBSCRIPTION
 
 
 # To be added EntryPoint, ControlAction, PropertyValueSpecification and Property
@@ -17,4 +17,4 @@ def subscription_create(args, subscription_string: str):
     """
 
     create_subscription = subscription_string.format(parameters=make_parameters(**args))
-    return SUBSCRIPTION.format(subscription=create_subscription)
+    return SUBSCRIPTION.format(name=operation_name_for(create_subscription), subscription=create_subscription)
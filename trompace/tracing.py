@@ -0,0 +1,95 @@
+# Optional OpenTelemetry tracing of requests to the CE and of the phases of control action jobs.
+# Tracing is disabled until enable_tracing is called, and then needs the opentelemetry-api package.
+import contextlib
+
+import trompace
+from trompace.connection import RequestContext, RequestHook, add_hook, remove_hook
+
+_tracer = None
+_hook = None
+_NO_SPAN = contextlib.nullcontext()
+
+
+def span(name: str, **attributes):
+    """A context manager that traces the code in it as a span with the given name and attributes.
+    If tracing isn't enabled this does nothing, so it is cheap to leave in the code::
+
+        with span("download", job=identifier):
+            ...
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+class TracingHook(RequestHook):
+    """A RequestHook that traces each request to the CE as a client span named after its operation, and sends the
+    trace context in the request headers so that the spans of the CE can be linked to it"""
+
+    def __init__(self, tracer):
+        from opentelemetry import propagate, trace
+
+        self.tracer = tracer
+        self._inject = propagate.inject
+        self._set_span_in_context = trace.set_span_in_context
+        self._status = trace.Status
+        self._error = trace.StatusCode.ERROR
+        self._kind = trace.SpanKind.CLIENT
+
+    def before_request(self, context: RequestContext):
+        request_span = self.tracer.start_span(f"CE {context.operation}", kind=self._kind,
+                                              attributes={"graphql.operation.name": context.operation,
+                                                          "trompace.attempt": context.attempt})
+        context.extra["span"] = request_span
+        self._inject(context.headers, context=self._set_span_in_context(request_span))
+
+    def _end(self, context: RequestContext):
+        request_span = context.extra.pop("span", None)
+        if request_span is not None:
+            request_span.set_attribute("http.status_code", context.status or 0)
+            request_span.set_attribute("http.request_content_length", context.request_bytes)
+            request_span.set_attribute("http.response_content_length", context.response_bytes)
+        return request_span
+
+    def after_response(self, context: RequestContext):
+        request_span = self._end(context)
+        if request_span is not None:
+            request_span.end()
+
+    def on_error(self, context: RequestContext, exception: Exception):
+        request_span = self._end(context)
+        if request_span is not None:
+            request_span.set_attribute("graphql.error_count", context.error_count)
+            request_span.record_exception(exception)
+            request_span.set_status(self._status(self._error, str(exception)))
+            request_span.end()
+
+
+def enable_tracing(tracer=None):
+    """Trace requests to the CE and the phases of control action jobs.
+    Arguments:
+        tracer: The OpenTelemetry tracer to create spans with. If not set, the tracer of the global
+           tracer provider is used, so configure the provider and its exporter before calling this.
+    Raises:
+        ImportError if the opentelemetry-api package isn't installed.
+    """
+    global _tracer, _hook
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        raise ImportError("Tracing needs the opentelemetry-api package, install it with "
+                          "pip install trompace-client[tracing]")
+    disable_tracing()
+    _tracer = tracer or trace.get_tracer("trompace")
+    _hook = TracingHook(_tracer)
+    add_hook(_hook)
+    trompace.logger.debug("Tracing enabled")
+
+
+def disable_tracing():
+    """Stop tracing. Spans that have already started are still ended"""
+    global _tracer, _hook
+    if _hook is not None:
+        remove_hook(_hook)
+    _tracer = None
+    _hook = None